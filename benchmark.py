@@ -0,0 +1,261 @@
+# coding=utf-8
+#
+# Benchmarks for the conversion code, run from the command line, e.g.,
+#
+#	python benchmark.py engine --rows 100000
+#	python benchmark.py decode
+#	python benchmark.py throughput --rows 1000000 --brokers IB GF
+#	python benchmark.py grouping --rows 100000
+#
+
+from IB.utility import writeTradeFiles, toOpenCloseGroup, toRecordGroups
+from IB.ib import createTradeRecords
+from IB.generator import generateFile, writeIBTradeFile
+from IB import decode, ib, henghua, guangfa
+from IB.cache import setEnabled as setCacheEnabled
+from os.path import join
+from tempfile import TemporaryDirectory
+import random, time, datetime, filecmp, os
+
+
+
+def benchmarkEngine(rows):
+	"""
+	[Int] rows => [String] report
+
+	Convert a synthetic IB trade file of the given number of rows with the
+	python and numpy engines, check the output files are byte identical and
+	report the time taken by each engine.
+	"""
+	with TemporaryDirectory() as tempDir:
+		file = join(tempDir, 'flex.1.trade_steven.20181022.20181022.csv')
+		writeIBTradeFile(file, rows)
+
+		convert, total = {}, {}
+		for engine in ['python', 'numpy']:
+			outputDir = join(tempDir, engine)
+			os.mkdir(outputDir)
+			start = time.perf_counter()
+			records = list(createTradeRecords(file, engine))
+			convert[engine] = time.perf_counter() - start
+			outputFiles = writeTradeFiles(toOpenCloseGroup(records)
+							, outputDir, '40006-B', 'IB-QUANT'
+							, datetime.datetime(2018, 10, 22))
+			total[engine] = time.perf_counter() - start
+
+		identical = all(filecmp.cmp(f, f.replace(join(tempDir, 'numpy')
+												, join(tempDir, 'python'))
+									, shallow=False)
+						for f in outputFiles)
+
+	return '{0} rows\n' \
+			'create trade records: python {1:.2f}s, numpy {2:.2f}s, speedup {3:.1f}x\n' \
+			'including file writing: python {4:.2f}s, numpy {5:.2f}s, speedup {6:.1f}x\n' \
+			'identical output: {7}'.format(rows
+			, convert['python'], convert['numpy'], convert['python'] / convert['numpy']
+			, total['python'], total['numpy'], total['python'] / total['numpy']
+			, identical)
+
+
+
+def benchmarkDecode(rows):
+	"""
+	[Int] rows => [String] report
+
+	Time the field decoding functions in decode.py against the per row parsing
+	they replaced, on rows values with a handful of distinct dates, as in a
+	day's broker file.
+	"""
+	random.seed(0)
+	def timeString(h, m, s, sep):
+		return sep.join(['{0:02d}'.format(x) for x in (h, m, s)])
+
+	days = [datetime.date(2018, 10, d) for d in (22, 23)]
+	times = [(random.randrange(24), random.randrange(60), random.randrange(60))
+				for i in range(rows)]
+	ibDates = [days[i % 2].strftime('%Y%m%d') for i in range(rows)]
+	ibDateTimes = [d + ';' + timeString(*t, '') for (d, t) in zip(ibDates, times)]
+	gfDates = [days[i % 2].strftime('%Y-%m-%d') for i in range(rows)]
+	gfTimes = [timeString(*t, ':') for t in times]
+	gfNumbers = ['{0:,.2f}'.format(random.uniform(0, 100000)) for i in range(rows)]
+
+	cases = [
+		('IB date (yyyymmdd)', lambda: list(map(oldIBStringToDate, ibDates))
+							 , lambda: list(map(decode.toDate, ibDates))),
+		('IB date time', lambda: list(map(oldIBToDateTime, ibDateTimes))
+					   , lambda: list(map(decode.toDateTime, ibDateTimes))),
+		('GF date (yyyy-mm-dd)', lambda: list(map(oldGFStringToDate, gfDates))
+							   , lambda: list(map(decode.toDashedDate, gfDates))),
+		('GF date time', lambda: list(map(oldGFCreateDatetime, gfDates, gfTimes))
+					   , lambda: list(map(decode.toDashedDateTime, gfDates, gfTimes))),
+		('GF number (1,234.56)', lambda: list(map(oldGFToFloat, gfNumbers))
+							   , lambda: list(map(decode.toFloat, gfNumbers)))
+	]
+
+	def timeIt(func):
+		start = time.perf_counter()
+		result = func()
+		return time.perf_counter() - start, result
+
+	lines = ['{0} values'.format(rows)]
+	for (name, old, new) in cases:
+		oldTime, oldResult = timeIt(old)
+		newTime, newResult = timeIt(new)
+		lines.append('{0:22}: before {1:.3f}s, after {2:.3f}s, speedup {3:.1f}x, '
+					 'same result: {4}'.format(name, oldTime, newTime
+					 , oldTime / newTime, oldResult == newResult))
+
+	return '\n'.join(lines)
+
+
+
+def benchmarkGrouping(rows):
+	"""
+	[Int] rows => [String] report
+
+	Time the box position grouping, utility.toRecordGroups(), on synthetic
+	trades of 1/8, 1/4, 1/2 and all of the given rows, to show the time per
+	trade stays flat. The quadratic grouping it replaced is timed too, up to
+	25,000 trades, beyond that it takes too long.
+	"""
+	random.seed(0)
+	tickers = ['T{0} Index'.format(i) for i in range(500)]
+	sides = {t: random.choice(['Buy', 'Sell', 'Short', 'Cover']) for t in tickers}
+	def toRecord(i):
+		ticker = random.choice(tickers)
+		if random.random() < 0.001:	# a rare box position starts a new group
+			sides[ticker] = random.choice(['Buy', 'Sell', 'Short', 'Cover'])
+		return {'BloombergTicker': ticker, 'Side': sides[ticker]}
+
+	records = list(map(toRecord, range(rows)))
+
+	def timeIt(func, records):
+		start = time.perf_counter()
+		result = func(records)
+		return time.perf_counter() - start, result
+
+	lines = ['{0:>10}{1:>8}{2:>12}{3:>16}{4:>12}'.format('trades', 'groups'
+				, 'seconds', 'us per trade', 'before')]
+	for n in (rows // 8, rows // 4, rows // 2, rows):
+		seconds, groups = timeIt(toRecordGroups, records[:n])
+		if n <= 25000:
+			oldSeconds, oldGroups = timeIt(oldToRecordGroups, records[:n])
+			before = '{0:.3f}s'.format(oldSeconds) if oldGroups == groups else 'differs'
+		else:
+			before = '-'
+
+		lines.append('{0:>10}{1:>8}{2:>12.3f}{3:>16.2f}{4:>12}'.format(n, len(groups)
+					, seconds, seconds / max(n, 1) * 1000000, before))
+
+	return '\n'.join(lines)
+
+
+
+# The box position grouping before utility.toRecordGroups() was made linear,
+# kept here for comparison.
+def oldToRecordGroups(records):
+	recordGroups = []
+	remaining = records
+	while (remaining != []):
+		group, remaining = oldSplitTrades(remaining)
+		recordGroups.append(group)
+	return recordGroups
+
+def oldSplitTrades(records):
+	group = []
+	for i in range(len(records)):
+		if oldFormBoxPosition(records[i], group):
+			break
+		else:
+			group.append(records[i])
+
+	if oldFormBoxPosition(records[i], group):
+		return group, records[i:]
+	else:
+		return group, []
+
+def oldFormBoxPosition(record, group):
+	for r in group:
+		if record['BloombergTicker'] == r['BloombergTicker'] and record['Side'] != r['Side']:
+			return True
+	return False
+
+
+
+# The per row parsing functions before decode.py, kept here for comparison.
+def oldIBStringToDate(dateString):
+	return datetime.datetime(int(dateString[0:4]), int(dateString[4:6]), 
+								int(dateString[6:]))
+
+def oldIBToDateTime(dtString):
+	dateString, hourString = dtString.split(';')
+	return datetime.datetime(int(dateString[0:4]), int(dateString[4:6]), int(dateString[6:]),
+							int(hourString[0:2]), int(hourString[2:4]), int(hourString[4:]))
+
+def oldGFStringToDate(dateString):
+	return datetime.datetime.strptime(dateString, '%Y-%m-%d')
+
+def oldGFCreateDatetime(dt, tm):
+	return datetime.datetime.strptime(dt + ' ' + tm, '%Y-%m-%d %H:%M:%S')
+
+def oldGFToFloat(data):
+	return float(''.join(filter(lambda x: x != ',', data)))
+
+
+
+def benchmarkThroughput(rows, brokers, fileTypes):
+	"""
+	[Int] rows, [List] brokers, [List] fileTypes => [String] report
+
+	Generate a synthetic file of the given number of rows for each broker and
+	file type, convert it with the broker's processTradeFile() or
+	processCashPositionFile(), and report the wall time and rows per second.
+	Generating the file is not timed.
+	"""
+	processFunctions = {
+		'IB': (ib.processTradeFile, ib.processCashPositionFile),
+		'HGNH': (henghua.processTradeFile, henghua.processCashPositionFile),
+		'GF': (guangfa.processTradeFile, guangfa.processCashPositionFile)
+	}
+
+	lines = ['{0:8}{1:10}{2:>10}{3:>10}{4:>12}'.format('broker', 'type'
+				, 'rows', 'seconds', 'rows/sec')]
+	for broker in brokers:
+		for fileType in fileTypes:
+			with TemporaryDirectory() as tempDir:
+				file = generateFile(broker, fileType, tempDir, rows)
+				processTrade, processCashPosition = processFunctions[broker]
+				start = time.perf_counter()
+				if fileType == 'trade':
+					processTrade(file, tempDir)
+				else:
+					processCashPosition(file, tempDir)
+				seconds = time.perf_counter() - start
+
+			lines.append('{0:8}{1:10}{2:>10}{3:>10.2f}{4:>12,.0f}'.format(broker
+						, fileType, rows, seconds, rows / seconds))
+
+	return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+	import argparse
+	parser = argparse.ArgumentParser()
+	parser.add_argument('benchmark', choices=['engine', 'decode', 'throughput', 'grouping'])
+	parser.add_argument('--rows', type=int, default=100000)
+	parser.add_argument('--brokers', nargs='+', choices=['IB', 'HGNH', 'GF']
+						, default=['IB', 'HGNH', 'GF'])
+	parser.add_argument('--types', nargs='+', choices=['trade', 'cash', 'position']
+						, default=['trade', 'cash', 'position'])
+	args = parser.parse_args()
+
+	setCacheEnabled(False)	# measure parsing, not the cache
+
+	if args.benchmark == 'engine':
+		print(benchmarkEngine(args.rows))
+	elif args.benchmark == 'decode':
+		print(benchmarkDecode(args.rows))
+	elif args.benchmark == 'throughput':
+		print(benchmarkThroughput(args.rows, args.brokers, args.types))
+	elif args.benchmark == 'grouping':
+		print(benchmarkGrouping(args.rows))
@@ -0,0 +1,275 @@
+# coding=utf-8
+#
+# A local on-disk cache of the records parsed from broker files, so that an
+# input file that has not changed is not parsed again, e.g., when a file is
+# converted again in test mode.
+#
+# An entry is keyed by the function that parsed the file, the file's path,
+# size and last modified time, and a fingerprint of the py files, so that
+# changing the conversion code invalidates all entries. Entries are pickled
+# in chunks, so that records given lazily, e.g., from the external sort, are
+# cached and read back in bounded memory. When the cache grows beyond its
+# maximum size, the least recently used entries are removed.
+#
+
+from IB.utility import get_current_path, timed, timedStage, countRows, \
+						setFeatureEnabled, isFeatureEnabled
+from IB.configure import getCacheDirectory, getCacheMaxSize, getCacheEnabled
+from IB.sorting import readChunks, CHUNK_SIZE
+from functools import wraps, partial
+from itertools import islice
+from os.path import join, getsize, getmtime, abspath
+import os, glob, pickle, hashlib, logging
+logger = logging.getLogger(__name__)
+
+
+
+# turn the cache on or off for this process, see utility.setFeatureEnabled()
+setEnabled = partial(setFeatureEnabled, 'cache')
+isEnabled = partial(isFeatureEnabled, 'cache', getCacheEnabled)
+
+
+
+def cachedRecords(createRecords):
+	"""
+	[Function] createRecords => [Function] createRecords with cache
+
+	A decorator for functions like createTradeRecords(file, ...), which parse
+	the file into records. If the function returns a list, so do the records
+	from cache. If it returns a lazy iterable, e.g., the merge of an external
+	sort, the records are saved to cache as they are taken and given lazily
+	from cache, so the cache does not hold them all in memory either.
+
+	Files bigger than the cache itself are not cached.
+	"""
+	@wraps(createRecords)
+	def createRecordsWithCache(file, *args, **kwargs):
+		if not isEnabled() or getsize(file) > getCacheMaxSize():
+			return createRecords(file, *args, **kwargs)
+
+		with timedStage('cache'):
+			key = cacheKey(createRecords, file, args + tuple(sorted(kwargs.items())))
+			records = loadRecords(getCacheDirectory(), key)
+		if records == None:
+			records = createRecords(file, *args, **kwargs)
+			if isinstance(records, list):
+				with timedStage('cache'):
+					saveRecords(getCacheDirectory(), key, records, getCacheMaxSize())
+			else:
+				records = streamRecords(getCacheDirectory(), key, records
+										, getCacheMaxSize())
+		elif isinstance(records, list):
+			countRows('cache', len(records))
+		else:
+			records = timed('cache', records)
+
+		return records
+
+	return createRecordsWithCache
+
+
+
+def cacheKey(createRecords, file, args):
+	"""
+	[Function] createRecords, [String] file, [Tuple] args => [String] key
+	"""
+	file = abspath(file)
+	return hashlib.sha1(repr((codeFingerprint(), createRecords.__module__
+							, createRecords.__name__, file, getsize(file)
+							, os.stat(file).st_mtime_ns, args)).encode()
+						).hexdigest()
+
+
+
+fingerprint = None
+def codeFingerprint():
+	"""
+	=> [String] fingerprint of the py files, i.e., their names, sizes and
+		last modified times. Worked out once per process.
+	"""
+	global fingerprint
+	if fingerprint == None:
+		files = sorted(glob.glob(join(get_current_path(), '*.py')))
+		fingerprint = hashlib.sha1(repr([(f, getsize(f), getmtime(f))
+										for f in files]).encode()).hexdigest()
+	return fingerprint
+
+
+
+# An entry is a pickled header, then the records pickled in chunks as in
+# the runs of sorting.py. The header tells whether the records were a list.
+LIST, ITERABLE = 'list', 'iterable'
+
+
+
+def loadRecords(directory, key):
+	"""
+	[String] directory, [String] key => [List] or [Iterable] records, None
+		if not found
+
+	The records are a list if they were saved from a list, otherwise they
+	are read lazily. A hit marks the entry as recently used.
+	"""
+	file = join(directory, key + '.pickle')
+	try:
+		f = open(file, 'rb')
+	except FileNotFoundError:
+		return None
+
+	try:
+		header = pickle.load(f)
+		if header == LIST:
+			records = list(readChunks(f))
+			f.close()
+		else:
+			records = readEntry(f)
+
+		os.utime(file)
+		logger.debug('loadRecords(): hit {0}'.format(key))
+		return records
+
+	except:
+		f.close()
+		logger.exception('loadRecords(): {0}'.format(file))
+		return None
+
+
+
+def readEntry(f):
+	"""
+	[File] cache entry, after the header => [Iterable] records, the file is
+		closed when done.
+	"""
+	try:
+		yield from readChunks(f)
+	finally:
+		f.close()
+
+
+
+def saveRecords(directory, key, records, maxSize):
+	"""
+	[String] directory, [String] key, [List] records, [Int] maxSize
+		=> save the records to cache, then remove the least recently used
+		entries until the cache is within maxSize bytes.
+
+	The entry is written to a temp file then renamed, so other processes
+	never see a partly written entry.
+	"""
+	file = join(directory, key + '.pickle')
+	tempFile = file + '.{0}.tmp'.format(os.getpid())
+	try:
+		os.makedirs(directory, exist_ok=True)
+		with open(tempFile, 'wb') as f:
+			writeChunks(f, LIST, [records[i:i+CHUNK_SIZE]
+									for i in range(0, len(records), CHUNK_SIZE)])
+
+		os.replace(tempFile, file)
+		evict(directory, maxSize)
+
+	except:
+		logger.exception('saveRecords(): {0}'.format(file))
+
+
+
+def streamRecords(directory, key, records, maxSize):
+	"""
+	[String] directory, [String] key, [Iterable] records, [Int] maxSize
+		=> [Iterable] the same records
+
+	Save the records to cache as they are taken, a chunk at a time. The entry
+	is renamed in place only when all records are taken, an error in saving
+	is logged and the records are still given.
+	"""
+	file = join(directory, key + '.pickle')
+	tempFile = file + '.{0}.tmp'.format(os.getpid())
+	f, done = None, False
+	try:
+		with timedStage('cache'):
+			try:
+				os.makedirs(directory, exist_ok=True)
+				f = open(tempFile, 'wb')
+				writeChunks(f, ITERABLE, [])
+			except:
+				f = closeEntry(f, tempFile)
+				logger.exception('streamRecords(): {0}'.format(file))
+
+		records = iter(records)
+		chunk = list(islice(records, CHUNK_SIZE))
+		while chunk != []:
+			if f != None:
+				with timedStage('cache'):
+					try:
+						writeChunks(f, None, [chunk])
+					except:
+						f = closeEntry(f, tempFile)
+						logger.exception('streamRecords(): {0}'.format(file))
+
+			yield from chunk
+			chunk = list(islice(records, CHUNK_SIZE))
+
+		done = True
+
+	finally:
+		if f != None and done:
+			with timedStage('cache'):
+				try:
+					f.close()
+					os.replace(tempFile, file)
+					evict(directory, maxSize)
+				except:
+					closeEntry(f, tempFile)
+					logger.exception('streamRecords(): {0}'.format(file))
+		else:
+			closeEntry(f, tempFile)
+
+
+
+def writeChunks(f, header, chunks):
+	"""
+	[File] f, [String] header, [Iterable] chunks => write the header, unless
+		None, then the chunks to the file.
+	"""
+	if header != None:
+		pickle.dump(header, f, pickle.HIGHEST_PROTOCOL)
+	for chunk in chunks:
+		pickle.dump(chunk, f, pickle.HIGHEST_PROTOCOL)
+
+
+
+def closeEntry(f, tempFile):
+	"""
+	[File] f, [String] tempFile => None, close the file if open and remove
+		the partly written entry.
+	"""
+	if f != None:
+		f.close()
+	try:
+		os.remove(tempFile)
+	except OSError:
+		pass
+
+
+
+def evict(directory, maxSize):
+	"""
+	[String] directory, [Int] maxSize => remove the least recently used
+		entries until the total size is within maxSize bytes.
+	"""
+	def entryInfo(file):
+		stat = os.stat(file)
+		return (stat.st_mtime, stat.st_size, file)
+
+	entries = sorted(map(entryInfo, glob.glob(join(directory, '*.pickle'))))
+	totalSize = sum(map(lambda e: e[1], entries))
+	for (_, size, file) in entries:
+		if totalSize <= maxSize:
+			break
+
+		logger.debug('evict(): {0}'.format(file))
+		try:
+			os.remove(file)
+		except FileNotFoundError:	# removed by another process
+			pass
+
+		totalSize = totalSize - size
@@ -0,0 +1,199 @@
+# coding=utf-8
+#
+# A columnar engine for IB trade conversion. The projected columns of the flex
+# file are loaded into NumPy arrays, then parsing, side mapping, sorting and
+# price adjustment are done on whole columns instead of row by row.
+#
+# The trade records are the same as those from ib.createTradeRecords(), so
+# the output files written by utility.writeTradeFiles() are identical.
+#
+# Deprecated: both engines spend most of their time in csv.reader, and since
+# trade records are slotted the python engine is as fast or faster, see
+# "python benchmark.py engine". Kept for comparison, to be removed.
+#
+
+from IB.ib import TRADE_FIELDS, TRADE_ASSET_CLASSES, TICKER_FIELDS, \
+					MissingColumn, InvalidTradeSide, resolveTicker, \
+					stringToDate
+from IB.utility import timedStage, countRows, TradeRecord
+from IB.decode import toDateTime
+from operator import itemgetter
+import numpy as np
+import csv, logging
+logger = logging.getLogger(__name__)
+
+
+
+def createTradeRecords(file):
+	"""
+	[String] file => [List] trade records
+
+	Same as ib.createTradeRecords(), sorted by 'Date/Time', with ties kept
+	in the order of the file.
+	"""
+	with timedStage('read'):
+		columns = fileToColumns(file, TRADE_FIELDS, TRADE_ASSET_CLASSES)
+	if columns == None:
+		return []
+
+	n = len(columns['Date/Time'])
+	countRows('read', n)
+
+	# 'yyyymmdd;hhmmss' strings sort the same way as the date times they
+	# represent, a stable sort keeps ties in the order of the file.
+	with timedStage('sort'):
+		order = np.argsort(columns['Date/Time'].astype(str), kind='stable')
+		columns = {field: column[order] for (field, column) in columns.items()}
+	countRows('sort', n)
+
+	with timedStage('transform'):
+		tickers, factors = toTickers(columns)
+		quantities = np.abs(columns['Quantity'].astype(np.float64))
+		prices = columns['Price'].astype(np.float64) * factors
+		commissions = np.abs(columns['Commission'].astype(np.float64))
+
+		records = list(map(toTradeRecord
+						, tickers.tolist()
+						, toSides(columns['Buy/Sell'], columns['Code']).tolist()
+						, toQuantities(quantities)
+						, prices.tolist()
+						, toDates(columns['TradeDate']).tolist()
+						, toDates(columns['SettleDate']).tolist()
+						, commissions.tolist()
+						, toDateTimes(columns['Date/Time']).tolist()))
+	countRows('transform', n)
+	return records
+
+
+
+def toTradeRecord(ticker, side, quantity, price, tradeDate, settlementDate,
+					commission, tradeTime):
+	"""
+	=> [TradeRecord] trade record, same as ib.toTradeRecord()
+	"""
+	return TradeRecord(ticker, side, quantity, price, tradeDate, settlementDate
+						, 'Broker Commission', commission, 'TRADING', tradeTime)
+
+
+
+def fileToColumns(file, fields, assetClasses):
+	"""
+	[String] file, [Tuple] fields, [Tuple] assetClasses
+		=> [Dictionary] field -> [numpy array] column of strings
+
+	Only rows whose 'AssetClass' is in assetClasses are loaded, and only the
+	columns in fields are kept. If there is no such row, return None.
+
+	The columns are object arrays, which are much cheaper to build than
+	fixed width string arrays.
+	"""
+	with open(file, newline='') as csvfile:
+		reader = csv.reader(csvfile)
+		headers = next(reader, None)
+		if headers == None:	# empty file
+			return None
+
+		missing = [f for f in fields + ('AssetClass',) if not f in headers]
+		if missing != []:
+			rows = [row for row in reader if row != []][:1]
+		else:
+			i = headers.index('AssetClass')
+			getColumns = itemgetter(*[headers.index(f) for f in fields])
+			rows = [getColumns(row) for row in reader 
+						if row != [] and row[i] in assetClasses]
+
+	if rows == []:
+		return None
+	if missing != []:	# as ib.fileToRows(), an error only when a row needs it
+		raise MissingColumn('{0}: {1}'.format(file, missing))
+
+	return {field: np.array(column, dtype=object) for (field, column)
+				in zip(fields, zip(*rows))}
+
+
+
+def distinct(values, n):
+	"""
+	[Iterable] values, [Int] n => [List] distinct values,
+								  [numpy array] inverse
+
+	values has n items, values[i] == distinct values[inverse[i]]. The distinct
+	values are in the order they first appear.
+	"""
+	index = {}
+	inverse = np.fromiter((index.setdefault(v, len(index)) for v in values)
+							, dtype=np.intp, count=n)
+	return list(index), inverse
+
+
+
+def toTickers(columns):
+	"""
+	[Dictionary] columns => [numpy array] Bloomberg tickers,
+							[numpy array] price factors
+
+	A file has thousands of rows but only a handful of contracts, so the
+	ticker and price factor are worked out once per distinct contract, then
+	spread to all rows.
+	"""
+	identities, inverse = distinct(zip(*[columns[f] for f in TICKER_FIELDS])
+									, len(columns[TICKER_FIELDS[0]]))
+
+	tickers, factors = zip(*[resolveTicker(dict(zip(TICKER_FIELDS, identity)))
+								for identity in identities])
+	return np.array(tickers, dtype=object)[inverse] \
+			, np.array(factors, dtype=np.float64)[inverse]
+
+
+
+def toSides(buySell, code):
+	"""
+	[numpy array] buySell, [numpy array] code => [numpy array] sides
+
+	Same mapping as ib.createSide(): buy and closing trade (C) => Cover, sell
+	and opening trade (O) => Short, otherwise Buy or Sell.
+	"""
+	buy = buySell == 'BUY'
+	sell = buySell == 'SELL'
+	if not np.all(buy | sell):
+		raise InvalidTradeSide(set(buySell[~(buy | sell)].tolist()))
+
+	codes = np.char.add(np.char.add(';', code.astype(str)), ';')
+	closing = np.char.find(codes, ';C;') >= 0
+	opening = np.char.find(codes, ';O;') >= 0
+	return np.where(buy & closing, 'Cover'
+			, np.where(sell & opening, 'Short'
+			, np.where(buy, 'Buy', 'Sell'))).astype(object)
+
+
+
+def toQuantities(quantities):
+	"""
+	[numpy array] quantities => [List] quantities
+
+	Convert to integer where possible, as ib.toTradeRecord() does.
+	"""
+	isInteger = (np.mod(quantities, 1) == 0).tolist()
+	return [int(q) if i else q for (q, i) in zip(quantities.tolist(), isInteger)]
+
+
+
+def toDates(dateStrings):
+	"""
+	[numpy array] 'yyyymmdd' strings => [numpy array] datetime objects
+
+	There are only a few distinct dates in a file, each is converted once.
+	"""
+	uniques, inverse = distinct(dateStrings, len(dateStrings))
+	return np.array(list(map(stringToDate, uniques)), dtype=object)[inverse]
+
+
+
+def toDateTimes(dtStrings):
+	"""
+	[numpy array] 'yyyymmdd;hhmmss' strings => [numpy array] datetime objects
+
+	Trades often share an execution time, each distinct one is converted once.
+	"""
+	uniques, inverse = distinct(dtStrings, len(dtStrings))
+	return np.array(list(map(toDateTime, uniques)), dtype=object)[inverse]
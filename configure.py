@@ -97,4 +97,214 @@ def getDbUser():
 
 def getDbPassword():
 	global config
-	return config['database']['password']
\ No newline at end of file
+	return config['database']['password']
+
+
+
+def getCacheDirectory():
+	"""
+	The directory where parsed records of input files are kept, a relative
+	path is relative to the directory of the py files.
+	"""
+	global config
+	return join(get_current_path(), config.get('cache', 'directory', fallback='cache'))
+
+
+
+def getCacheMaxSize():
+	"""
+	Maximum total size of the cache, in bytes.
+	"""
+	global config
+	return int(config.getfloat('cache', 'max_size', fallback=200) * 1024 * 1024)
+
+
+
+def getCacheEnabled():
+	global config
+	return config.getboolean('cache', 'enabled', fallback=False)
+
+
+def getDbBackend():
+	"""
+	=> [String] 'mysql' or 'sqlite'
+	"""
+	global config
+	return config.get('database', 'backend', fallback='mysql')
+
+
+
+def getDbPath():
+	"""
+	The SQLite database file, a relative path is relative to the directory
+	of the py files.
+	"""
+	global config
+	return join(get_current_path(), config.get('database', 'path', fallback='registry.db'))
+
+
+
+def getDbPoolSize():
+	"""
+	The maximum number of idle MySQL connections kept for reuse.
+	"""
+	global config
+	return config.getint('database', 'pool_size', fallback=2)
+
+
+
+def getDbConnectTimeout():
+	global config
+	return config.getint('database', 'connect_timeout', fallback=10)
+
+
+
+def getDbReadTimeout():
+	global config
+	return config.getint('database', 'read_timeout', fallback=30)
+
+
+
+def getDbWriteTimeout():
+	global config
+	return config.getint('database', 'write_timeout', fallback=30)
+
+
+
+def getWatchPollInterval():
+	"""
+	Seconds between checks of the input directory in watch mode.
+	"""
+	global config
+	return config.getfloat('watch', 'poll_interval', fallback=2)
+
+
+
+def getWatchSettleSeconds():
+	"""
+	A file is converted only after its size and last modified time have not
+	changed for this many seconds, so that a partly written file is not read.
+	"""
+	global config
+	return config.getfloat('watch', 'settle_seconds', fallback=3)
+
+
+
+def getMetricsEnabled():
+	global config
+	return config.getboolean('metrics', 'enabled', fallback=False)
+
+
+
+def getMetricsFile():
+	"""
+	The Prometheus textfile to write metrics to, a relative path is relative
+	to the directory of the py files.
+	"""
+	global config
+	return join(get_current_path(), config.get('metrics', 'file', fallback='metrics/ib_worker.prom'))
+
+
+
+def getSortRunSize():
+	"""
+	Trade records are sorted in memory up to this many, beyond that they are
+	sorted in runs of this many records spilled to temp files, see sorting.py.
+	"""
+	global config
+	return config.getint('sort', 'run_size', fallback=500000)
+
+
+
+def getSortDirectory():
+	"""
+	The directory for the temp files of sorted runs, None for the system temp
+	directory. A relative path is relative to the directory of the py files.
+	"""
+	global config
+	directory = config.get('sort', 'directory', fallback='')
+	if directory == '':
+		return None
+	else:
+		return join(get_current_path(), directory)
+
+
+
+def getIBPartition():
+	"""
+	Whether IB flex files are partitioned by account and date, see
+	ib.processTradeFile().
+	"""
+	global config
+	return config.getboolean('ib', 'partition', fallback=False)
+
+
+
+def getAccountPortfolios():
+	"""
+	[Dictionary] IB account => portfolio, from section [accounts]. Account
+	keys are in lower case, as configparser gives them.
+	"""
+	global config
+	if config.has_section('accounts'):
+		return dict(config.items('accounts'))
+	else:
+		return {}
+
+
+
+def getAggregationEnabled():
+	global config
+	return config.getboolean('aggregation', 'enabled', fallback=False)
+
+
+
+def getPriceDecimals():
+	"""
+	Decimal places of the average price of an aggregated ticket.
+	"""
+	global config
+	return config.getint('aggregation', 'price_decimals', fallback=6)
+
+
+
+def getCommissionDecimals():
+	"""
+	Decimal places of the total commission of an aggregated ticket.
+	"""
+	global config
+	return config.getint('aggregation', 'commission_decimals', fallback=2)
+
+
+
+def getLedgerEnabled():
+	global config
+	return config.getboolean('ledger', 'enabled', fallback=False)
+
+
+
+def getLedgerPath():
+	"""
+	The SQLite file of the position ledger, a relative path is relative to
+	the directory of the py files.
+	"""
+	global config
+	return join(get_current_path(), config.get('ledger', 'path', fallback='ledger.db'))
+
+
+
+def getLedgerKeepDays():
+	"""
+	The number of daily position snapshots kept for each portfolio.
+	"""
+	global config
+	return config.getint('ledger', 'keep_days', fallback=30)
+
+
+
+def getLedgerCommissionDecimals():
+	"""
+	Decimal places of the commissions of a trade split by the ledger.
+	"""
+	global config
+	return config.getint('ledger', 'commission_decimals', fallback=2)
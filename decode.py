@@ -0,0 +1,93 @@
+# coding=utf-8
+#
+# Decode the date and number fields of broker files, shared by the broker
+# converters (ib.py, henghua.py, guangfa.py).
+#
+# A file has thousands of rows but only a handful of distinct dates, so date
+# parsing is memoized. Run "python benchmark.py decode" to compare with the
+# per row parsing used before.
+#
+
+from functools import lru_cache
+import datetime
+
+
+
+@lru_cache(maxsize=1024)
+def toDate(dateString):
+	"""
+	[String] dateString => [datetime] date
+
+	dateString is of format: yyyymmdd
+	"""
+	return datetime.datetime(int(dateString[0:4]), int(dateString[4:6]),
+								int(dateString[6:]))
+
+
+
+@lru_cache(maxsize=1024)
+def toDashedDate(dateString):
+	"""
+	[String] dateString => [datetime] date
+
+	dateString is of format: yyyy-mm-dd
+	"""
+	year, month, day = dateString.split('-')
+	return datetime.datetime(int(year), int(month), int(day))
+
+
+
+def toDateTime(dtString):
+	"""
+	[String] dtString => [datetime] datetime
+
+	dtString is a string of format "yyyymmdd;hhmmss", the date part is parsed
+	by the memoized toDate().
+	"""
+	dateString, hourString = dtString.split(';')
+	return withTime(toDate(dateString), int(hourString[0:2])
+					, int(hourString[2:4]), int(hourString[4:]))
+
+
+
+def toDashedDateTime(dateString, timeString):
+	"""
+	[String] dateString, [String] timeString => [datetime] datetime
+
+	convert "yyyy-mm-dd", "HH:mm:ss" to datetime object, without strptime()
+	which is slow.
+	"""
+	hour, minute, second = timeString.split(':')
+	return withTime(toDashedDate(dateString), int(hour), int(minute), int(second))
+
+
+
+def withTime(date, hour, minute, second):
+	"""
+	[datetime] date, [Int] hour, [Int] minute, [Int] second => [datetime]
+	"""
+	return datetime.datetime(date.year, date.month, date.day, hour, minute, second)
+
+
+
+@lru_cache(maxsize=1024)
+def excelDate(value):
+	"""
+	[Float] value => [datetime] date
+
+	value is an Excel date (days since 1899-12-30 for workbooks in the 1900
+	date system), as read by xlrd.
+	"""
+	from xlrd.xldate import xldate_as_datetime
+	return xldate_as_datetime(value, 0)
+
+
+
+def toFloat(data):
+	"""
+	[String] data => [Float] data
+
+	data is like: "1,440.45" or "96600.00" (there may be a comma). The commas
+	are removed by str.replace(), no per character Python callback.
+	"""
+	return float(data.replace(',', ''))
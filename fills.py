@@ -0,0 +1,107 @@
+# coding=utf-8
+#
+# Aggregate partial fills before Bloomberg upload (section [aggregation] in
+# ib.config).
+#
+# Brokers report every partial fill of an order as a trade, so an algo day
+# gives thousands of tickets, slow to upload to AIM and to reconcile. When
+# aggregation is on, the fills of a trade file with the same ticker, side,
+# trade date and settlement date become one ticket: the quantities and
+# commissions are added up, the price is the quantity weighted average. The
+# average price and the total commission are rounded to the decimal places
+# in the config file.
+#
+# A ticket takes the place of its first fill, so tickets are in the order of
+# their first fills, and a fill with nothing to merge with is not changed.
+#
+
+from IB.configure import getAggregationEnabled, getPriceDecimals, \
+						getCommissionDecimals
+from IB.utility import timedStage, countRows, toQuantity, setFeatureEnabled, \
+						isFeatureEnabled
+from functools import partial
+from math import fsum
+from operator import itemgetter
+import logging
+logger = logging.getLogger(__name__)
+
+
+
+# turn aggregation on or off for this process, see utility.setFeatureEnabled()
+setEnabled = partial(setFeatureEnabled, 'aggregation')
+isEnabled = partial(isFeatureEnabled, 'aggregation', getAggregationEnabled)
+
+
+
+def aggregateFills(records):
+	"""
+	[Iterable] trade records => [Iterable] trade records, with fills
+		aggregated if aggregation is enabled, otherwise the records unchanged.
+	"""
+	if not isEnabled():
+		return records
+
+	return map(itemgetter(1), toTickets((None, record) for record in records))
+
+
+
+def aggregatePartitionedFills(partitionedRecords):
+	"""
+	[Iterable] ((portfolio, date), trade record) pairs => [Iterable] pairs,
+		with fills in the same partition aggregated if aggregation is enabled,
+		otherwise the pairs unchanged.
+	"""
+	if not isEnabled():
+		return partitionedRecords
+
+	return toTickets(partitionedRecords)
+
+
+
+def toTickets(partitionedRecords):
+	"""
+	[Iterable] (partition, trade record) pairs => [List] (partition, ticket)
+		pairs
+
+	The fills of a ticket are those with the same partition, ticker, side,
+	trade date and settlement date. The ticket is the first fill, changed in
+	place.
+	"""
+	with timedStage('aggregate'):
+		tickets = {}	# key => [pair, quantities, amounts, commissions]
+		for (partition, record) in partitionedRecords:
+			key = (partition, record['BloombergTicker'], record['Side']
+					, record['TradeDate'], record['SettlementDate'])
+			ticket = tickets.get(key)
+			if ticket == None:
+				tickets[key] = [(partition, record), [record['Quantity']]
+								, [record['Quantity'] * record['Price']]
+								, [record['Commission Amt 1']]]
+			else:
+				ticket[1].append(record['Quantity'])
+				ticket[2].append(record['Quantity'] * record['Price'])
+				ticket[3].append(record['Commission Amt 1'])
+
+		priceDecimals, commissionDecimals = getPriceDecimals(), getCommissionDecimals()
+		for (pair, quantities, amounts, commissions) in tickets.values():
+			if len(quantities) > 1:
+				mergeFills(pair[1], quantities, amounts, commissions
+							, priceDecimals, commissionDecimals)
+
+	countRows('aggregate', len(tickets))
+	return [ticket[0] for ticket in tickets.values()]
+
+
+
+def mergeFills(record, quantities, amounts, commissions, priceDecimals,
+				commissionDecimals):
+	"""
+	[TradeRecord] record, [List] quantities, [List] amounts (quantity x price),
+		[List] commissions, [Int] priceDecimals, [Int] commissionDecimals
+		=> change the record to the ticket of the fills
+	"""
+	quantity = fsum(quantities)
+	if quantity != 0:
+		record['Price'] = round(fsum(amounts) / quantity, priceDecimals)
+	record['Commission Amt 1'] = round(fsum(commissions), commissionDecimals)
+	record['Quantity'] = toQuantity(quantity)
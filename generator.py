@@ -0,0 +1,224 @@
+# coding=utf-8
+#
+# Generate synthetic broker files of any size, for benchmarks, e.g.,
+#
+#	python generator.py IB trade --rows 100000 --output C:\temp\bench
+#
+# A file is made of the rows of the sample file of its kind, repeated until
+# the given number of rows, so its content looks like what the broker sends.
+# Trade times are spread randomly over the day, so that sorting has work to
+# do. The file is named the way the broker names it, so that the date can
+# be found from the file name.
+#
+
+from IB.utility import get_current_path
+from IB.henghua import fileToLines
+from os.path import join
+import csv, random
+
+
+
+def writeIBTradeFile(file, rows):
+	"""
+	[String] file, [Int] rows => write an IB flex trade file
+	"""
+	def randomTime(headers):
+		i = headers.index('Date/Time')
+		def perturb(row):
+			row[i] = row[i][:9] + '{0:02d}{1:02d}{2:02d}'.format(random.randrange(24)
+						, random.randrange(60), random.randrange(60))
+			return row
+		return perturb
+
+	writeIBFile(file, join('trade1', 'DU1237908.Trades_TradeConfirmFlex.Sample.csv')
+				, rows, randomTime)
+
+
+
+def writeIBCashFile(file, rows):
+	"""
+	[String] file, [Int] rows => write an IB flex cash file
+	"""
+	writeIBFile(file, 'cash_IB.csv', rows)
+
+
+
+def writeIBPositionFile(file, rows):
+	"""
+	[String] file, [Int] rows => write an IB flex position file
+	"""
+	writeIBFile(file, 'position_IB.csv', rows)
+
+
+
+def writeIBFile(file, sample, rows, perturb=None):
+	"""
+	[String] file, [String] sample, [Int] rows, [Function] perturb
+		=> write a csv file with the headers of the sample file, followed by
+		rows of the sample file repeated.
+
+	perturb: headers => a function that changes a row, or None.
+	"""
+	with open(join(get_current_path(), 'samples', sample), newline='') as f:
+		reader = csv.reader(f)
+		headers = next(reader)
+		samples = [row for row in reader if row != []]
+
+	change = (lambda row: row) if perturb == None else perturb(headers)
+	random.seed(0)
+	with open(file, 'w', newline='') as f:
+		writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+		writer.writerow(headers)
+		writer.writerows(change(list(samples[n % len(samples)])) for n in range(rows))
+
+
+
+def writeHGNHTradeFile(file, rows):
+	"""
+	[String] file, [Int] rows => write an HGNH trade workbook
+	"""
+	def randomTime(headers):
+		i = headers.index('Trade Time')
+		def perturb(row):
+			row[i] = random.randrange(86400) / 86400
+			return row
+		return perturb
+
+	writeHGNHFile(file, 'trade_henghua.xlsx', rows, randomTime)
+
+
+
+def writeHGNHCashFile(file, rows):
+	"""
+	[String] file, [Int] rows => write an HGNH cash workbook
+	"""
+	writeHGNHFile(file, 'cash_henghua.xlsx', rows)
+
+
+
+def writeHGNHPositionFile(file, rows):
+	"""
+	[String] file, [Int] rows => write an HGNH position workbook
+	"""
+	writeHGNHFile(file, 'position_henghua.xlsx', rows)
+
+
+
+def writeHGNHFile(file, sample, rows, perturb=None):
+	"""
+	[String] file, [String] sample, [Int] rows, [Function] perturb
+		=> write an xlsx workbook with the headers of the sample file,
+		followed by rows of the sample file repeated.
+
+	Dates are written as Excel date numbers, as they are read from the sample.
+	The workbook is written in write only mode, so memory use does not grow
+	with the number of rows.
+	"""
+	from openpyxl import Workbook
+	lines = fileToLines(join(get_current_path(), 'samples', sample))
+	headers = next(lines)
+	samples = list(lines)
+
+	change = (lambda row: row) if perturb == None else perturb(headers)
+	random.seed(0)
+	wb = Workbook(write_only=True)
+	ws = wb.create_sheet()
+	ws.append(headers)
+	for n in range(rows):
+		ws.append(change(list(samples[n % len(samples)])))
+
+	wb.save(file)
+
+
+
+def writeGFTradeFile(file, rows):
+	"""
+	[String] file, [Int] rows => write a Guang Fa trade file (trddata)
+	"""
+	def randomTime(row):
+		row[15] = '{0:02d}:{1:02d}:{2:02d}'.format(random.randrange(24)
+					, random.randrange(60), random.randrange(60))
+		return row
+
+	writeGFFile(file, '8888802200trddata_f20140131.txt', rows, randomTime)
+
+
+
+def writeGFCashFile(file, rows):
+	"""
+	[String] file, [Int] rows => write a Guang Fa cash file (cusfund)
+
+	The last line of a cash file is the total balance, it stays the last.
+	"""
+	writeGFFile(file, '8888802200cusfund_f20140129.txt', rows, hasTotal=True)
+
+
+
+def writeGFPositionFile(file, rows):
+	"""
+	[String] file, [Int] rows => write a Guang Fa position file (holddata)
+	"""
+	writeGFFile(file, '8888802200holddata_f20140129.txt', rows)
+
+
+
+def writeGFFile(file, sample, rows, perturb=None, hasTotal=False):
+	"""
+	[String] file, [String] sample, [Int] rows, [Function] perturb,
+		[Bool] hasTotal => write an '@' delimited file of the rows of the
+		sample file repeated. The files have no headers.
+	"""
+	with open(join(get_current_path(), 'samples', sample), newline='') as f:
+		samples = [row for row in csv.reader(f, delimiter='@') if row != []]
+
+	total = samples.pop() if hasTotal else None
+	change = (lambda row: row) if perturb == None else perturb
+	random.seed(0)
+	with open(file, 'w', newline='') as f:
+		writer = csv.writer(f, delimiter='@', lineterminator='\n')
+		writer.writerows(change(list(samples[n % len(samples)])) for n in range(rows))
+		if total != None:
+			writer.writerow(total)
+
+
+
+# (broker, file type) => (file name, function to write the file)
+GENERATORS = {
+	('IB', 'trade'): ('flex.1.trade_steven.20181022.20181022.csv', writeIBTradeFile),
+	('IB', 'cash'): ('flex.1.cash.20181026.20181026.csv', writeIBCashFile),
+	('IB', 'position'): ('flex.1.position.20181026.20181026.csv', writeIBPositionFile),
+	('HGNH', 'trade'): ('Trade File 20181025.xlsx', writeHGNHTradeFile),
+	('HGNH', 'cash'): ('Cash 20181025.xlsx', writeHGNHCashFile),
+	('HGNH', 'position'): ('Position 20181025.xlsx', writeHGNHPositionFile),
+	('GF', 'trade'): ('8888802200trddata_f20140131.txt', writeGFTradeFile),
+	('GF', 'cash'): ('8888802200cusfund_f20140129.txt', writeGFCashFile),
+	('GF', 'position'): ('8888802200holddata_f20140129.txt', writeGFPositionFile)
+}
+
+
+
+def generateFile(broker, fileType, directory, rows):
+	"""
+	[String] broker, [String] fileType, [String] directory, [Int] rows
+		=> [String] the file generated
+
+	broker: 'IB', 'HGNH' or 'GF'; fileType: 'trade', 'cash' or 'position'.
+	"""
+	fileName, writeFile = GENERATORS[(broker, fileType)]
+	file = join(directory, fileName)
+	writeFile(file, rows)
+	return file
+
+
+
+
+if __name__ == '__main__':
+	import argparse
+	parser = argparse.ArgumentParser()
+	parser.add_argument('broker', choices=['IB', 'HGNH', 'GF'])
+	parser.add_argument('type', choices=['trade', 'cash', 'position'])
+	parser.add_argument('--rows', type=int, default=1000)
+	parser.add_argument('--output', metavar='output directory', default=get_current_path())
+	args = parser.parse_args()
+
+	print(generateFile(args.broker, args.type, args.output, args.rows))
@@ -7,10 +7,17 @@
 #
 
 from utils.utility import writeCsv
-from IB.utility import get_current_path, writeTradeFiles, writeCashFile, \
-						writePositionFile, toOpenCloseGroup, fileNameWithoutPath
+from IB.utility import get_current_path, writeTradeRecords, writeCashFile, \
+						writePositionFile, fileNameWithoutPath, \
+						tickerCache, timed, timedStage, \
+						TradeRecord, PositionRecord, CashRecord, toQuantity
+from IB.decode import toFloat, toDate, toDashedDate, toDashedDateTime
+from IB.cache import cachedRecords, setEnabled as setCacheEnabled
+from IB.sorting import sortRecords
+from IB.fills import aggregateFills, setEnabled as setAggregationEnabled
 from os.path import join
-import csv, logging, datetime
+from operator import attrgetter
+import csv, logging
 logger = logging.getLogger(__name__)
 
 
@@ -20,6 +27,40 @@ class InvalidTradeSide(Exception):
 
 
 
+# mapping Guangfa ticker to Bloombert Ticker's first 2 letters, and index 
+# or comdty
+FUTURES_MAP = {
+	'HSI': ('HI', 'Index'),		# Hang Seng Index
+	'MHU': ('HU', 'Index'),		# mini Hang Seng Index
+	'SM' : ('SM', 'Comdty'),	# Soybean Meal
+	'WH' : ('W ', 'Comdty'), 	# Wheat
+	'SO' : ('S ', 'Comdty'),	# Soybean
+	'HO' : ('HO', 'Comdty'), 	# Ultra-low Sulfur Diesel Fuel
+	'RB' : ('XB', 'Comdty'), 	# RBOB Gasoline
+	'CL' : ('CL', 'Comdty'),	# Light Weight Crude Oil (WTI)
+	'BR' : ('CO', 'Comdty'),	# Brent Crude Oil
+	'NG' : ('NG', 'Comdty'),	# Natural Gas
+	'GC' : ('GC', 'Comdty') 	# Gold
+}
+
+# mapping month to Bloomberg Ticker's 3rd letter for futures contract
+MONTH_MAP = {
+	1: 'F',
+	2: 'G',
+	3: 'H',
+	4: 'J',
+	5: 'K',
+	6: 'M',
+	7: 'N',
+	8: 'Q',
+	9: 'U',
+	10: 'V',
+	11: 'X',
+	12: 'Z'
+}
+
+
+
 def processCashPositionFile(file, outputDir=get_current_path()):
     """
     [String] cash or position file => [String] output file
@@ -78,19 +119,21 @@ def isPositionFile(fn):
 
 
 
-def processTradeFile(file, outputDir=get_current_path()):
+def processTradeFile(file, outputDir=get_current_path(), grouping='openclose'):
 	"""
-	[String] trade file, [String] outputDir => [List] output file names
+	[String] trade file, [String] outputDir, [String] grouping
+		=> [List] output file names
 	
 	read the trade file, convert it to trade records and write it to
 	a list of output csv files, to be uploaded by Bloomberg.
+
+	grouping is either 'openclose' or 'box', see utility.groupRecords().
 	"""
 	logger.info('processTradeFile(): {0}'.format(file))
 
-	return writeTradeFiles(
-				toOpenCloseGroup(
-					createTradeRecords(file)
-				)
+	return writeTradeRecords(
+				aggregateFills(createTradeRecords(file))
+				, grouping
 				, outputDir
 				, '40006-D'
 				, 'GF-QUANT'
@@ -99,6 +142,7 @@ def processTradeFile(file, outputDir=get_current_path()):
 
 
 
+@cachedRecords
 def createCashRecords(file):
 	"""
 	[String] file => [List] cash records
@@ -107,6 +151,7 @@ def createCashRecords(file):
 
 
 
+@cachedRecords
 def createPositionRecords(file):
 	"""
 	[String] file => [List] cash records
@@ -115,17 +160,20 @@ def createPositionRecords(file):
 
 
 
+@cachedRecords
 def createTradeRecords(file):
 	"""
 	[String] file => [Iterable] trade records
 	"""
-	return toSortedRecords(map(tradeRecord, tradefileToRecords(file)))
+	records = timed('transform', map(tradeRecord, timed('read', readTradefile(file))))
+	with timedStage('sort'):
+		return toSortedRecords(records)
 
 
 
 def tradeRecord(fileRecord):
 	"""
-	[Dict] fileRecord => [Dict] trade record
+	[Dict] fileRecord => [TradeRecord] trade record
 
 	Create a new trade record from the existing record, the below fields are
 	necessary to create Bloomberg upload file.
@@ -139,32 +187,22 @@ def tradeRecord(fileRecord):
 	7. Commission Code 1: fixed to 'Broker Commission'
 	8. Commission Amt 1: total commission
 	9. Strategy: strategy of the trade
+	10. TradeTime: trade date and time, of type datetime
 	"""
-	r = {}
-	r['BloombergTicker'] = createTicker(fileRecord)
-	r['Side'] = createSide(fileRecord)
-	r['Quantity'] = max(toFloat(fileRecord['BuyQuantity']), toFloat(fileRecord['SellQuantity']))
-	r['Price'] = toFloat(fileRecord['Price'])
-	r['TradeDate'] = stringToDate(fileRecord['TradeDate'])
-	r['SettlementDate'] = stringToDate(fileRecord['SettlementDate'])
-	r['Commission Code 1'] = 'Broker Commission'
-	r['Commission Amt 1'] = toFloat(fileRecord['Commission'])
-	r['Strategy'] = 'TRADING'
-
-	# Convert to integer if possible, sometimes if the quantity of a futures
-	# contract is a float (like 15.0), BLoomberg may generate an error.
-	if r['Quantity'].is_integer():
-		r['Quantity'] = int(r['Quantity'])
-
-	r['Datetime'] = createDatetime(fileRecord['TradeDate'], fileRecord['Time'])
-
-	return r
+	quantity = max(toFloat(fileRecord['BuyQuantity']), toFloat(fileRecord['SellQuantity']))
+	return TradeRecord(createTicker(fileRecord), createSide(fileRecord), toQuantity(quantity)
+						, toFloat(fileRecord['Price'])
+						, toDashedDate(fileRecord['TradeDate'])
+						, toDashedDate(fileRecord['SettlementDate'])
+						, 'Broker Commission', toFloat(fileRecord['Commission'])
+						, 'TRADING'
+						, toDashedDateTime(fileRecord['TradeDate'], fileRecord['Time']))
 
 
 
 def cashRecord(fileRecord):
 	"""
-	[Dictionary] file record => [Dictionary] cash record
+	[Dictionary] file record => [CashRecord] cash record
 
 	Create a new cash record from the file record, the record has 3
 	fields:
@@ -173,21 +211,19 @@ def cashRecord(fileRecord):
 	2. Quantity: must be positive
 	3. Date: of type datetime
 	"""
-	r = {}
-	r['Date'] = stringToDate(fileRecord['SettlementDate'])
-	r['Quantity'] = toFloat(fileRecord['Balance'])
 	if fileRecord['Currency'] == 'HK-HKD':
-		r['Currency'] = 'HKD'
+		currency = 'HKD'
 	else:
-		r['Currency'] = fileRecord['Currency']
+		currency = fileRecord['Currency']
 
-	return r
+	return CashRecord(currency, toFloat(fileRecord['Balance'])
+						, toDashedDate(fileRecord['SettlementDate']))
 
 
 
 def positionRecord(fileRecord):
 	"""
-	[Dictionary] file record => [Dictionary] position record
+	[Dictionary] file record => [PositionRecord] position record
 
 	Create a new position record from the file record, the record has the
 	below fields:
@@ -205,12 +241,9 @@ def positionRecord(fileRecord):
 			return -1 * toFloat(sell)
 
 
-	r = {}
-	r['BloombergTicker'] = createTicker(fileRecord)
-	r['Quantity'] = getQuantity(fileRecord['BuyQuantity'], fileRecord['SellQuantity'])
-	r['Currency'] = fileRecord['Currency']
-	r['Date'] = stringToDate(fileRecord['SettlementDate'])
-	return r
+	return PositionRecord(createTicker(fileRecord)
+						, getQuantity(fileRecord['BuyQuantity'], fileRecord['SellQuantity'])
+						, fileRecord['Currency'], toDashedDate(fileRecord['SettlementDate']))
 
 
 
@@ -222,14 +255,23 @@ def tradefileToRecords(file):
 	dictionary, of type OrderedDict. The csv file has no headers, therefore
 	we supply the headers here to use as the dict keys.
 	"""
+	return list(readTradefile(file))
+
+
+
+def readTradefile(file):
+	"""
+	[String] file => [Iterable] records
+
+	Same as tradefileToRecords(), but the records are read lazily.
+	"""
 	headers = ['SettlementDate', 'TradeDate', 'MaturityDate', 'AccountNo', 
 				'AccountOpeningNo', 'TradeSerialNo', 'Currency', 'Exchange',
 				'Item', 'Contract', 'OpenClose', 'BuyQuantity', 'SellQuantity',
 				'Price', 'Amount', 'Time', 'Commission', 'Premium', 'OptionType',
 				'ExercisePrice', 'UpstreamCode', 'InlandAccountNo']
 	with open(file, newline='') as csvfile:
-		reader = csv.DictReader(csvfile, fieldnames=headers, delimiter='@')
-		return [row for row in reader]
+		yield from csv.DictReader(csvfile, fieldnames=headers, delimiter='@')
 
 
 
@@ -274,18 +316,14 @@ def positionfileToRecords(file):
 
 def toSortedRecords(records):
 	"""
-	[Iterable] records => [List] new records
+	[Iterable] records => [Iterable] records
 
-	Sort the records by 'Datetime' field. If two records have the same 
-	'Datetime', then their order in the original list is preserved,i.e., 
-	whichever comes first in the original list comes first in  the softed list.
+	Sort the records by 'TradeTime' field. If two records have the same 
+	'TradeTime', then their order in the original list is preserved. The
+	records are not copied. A large file is sorted out of memory, see
+	sorting.py.
 	"""
-	def byDateTime(recordWithOrder):
-		order, record = recordWithOrder
-		return (record['Datetime'], order)
-
-
-	return map(lambda x: x[1], sorted(enumerate(records), key=byDateTime))
+	return sortRecords(records, attrgetter('TradeTime'))
 
 
 
@@ -307,45 +345,26 @@ def createFuturesTicker(fileRecord):
 
 	Create a Bloomberg ticker for a record from the file.
 	"""
-	bMap = {	# mapping Guangfa ticker to Bloombert Ticker's first 2 letters,
-				# and index or comdty
-		'HSI': ('HI', 'Index'),		# Hang Seng Index
-		'MHU': ('HU', 'Index'),		# mini Hang Seng Index
-		'SM' : ('SM', 'Comdty'),	# Soybean Meal
-		'WH' : ('W ', 'Comdty'), 	# Wheat
-		'SO' : ('S ', 'Comdty'),	# Soybean
-		'HO' : ('HO', 'Comdty'), 	# Ultra-low Sulfur Diesel Fuel
-		'RB' : ('XB', 'Comdty'), 	# RBOB Gasoline
-		'CL' : ('CL', 'Comdty'),	# Light Weight Crude Oil (WTI)
-		'BR' : ('CO', 'Comdty'),	# Brent Crude Oil
-		'NG' : ('NG', 'Comdty'),	# Natural Gas
-		'GC' : ('GC', 'Comdty') 	# Gold
-	}
-
-	mMap = {	# mapping month to Bloomberg Ticker's 3rd letter
-				# for futures contract
-		1: 'F',
-		2: 'G',
-		3: 'H',
-		4: 'J',
-		5: 'K',
-		6: 'M',
-		7: 'N',
-		8: 'Q',
-		9: 'U',
-		10: 'V',
-		11: 'X',
-		12: 'Z'
-	}
-
-	prefix, suffix = bMap[fileRecord['Item']]
-	month = mMap[int(fileRecord['Contract'][-2:])]
-	year = fileRecord['Contract'][-4:-2]
+	return resolveFuturesTicker(fileRecord['Item'], fileRecord['Contract'])[0]
+
+
+
+@tickerCache('GuangFa')
+def resolveFuturesTicker(item, contract):
+	"""
+	[String] item, [String] contract => ([String] ticker, [Int] price factor)
+
+	Memoized, so the mapping is worked out once per contract. Guang Fa prices
+	need no adjustment, so the price factor is always 1.
+	"""
+	prefix, suffix = FUTURES_MAP[item]
+	month = MONTH_MAP[int(contract[-2:])]
+	year = contract[-4:-2]
 	
 	if (prefix, suffix) == ('NG', 'Comdty'):	# use two digits for year
-		return prefix + month + year + ' ' + suffix
+		return prefix + month + year + ' ' + suffix, 1
 	else:
-		return prefix + month + year[1] + ' ' + suffix
+		return prefix + month + year[1] + ' ' + suffix, 1
 
 
 
@@ -376,23 +395,13 @@ def createSide(fileRecord):
 
 
 
-def toFloat(data):
-	"""
-	[String] data => [Float] data
-
-	data is like: "1,440.45" or "96600.00" (there may be a comma)
-	"""
-	return float(''.join(filter(lambda x: x != ',', data)))
-
-
-
 def stringToDate(dateString):
 	"""
 	[String] dateString => [datetime] date
 
-	dateString is of format: yyyy-mm-dd
+	dateString is of format: yyyy-mm-dd, see decode.toDashedDate()
 	"""
-	return datetime.datetime.strptime(dateString, '%Y-%m-%d')
+	return toDashedDate(dateString)
 
 
 
@@ -400,9 +409,10 @@ def createDatetime(dt, tm):
 	"""
 	[String] dt, [String] tm => [Datetime] datetime
 
-	convert "yyyy-mm-dd", "HH:mm:ss" to datetime object
+	convert "yyyy-mm-dd", "HH:mm:ss" to datetime object, see 
+	decode.toDashedDateTime()
 	"""
-	return datetime.datetime.strptime(dt + ' ' + tm, '%Y-%m-%d %H:%M:%S')
+	return toDashedDateTime(dt, tm)
 
 
 
@@ -413,7 +423,7 @@ def getDateFromFilename(file):
     The Guangfa file name has a pattern: 8888802200trddata_f20140131.txt
     Date is of format "yyyymmdd".
     """
-    return datetime.datetime.strptime(file[-12:-4], '%Y%m%d')
+    return toDate(file[-12:-4])
 
 
 
@@ -427,6 +437,12 @@ if __name__ == '__main__':
 	parser.add_argument('file', metavar='input file', type=str)
 	parser.add_argument('--type', metavar='file type', choices=['t', 'pc'], 
 						default='pc')
+	parser.add_argument('--no-cache', action='store_true'
+						, help='parse the input file even if it is in cache')
+	parser.add_argument('--grouping', metavar='trade grouping'
+						, choices=['openclose', 'box'], default='openclose')
+	parser.add_argument('--aggregate', action='store_true'
+						, help='merge partial fills into one ticket')
 	args = parser.parse_args()
 
 	"""
@@ -438,10 +454,16 @@ if __name__ == '__main__':
 										  , default is 'pc')
 	"""
 	import sys
+	if args.no_cache:
+		setCacheEnabled(False)
+	if args.aggregate:
+		setAggregationEnabled(True)
+
 	if args.file == None:
 		print('input file name is missing')
 		sys.exit(1)
 	elif args.type == 't':
-		processTradeFile(join(get_current_path(), args.file))
+		processTradeFile(join(get_current_path(), args.file), get_current_path()
+						, args.grouping)
 	else:
 		processCashPositionFile(join(get_current_path(), args.file))
@@ -6,13 +6,23 @@
 # 2. Geneva reconciliation file.
 #
 
-from IB.utility import get_current_path, writeTradeFiles, toOpenCloseGroup, \
-                        writeCashFile, writePositionFile, fileNameWithoutPath
+from IB.utility import get_current_path, writeTradeRecords, \
+                        writeCashFile, writePositionFile, fileNameWithoutPath, \
+                        timed, timedStage, TradeRecord, \
+                        PositionRecord, CashRecord, toQuantity
 from IB.ib import stringToDate
-from xlrd import open_workbook
+from xlrd import open_workbook, XLRDError
+from openpyxl import load_workbook
+from openpyxl.utils.datetime import to_excel
 from xlrd.xldate import xldate_as_datetime
+from IB.decode import excelDate
+from IB.cache import cachedRecords, setEnabled as setCacheEnabled
+from IB.sorting import sortRecords
+from IB.fills import aggregateFills, setEnabled as setAggregationEnabled
+from IB.ledger import splitTrades, recordPositions, setEnabled as setLedgerEnabled
 from os.path import join
 from functools import reduce
+from operator import attrgetter
 import csv, logging, datetime
 logger = logging.getLogger(__name__)
 
@@ -42,7 +52,9 @@ def processCashPositionFile(file, outputDir=get_current_path()):
         return writeCashFile('40006-C', createCashRecords(file), 
                                     outputDir, getDateFromFilename(file))
     elif isPositionFile(file):
-        return writePositionFile('40006-C', createPositionRecords(file), 
+        records = createPositionRecords(file)
+        recordPositions('40006-C', getDateFromFilename(file), records)
+        return writePositionFile('40006-C', records, 
                                     outputDir, getDateFromFilename(file))
     else:
         logger.debug('processCashPositionFile(): not a cash or position file: \
@@ -51,16 +63,24 @@ def processCashPositionFile(file, outputDir=get_current_path()):
 
  
 
-def processTradeFile(file, outputDir):
+def processTradeFile(file, outputDir, grouping='openclose'):
+    """
+    [String] trade file, [String] outputDir, [String] grouping
+        => [List] output file names
+
+    grouping is either 'openclose' or 'box', see utility.groupRecords().
+    Trades that both close and open a position are split by the position
+    ledger, if enabled, see ledger.py.
+    """
     logger.info('processTradeFile(): {0}'.format(file))
-    return writeTradeFiles(
-                toOpenCloseGroup(
-                    createTradeRecords(file)
-                )
+    date = getDateFromFilename(file)
+    return writeTradeRecords(
+                aggregateFills(splitTrades('40006-C', date, createTradeRecords(file)))
+                , grouping
                 , outputDir
                 , '40006-C'
                 , 'HGNH-QUANT'
-                , getDateFromFilename(file)
+                , date
             )
 
 
@@ -99,16 +119,19 @@ def isPositionFile(file):
 
 
 
+@cachedRecords
 def createTradeRecords(file):
     """
-    [String] file => [List] trade records
+    [String] file => [Iterable] trade records
     """
-    return sortByTradeTime(
-                list(map(toTradeRecord, linesToRecords(fileToLines(file))))
-            )
+    records = timed('transform', map(toTradeRecord, 
+                    timed('read', linesToRecords(fileToLines(file)))))
+    with timedStage('sort'):
+        return sortByTradeTime(records)
 
 
 
+@cachedRecords
 def createPositionRecords(file):
     """
     [String] file => [List] position records
@@ -117,6 +140,7 @@ def createPositionRecords(file):
 
 
 
+@cachedRecords
 def createCashRecords(file):
     """
     [String] file => [List] cash records
@@ -136,16 +160,12 @@ def createCashRecords(file):
 
     def tupleToRecord(t):
         """
-        [Tuple] (currency, quantity) => [Dictionary] cash record
+        [Tuple] (currency, quantity) => [CashRecord] cash record
 
         The conversion is necessary so that we can reuse the write cash file
         function.
         """
-        r = {}
-        r['Currency'] = t[0]
-        r['Quantity'] = t[1]
-        r['Date'] = date 
-        return r 
+        return CashRecord(t[0], t[1], date)
 
 
     return list(map(tupleToRecord
@@ -234,35 +254,92 @@ def mergeCashEntries(entries):
 
 def fileToLines(file):
     """
-    [String] file => [List] lines, each line is a list of columns
+    [String] file => [Iterable] lines, each line is a list of columns
+
+    Lines are read lazily, one whole row at a time, and only the first sheet
+    of the workbook is loaded. Strings are stripped.
+
+    The workbook is opened by xlrd on demand. xlrd 2.x no longer opens .xlsx
+    files, for them openpyxl in read only mode is used instead, with the
+    values converted to what xlrd gives, i.e., numbers, dates and times are
+    floats and empty cells are ''.
+    """
+    try:
+        wb = open_workbook(filename=file, on_demand=True)
+    except XLRDError:
+        if file.lower().endswith('.xlsx'):
+            return xlsxToLines(file)
+        raise
+
+    return workbookToLines(wb)
+
+
+
+def workbookToLines(wb):
+    """
+    [xlrd Book] wb => [Iterable] lines
+    """
+    try:
+        ws = wb.sheet_by_index(0)
+        for row in range(ws.nrows):
+            yield list(map(stripString, ws.row_values(row)))
+
+    finally:
+        wb.release_resources()
+
+
+
+def xlsxToLines(file):
+    """
+    [String] file => [Iterable] lines
+
+    Read by openpyxl. Rows with all cells empty are given as xlrd gives them,
+    with '' for each cell, see linesToRecords().
     """
-    wb = open_workbook(filename=file)
-    ws = wb.sheet_by_index(0)
-    lines = []
-    row = 0
-    while row < ws.nrows:
-        thisRow = []
-        column = 0
-        while column < ws.ncols:
-            cellValue = ws.cell_value(row, column)
-            if isinstance(cellValue, str):
-                cellValue = cellValue.strip()
-            thisRow.append(cellValue)
-            column = column + 1
+    wb = load_workbook(filename=file, read_only=True, data_only=True)
+    try:
+        for row in wb.worksheets[0].iter_rows(values_only=True):
+            yield list(map(toXlrdValue, row))
+
+    finally:
+        wb.close()
+
+
+
+def stripString(value):
+    if isinstance(value, str):
+        return value.strip()
+    else:
+        return value
+
 
-        lines.append(thisRow)
-        row = row + 1
 
-    return lines
+def toXlrdValue(value):
+    """
+    [Object] openpyxl cell value => [Object] the value as xlrd gives it
+    """
+    if value == None:
+        return ''
+    elif isinstance(value, str):
+        return value.strip()
+    elif isinstance(value, bool):
+        return int(value)
+    elif isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return float(to_excel(value))
+    elif isinstance(value, datetime.timedelta):
+        return value.total_seconds() / 86400
+    else:
+        return float(value)
 
 
 
 def linesToRecords(lines):
     """
-    [List] lines => [Iterable] records
+    [Iterable] lines => [Iterable] records
 
     Using the first row as header, the function converts the remaining lines
-    as records.
+    as records. Blank lines, e.g., empty rows at the end of a sheet, are
+    skipped.
     """
     def lineToRecord(line):
         r = {}
@@ -271,14 +348,18 @@ def linesToRecords(lines):
 
         return r
 
-    headers = lines[0]
-    return map(lineToRecord, lines[1:])
+    lines = iter(lines)
+    headers = next(lines, None)
+    if headers == None: # empty sheet
+        return iter([])
+
+    return map(lineToRecord, filter(lambda line: any(v != '' for v in line), lines))
 
 
 
 def toPositionRecord(record):
     """
-    [Dictionary] record => [Dictionary] position record
+    [Dictionary] record => [PositionRecord] position record
 
     Create a new position record from the line record, position record has the
     below fields:
@@ -294,21 +375,19 @@ def toPositionRecord(record):
         else:
             return -1 * quantity
 
-    r = {}
-    r['BloombergTicker'] = record['Product']
-    r['Quantity'] = toPositionQuantity(record['B/S'], record['Lots'])
-    r['Currency'] = record['Currency'].split('_')[1]
-    r['Date'] = xldate_as_datetime(record['Date'], 0)
-    return r
+    return PositionRecord(record['Product']
+                        , toPositionQuantity(record['B/S'], record['Lots'])
+                        , record['Currency'].split('_')[1]
+                        , excelDate(record['Date']))
 
 
 
 def toTradeRecord(record):
     """
-    [Dictionary] record => [Dictionary] Bloomberg upload record
+    [Dictionary] record => [TradeRecord] Bloomberg upload record
 
-    Create a new trade record from the existing record, the trade record has 8
-    necessary fields:
+    Create a new trade record from the existing record, the trade record has
+    the below fields:
 
     1. BloombergTicker
     2. Side
@@ -319,26 +398,12 @@ def toTradeRecord(record):
     7. Commission Code 1: fixed to 'Broker Commission'
     8. Commission Amt 1: total commission
     9. Strategy: strategy of the trade.
+    10. TradeTime: trade time of the day, to be used for sorting
     """
-    r = {}
-    r['BloombergTicker'] = record['Contract']
-    r['Side'] = getTradeSide(record)
-    r['Quantity'] = record['Lots']
-    r['Price'] = record['Trade Price']
-    r['TradeDate'] = xldate_as_datetime(record['Trade Date'], 0)
-    r['SettlementDate'] = xldate_as_datetime(record['Settlement Date'], 0)
-    r['Commission Code 1'] = 'Broker Commission'
-    r['Commission Amt 1'] = record['Commission']
-    r['Strategy'] = 'TRADING'
-
-    r['tradeTime'] = record['Trade Time']   # to be used for sorting
-
-    # Convert to integer if possible, sometimes if the quantity of a futures
-    # contract is a float (like 15.0), BLoomberg may generate an error.
-    if r['Quantity'].is_integer():
-        r['Quantity'] = int(r['Quantity'])
-
-    return r
+    return TradeRecord(record['Contract'], getTradeSide(record), toQuantity(record['Lots'])
+                        , record['Trade Price'], excelDate(record['Trade Date'])
+                        , excelDate(record['Settlement Date']), 'Broker Commission'
+                        , record['Commission'], 'TRADING', record['Trade Time'])
 
 
 
@@ -362,16 +427,14 @@ def getTradeSide(record):
 
 def sortByTradeTime(records):
     """
-    [List] records => [List] new records
+    [Iterable] records => [Iterable] records
 
     Sort the list of records by their trade date and time, the earlier trades 
     are put in front. Here we assume the trade date is always the same, therefore
-    we just sort by trade time.
+    we just sort by trade time. A large file is sorted out of memory, see
+    sorting.py.
     """
-    def takeTradeTime(record):
-        return record['tradeTime']
-
-    return sorted(records, key=takeTradeTime)
+    return sortRecords(records, attrgetter('TradeTime'))
 
 
 
@@ -383,7 +446,7 @@ def getDateFromFilename(file):
     The date is of the form "yyyymmdd", retrieve it and convert it to Datetime 
     format.
     """
-    return stringToDate(file.split('\\')[-1].split('.')[0].split()[-1])
+    return stringToDate(fileNameWithoutPath(file).split('.')[0].split()[-1])
 
 
 
@@ -397,6 +460,14 @@ if __name__ == '__main__':
     parser.add_argument('file', metavar='input file', type=str)
     parser.add_argument('--type', metavar='file type', choices=['t', 'pc'], 
                         default='pc')
+    parser.add_argument('--no-cache', action='store_true'
+                        , help='parse the input file even if it is in cache')
+    parser.add_argument('--grouping', metavar='trade grouping'
+                        , choices=['openclose', 'box'], default='openclose')
+    parser.add_argument('--aggregate', action='store_true'
+                        , help='merge partial fills into one ticket')
+    parser.add_argument('--ledger', action='store_true'
+                        , help='split trades that both close and open a position')
     args = parser.parse_args()
 
     """
@@ -408,11 +479,19 @@ if __name__ == '__main__':
                                           , default is 'pc')
     """
     import sys
+    if args.no_cache:
+        setCacheEnabled(False)
+    if args.aggregate:
+        setAggregationEnabled(True)
+    if args.ledger:
+        setLedgerEnabled(True)
+
     if args.file == None:
         print('input file name is missing')
         sys.exit(1)
     elif args.type == 't':
-        processTradeFile(join(get_current_path(), args.file), get_current_path())
+        processTradeFile(join(get_current_path(), args.file), get_current_path()
+                        , args.grouping)
     else:
         processCashPositionFile(join(get_current_path(), args.file), get_current_path())
 
@@ -7,10 +7,23 @@
 #
 
 from utils.utility import writeCsv
-from IB.utility import get_current_path, writeTradeFiles, writeCashFile, \
-						writePositionFile, toOpenCloseGroup, fileNameWithoutPath
-from os.path import join
-import csv, logging, datetime
+from IB.utility import get_current_path, writeTradeRecords, writeCashFile, \
+						writePositionFile, fileNameWithoutPath, \
+						tickerCache, tickerCacheInfo, timed, timedStage, countRows, \
+						TradeRecord, PositionRecord, CashRecord, toQuantity, \
+						writePartitionedTradeRecords, writePartitionedFiles
+from IB.configure import getIBPartition, getAccountPortfolios
+from IB.decode import toDate, toDateTime
+from IB.cache import cachedRecords, setEnabled as setCacheEnabled
+from IB.sorting import sortRecords
+from IB.fills import aggregateFills, aggregatePartitionedFills, \
+						setEnabled as setAggregationEnabled
+from os.path import join, getsize
+from operator import itemgetter, attrgetter
+from multiprocessing import Pool
+from heapq import merge
+from io import TextIOWrapper, BytesIO
+import csv, logging
 logger = logging.getLogger(__name__)
 
 
@@ -24,9 +37,82 @@ class InvalidSymbol(Exception):
 class InvalidTradeSide(Exception):
 	pass
 
+class MissingColumn(Exception):
+	pass
+
+class UnmappedAccount(Exception):
+	pass
 
 
-def processCashPositionFile(file, outputDir=get_current_path()):
+
+# The columns used to create a Bloomberg ticker, see createTicker()
+TICKER_FIELDS = ('AssetClass', 'CurrencyPrimary', 'Symbol', 'UnderlyingSymbol', 
+					'Multiplier', 'Description')
+
+# The columns read by toTradeRecord(), toSortedRecords(), toPositionRecord()
+# and toCashRecord(), other columns in the flex file are not loaded.
+TRADE_FIELDS = TICKER_FIELDS + ('Buy/Sell', 'Code', 'Quantity', 'Price', 
+					'TradeDate', 'SettleDate', 'Commission', 'Date/Time')
+
+POSITION_FIELDS = TICKER_FIELDS + ('Quantity', 'ReportDate')
+
+CASH_FIELDS = ('CurrencyPrimary', 'EndingSettledCash', 'ToDate')
+
+# the account column, to partition a file by account and date
+ACCOUNT_FIELD = 'ClientAccountID'
+
+# trades of other asset classes are ignored, see README
+TRADE_ASSET_CLASSES = ('FUT', 'STK')
+
+# mapping (underlying, multiplier) to Bloombert Ticker's first 2 letters 
+# plus type (index or comdty)
+FUTURES_MAP = {
+	('HSI', 50): ('HI', 'Index'),
+	('MHI', 10): ('HU', 'Index'), 		# mini Hang Seng index futures
+	('DAX', 25): ('GX', 'Index'),		# DAX index futures
+	('DAX',  5): ('DFW', 'Index'),		# mini DAX index
+	('ES' , 50): ('ES', 'Index'),		# E-Mini S&P500 index futures
+	('NQ' , 20): ('NQ', 'Index'),		# E-Mini NASDAQ 100 index futures
+	('CL' , 1000): ('CL', 'Comdty'),	# Light Sweet Crude Oil (WTI)
+	('PL' , 50): ('PL', 'Comdty'),		# Platinum futures
+	('RB' , 42000): ('XB', 'Comdty'),	# Gasoline RBOB futures (NYMEX)
+	('RBOB',42000): ('PG', 'Comdty'),	# Gasoline RBOB futures (ICE)
+	('HO' , 42000): ('HO', 'Comdty'),	# ULSD futures (NYMEX)
+	('QG' , 2500) : ('EO', 'Comdty'), 	# E-Mini Natural Gas futures
+	('ZS' , 5000) : ('S ', 'Comdty'),	# Soybean
+	('GC' , 100): ('GC', 'Comdty'),		# Gold
+	('XINA50' , 1): ('XU', 'Index'),	# FTSE CHINA A50 Index
+	('NIFTY', 2): ('IH', 'Index')		# NIFTY Index traded on SGX
+}
+
+# mapping month to Bloomberg Ticker's 3rd letter for futures contract
+MONTH_MAP = {
+	'JAN': 'F',
+	'FEB': 'G',
+	'MAR': 'H',
+	'APR': 'J',
+	'MAY': 'K',
+	'JUN': 'M',
+	'JUL': 'N',
+	'AUG': 'Q',
+	'SEP': 'U',
+	'OCT': 'V',
+	'NOV': 'X',
+	'DEC': 'Z'
+}
+
+# The factor to multiply to IB price to become Bloomberg price, keyed by the
+# first 2 letters and type of the Bloomberg ticker, see priceFactor()
+PRICE_FACTOR = {
+	('XB', 'Comdty'): 100,	# IB multipler 42000, Bloomberg multipler 420
+	('PG', 'Comdty'): 100,	# IB multipler 42000, Bloomberg multipler 420
+	('HO', 'Comdty'): 100,	# IB multipler 42000, Bloomberg multipler 420
+	('S ', 'Comdty'): 100	# IB multipler 5000, Bloomberg multipler 50
+}
+
+
+
+def processCashPositionFile(file, outputDir=get_current_path(), partition=None):
     """
     [String] cash or position file => [String] output file
 
@@ -35,9 +121,23 @@ def processCashPositionFile(file, outputDir=get_current_path()):
 
     The rule is: cash file name always starts with 'cash', position file
     name always starts with 'position'.
+
+    partition: if True, write a file for each account and date in the file,
+    and return the list of them. None means follow the config file.
     """
     logger.info('processCashPositionFile(): {0}'.format(file))
-    if isCashFile(file):
+    if partition == None:
+        partition = getIBPartition()
+
+    if partition and isCashFile(file):
+        return writePartitionedFiles(writeCashFile
+                    , createPartitionedRecords(file, CASH_FIELDS, toCashRecord)
+                    , outputDir)
+    elif partition and isPositionFile(file):
+        return writePartitionedFiles(writePositionFile
+                    , createPartitionedRecords(file, POSITION_FIELDS, toPositionRecord)
+                    , outputDir)
+    elif isCashFile(file):
         return writeCashFile('40006-B', createCashRecords(file), 
         							outputDir, getDateFromFilename(file))
     elif isPositionFile(file):
@@ -82,19 +182,38 @@ def isPositionFile(file):
 
 
 
-def processTradeFile(file, outputDir=get_current_path()):
+def processTradeFile(file, outputDir=get_current_path(), engine='python',
+						grouping='openclose', jobs=1, partition=None):
 	"""
-	[String] trade file, [String] outputDir => [List] output file names
+	[String] trade file, [String] outputDir, [String] engine,
+		[String] grouping, [Int] jobs, [Bool] partition
+		=> [List] output file names
 	
 	read the trade file, convert it to trade records and write it to
 	a list of output csv files, to be uploaded by Bloomberg.
+
+	engine is either 'python' or 'numpy', see createTradeRecords().
+	grouping is either 'openclose' or 'box', see utility.groupRecords().
+	jobs is the number of processes to parse the file, see createTradeRecords().
+
+	partition: if True, the trades of each account and trade date in the file
+	go to their own trade files, in one pass over the file, for the portfolio
+	of the account (section [accounts] in the config file). engine and jobs
+	are not used then. None means follow the config file. If False, the file
+	is for one account and the date in the file name.
 	"""
 	logger.info('processTradeFile(): {0}'.format(file))
+	if partition == None:
+		partition = getIBPartition()
+
+	if partition:
+		return writePartitionedTradeRecords(
+					aggregatePartitionedFills(createPartitionedTradeRecords(file))
+					, grouping, outputDir, 'IB-QUANT')
 
-	return writeTradeFiles(
-				toOpenCloseGroup(
-					createTradeRecords(file)
-				)
+	outputFiles = writeTradeRecords(
+				aggregateFills(createTradeRecords(file, engine, jobs))
+				, grouping
 				, outputDir
 				# , 'TEST6D'
 				# , 'BB'
@@ -103,34 +222,108 @@ def processTradeFile(file, outputDir=get_current_path()):
                 , getDateFromFilename(file)
 			)
 
+	logger.debug('processTradeFile(): ticker cache (hits, misses, entries) {0}'
+					.format(tickerCacheInfo()['IB']))
+	return outputFiles
+
 
 
+@cachedRecords
 def createPositionRecords(file):
 	"""
 	[String] file => [List] position records
 	"""
-	return list(map(toPositionRecord, fileToRecords(file)))
+	return list(map(toPositionRecord, fileToRows(file, POSITION_FIELDS)))
 
 
 
+@cachedRecords
 def createCashRecords(file):
 	"""
 	[String] file => [List] cash records
 	"""
-	return list(filter(lambda r: r != None, map(toCashRecord, fileToRecords(file))))
+	return list(filter(lambda r: r != None, map(toCashRecord, fileToRows(file, CASH_FIELDS))))
 
 
 
-def createTradeRecords(file):
+@cachedRecords
+def createTradeRecords(file, engine='python', jobs=1):
 	"""
-	[String] file => [Iterable] trade records
+	[String] file, [String] engine, [Int] jobs => [Iterable] trade records
+
+	engine 'numpy' uses the columnar engine in columnar.py, which gives the
+	same trade records. It is deprecated: both engines spend most of their
+	time parsing the csv file, and with slotted trade records the python
+	engine is as fast or faster.
+
+	With the python engine and jobs > 1, the file is parsed by that many
+	processes, see createTradeRecordsInParallel().
 	"""
-	return map(toNewTradePrice
-			  , map(toTradeRecord, 
-					toSortedRecords(
-						filter(lambda r: r['AssetClass'] in ['FUT', 'STK']
-							  , fileToRecords(file)
-						))))
+	if engine == 'numpy':
+		logger.warning('createTradeRecords(): the numpy engine is deprecated, '
+						'use the python engine')
+		from IB.columnar import createTradeRecords as createColumnarTradeRecords
+		return createColumnarTradeRecords(file)
+	if jobs > 1:
+		return createTradeRecordsInParallel(file, jobs)
+
+	records = timed('transform', map(toTradeRecord
+				, timed('read', fileToRows(file, TRADE_FIELDS, TRADE_ASSET_CLASSES))))
+	with timedStage('sort'):
+		return toSortedRecords(records)
+
+
+
+def createPartitionedTradeRecords(file):
+	"""
+	[String] file => [Iterable] ((portfolio, trade date), trade record) pairs,
+		sorted by trade time as createTradeRecords() does.
+	"""
+	toPortfolio = portfolioMapper()
+	def toPair(row):
+		record = toTradeRecord(row)
+		return (toPortfolio(row[ACCOUNT_FIELD]), record.TradeDate), record
+
+	pairs = timed('transform', map(toPair, timed('read'
+				, fileToRows(file, TRADE_FIELDS + (ACCOUNT_FIELD,), TRADE_ASSET_CLASSES))))
+	with timedStage('sort'):
+		return sortRecords(pairs, lambda pair: pair[1].TradeTime)
+
+
+
+def createPartitionedRecords(file, fields, toRecord):
+	"""
+	[String] file, [Tuple] fields, [Function] toRecord
+		=> [List] ((portfolio, date), record) pairs
+
+	toRecord: toCashRecord or toPositionRecord, a row for which it gives None
+	is skipped.
+	"""
+	toPortfolio = portfolioMapper()
+	def toPair(row):
+		record = toRecord(row)
+		if record == None:
+			return None
+		return (toPortfolio(row[ACCOUNT_FIELD]), record.Date), record
+
+	return list(filter(lambda pair: pair != None
+				, map(toPair, fileToRows(file, fields + (ACCOUNT_FIELD,)))))
+
+
+
+def portfolioMapper():
+	"""
+	=> [Function] IB account => portfolio, as in section [accounts] of the
+		config file, raises UnmappedAccount for an account not there.
+	"""
+	portfolios = getAccountPortfolios()
+	def toPortfolio(account):
+		try:
+			return portfolios[account.lower()]
+		except KeyError:
+			raise UnmappedAccount(account)
+
+	return toPortfolio
 
 
 
@@ -147,62 +340,157 @@ def fileToRecords(file):
 
 
 
-def toSortedRecords(records):
+def fileToRows(file, fields, assetClasses=None):
 	"""
-	[Iterable] records => [List] new records
+	[String] file, [Tuple] fields, [Tuple] assetClasses => [Iterable] rows
 
-	sorted the records by 'Date/Time' (execution time), from earliest to latest. 
-	If two records have the same execution time, their order in the original list 
-	is preserved,i.e., whichever comes first in the original list comes first in 
-	the softed list.
+	Read the csv file lazily, each row is a dictionary holding only the columns
+	in fields. The header row is resolved once, so for each row we just pick
+	the columns by position.
+
+	If assetClasses is given, rows whose 'AssetClass' is not in assetClasses
+	are skipped before any dictionary is built.
+	"""
+	with open(file, newline='') as csvfile:
+		reader = csv.reader(csvfile)
+		headers = next(reader, None)
+		if headers == None:	# empty file
+			return
+
+		yield from readerToRows(reader, headers, file, fields, assetClasses)
+
+
+
+def readerToRows(reader, headers, file, fields, assetClasses=None):
 	"""
-	def takeRankDateTime(record):
-		return record['RankDateTime']
+	[csv reader] reader, [List] headers, [String] file, [Tuple] fields,
+		[Tuple] assetClasses => [Iterable] rows
 
+	The rows of the reader, as fileToRows() gives them. headers is the header
+	row of the file, the reader gives the rows after it.
+	"""
+	# like csv.DictReader, a missing column is an error only when a row
+	# needs it, so a file with headers only still gives empty records.
+	missing = [f for f in fields if not f in headers]
+	if assetClasses != None and not 'AssetClass' in headers:
+		missing.append('AssetClass')
 
-	def toNewRecord(recordWithIndex):
-		i, record = recordWithIndex
-		r = duplicateRecord(record)
-		r['RankDateTime'] = (toDateTime(record['Date/Time']), i)
-		return r
+	if missing == []:
+		getColumns = itemgetter(*[headers.index(f) for f in fields])
+	if assetClasses != None and missing == []:
+		assetClassIndex = headers.index('AssetClass')
 
+	width = len(headers)
+	for row in reader:
+		if row == []:	# blank line, skipped like csv.DictReader does
+			continue
+		if missing != []:
+			raise MissingColumn('{0}: {1}'.format(file, missing))
+		if len(row) < width:
+			row = row + [None] * (width - len(row))
+		if assetClasses != None and not row[assetClassIndex] in assetClasses:
+			continue
 
-	return sorted(
-				map(toNewRecord, enumerate(records))
-				, key=takeRankDateTime)
+		yield dict(zip(fields, getColumns(row)))
 
 
 
-def duplicateRecord(record):
+def createTradeRecordsInParallel(file, jobs):
 	"""
-	[Dictionary] record => [Dictionary] new record
+	[String] file, [Int] jobs => [Iterable] trade records
 
-	Duplicate the record to a new record.
+	Same trade records as createTradeRecords(file), for a very large file.
+	The rows are split into byte ranges (see splitFile()), each range is
+	converted and sorted in a worker process, then the sorted chunks are
+	merged. The chunks are in file order and heapq.merge() takes a tie from
+	the earlier chunk first, so ties stay in file order.
 	"""
-	newRecord = {}
-	for key in record:
-		newRecord[key] = record[key]
+	with timedStage('read'):
+		headers, ranges = splitFile(file, jobs)
+	chunks = [(file, headers, start, end) for (start, end) in ranges]
 
-	return newRecord
+	with timedStage('transform'):
+		if len(chunks) > 1:
+			with Pool(len(chunks)) as pool:
+				sortedChunks = pool.map(chunkToRecords, chunks)
+		else:
+			sortedChunks = list(map(chunkToRecords, chunks))
+	countRows('transform', sum(map(len, sortedChunks)))
 
+	return timed('sort', merge(*sortedChunks, key=attrgetter('TradeTime')))
 
 
-def toDateTime(dtString):
+
+# a file is split into byte ranges of at least this size, see splitFile()
+MIN_CHUNK_SIZE = 1024*1024
+
+def splitFile(file, n):
+	"""
+	[String] file, [Int] n => [List] headers, [List] (start, end) byte ranges
+
+	Split the rows after the header row into at most n byte ranges of about
+	the same size, each starting at the beginning of a row. Rows are split at
+	line breaks, no field of a flex file has a line break in it.
+	"""
+	with open(file, newline='') as csvfile:
+		headers = next(csv.reader(csvfile), None)
+	if headers == None:	# empty file
+		return None, []
+
+	size = getsize(file)
+	n = max(1, min(n, size // MIN_CHUNK_SIZE))
+	with open(file, 'rb') as f:
+		f.readline()	# header row
+		offsets = [f.tell()]
+		for i in range(1, n):
+			f.seek(max(offsets[-1], size * i // n))
+			f.readline()	# to the start of the next row
+			offsets.append(f.tell())
+
+	offsets.append(size)
+	return headers, [(start, end) for (start, end) in zip(offsets, offsets[1:])
+						if end > start]
+
+
+
+def chunkToRecords(chunk):
+	"""
+	[Tuple] (file, headers, start, end) => [List] trade records
+
+	Convert the rows in the byte range of the file to trade records, sorted
+	by 'TradeTime'. Run in a worker process, see createTradeRecordsInParallel().
+	"""
+	file, headers, start, end = chunk
+	with open(file, 'rb') as f:
+		f.seek(start)
+		data = f.read(end - start)
+
+	reader = csv.reader(TextIOWrapper(BytesIO(data), newline=''))
+	return sorted(map(toTradeRecord
+					, readerToRows(reader, headers, file, TRADE_FIELDS, TRADE_ASSET_CLASSES))
+				, key=attrgetter('TradeTime'))
+
+
+
+def toSortedRecords(records):
 	"""
-	[String] dtString => [datetime] datetime
+	[Iterable] trade records => [Iterable] trade records
 
-	dtString is a string of format "yyyymmdd;hhmmss", convert it to a datetime
-	object.
+	sorted the records by 'TradeTime' (execution time), from earliest to latest. 
+	If two records have the same execution time, their order in the original list 
+	is preserved. The records are not copied. A large file is sorted out of
+	memory, see sorting.py.
 	"""
-	dateString, hourString = dtString.split(';')
-	return datetime.datetime(int(dateString[0:4]), int(dateString[4:6]), int(dateString[6:]),
-							int(hourString[0:2]), int(hourString[2:4]), int(hourString[4:]))
+	return sortRecords(records, attrgetter('TradeTime'))
 
 
 
-def toNewTradePrice(record):
+def priceFactor(ticker):
 	"""
-	[Dict] record => [Dict] new record
+	[String] ticker => [Int] factor
+
+	The factor to multiply to IB price to become Bloomberg price, 1 if no
+	adjustment is needed.
 
 	Sometimes, IB's multipler is different from Bloomberg's, therefore IB's price
 	is different from the price to upload to Bloomberg AIM. For example, soybean
@@ -210,83 +498,63 @@ def toNewTradePrice(record):
 	Bloomberg has a multipler of 50, so the price to upload to AIM should be 
 	times 100, which is 885.43. This usually happens with commodity futures,
 	such as Soybean, Gaoline, Ulta Low Sulful Diesel (old Heating Oil).
-	"""
-	def recordType(ticker):
-		"""
-		Find out the type of the item in the trade record, for example, it is
-		'S F9 Comdty', then return ('S ', 'Comdty'), so that we know it is
-		Soybean commodity futures.
-		"""
-		tokens = ticker.split()
-		sector = tokens[-1]
-		return (ticker[0:2], sector)
-
-	# The factor to multiply to IB price to become Bloomberg price
-	f_map = {
-		('XB', 'Comdty'): 100,	# IB multipler 42000, Bloomberg multipler 420
-		('PG', 'Comdty'): 100,	# IB multipler 42000, Bloomberg multipler 420
-		('HO', 'Comdty'): 100,	# IB multipler 42000, Bloomberg multipler 420
-		('S ', 'Comdty'): 100	# IB multipler 5000, Bloomberg multipler 50
-	}
 
-	r = duplicateRecord(record)
-	try:
-		factor = f_map[recordType(record['BloombergTicker'])]
-		r['Price'] = factor * record['Price']
-	except:
-		pass 	# no adjustment
-
-	return r
+	The type of the item is the first 2 letters of the ticker plus the sector,
+	for example, for 'S F9 Comdty' it is ('S ', 'Comdty'), so that we know it
+	is Soybean commodity futures.
+	"""
+	return PRICE_FACTOR.get((ticker[0:2], ticker[ticker.rfind(' ')+1:]), 1)
 
 
 
 def toTradeRecord(record):
 	"""
-	[Dictionary] record => [Dictionary] tradeRecord
+	[Dictionary] record => [TradeRecord] tradeRecord
 
-	Create a new trade record from the existing record, the trade record has 8
-	fields:
+	Create a new trade record from the existing record, the trade record has
+	the below fields:
 
 	1. BloombergTicker
 	2. Side
 	3. Quantity
-	4. Price
+	4. Price: IB price times the price factor of the ticker, see priceFactor()
 	5. TradeDate: of type datetime
 	6. SettlementDate: of type datetime
 	7. Commission Code 1: fixed to 'Broker Commission'
 	8. Commission Amt 1: total commission
 	9. Strategy: strategy of the trade
+	10. TradeTime: execution time ('Date/Time'), of type datetime
 	"""
-	r = {}
-	r['BloombergTicker'] = createTicker(record)
-	r['Side'] = createSide(record['Buy/Sell'], record['Code'])
-	r['Quantity'] = abs(float(record['Quantity']))
-	r['Price'] = float(record['Price'])
-	r['TradeDate'] = stringToDate(record['TradeDate'])
-	r['SettlementDate'] = stringToDate(record['SettleDate'])
-
-	# check Bloomberg 'CFTK' page for all possible commission codes
-	# here we simply put the sum of all commissions, tax, exchange fees
-	# under the name of 'Broker Commission'
-	r['Commission Code 1'] = 'Broker Commission'
-	r['Commission Amt 1'] = abs(float(record['Commission']))
+	tradeTime = toDateTime(record['Date/Time'])
+	ticker, factor = resolveTicker(record)
+	price = float(record['Price'])
+	if factor != 1:
+		price = factor * price
 
-	# in our AIM configuration, there must be a 'Strategy' tag for each trade,
-	# so we just put TRADING as the default tag for all trades in IB.
-	r['Strategy'] = 'TRADING'
+	return TradeRecord(
+		ticker
+		, createSide(record['Buy/Sell'], record['Code'])
+		, toQuantity(abs(float(record['Quantity'])))
+		, price
+		, toDate(record['TradeDate'])
+		, toDate(record['SettleDate'])
 
-	# Convert to integer if possible, sometimes if the quantity of a futures
-	# contract is a float (like 15.0), BLoomberg may generate an error.
-	if r['Quantity'].is_integer():
-		r['Quantity'] = int(r['Quantity'])
+		# check Bloomberg 'CFTK' page for all possible commission codes
+		# here we simply put the sum of all commissions, tax, exchange fees
+		# under the name of 'Broker Commission'
+		, 'Broker Commission'
+		, abs(float(record['Commission']))
 
-	return r
+		# in our AIM configuration, there must be a 'Strategy' tag for each trade,
+		# so we just put TRADING as the default tag for all trades in IB.
+		, 'TRADING'
+		, tradeTime)
 
 
 
 def toPositionRecord(record):
 	"""
-	[Dictionary] record => [Dictionary] position record
+	[Dictionary] record => [PositionRecord] position record
 
 	Create a new position record from the existing record, the record has the
 	below fields:
@@ -296,18 +564,14 @@ def toPositionRecord(record):
 	3. Currency
 	4. Date: of type datetime
 	"""
-	r = {}
-	r['BloombergTicker'] = createTicker(record)
-	r['Quantity'] = float(record['Quantity'])
-	r['Currency'] = record['CurrencyPrimary']
-	r['Date'] = stringToDate(record['ReportDate'])
-	return r
+	return PositionRecord(createTicker(record), float(record['Quantity'])
+							, record['CurrencyPrimary'], toDate(record['ReportDate']))
 
 
 
 def toCashRecord(record):
 	"""
-	[Dictionary] record => [Dictionary] cash record
+	[Dictionary] record => [CashRecord] cash record
 
 	Create a new cash record from the existing record, the record has 3
 	fields:
@@ -319,11 +583,8 @@ def toCashRecord(record):
 	if record['CurrencyPrimary'] == 'BASE_SUMMARY':
 		return None
 
-	r = {}
-	r['Quantity'] = float(record['EndingSettledCash'])
-	r['Currency'] = record['CurrencyPrimary']
-	r['Date'] = stringToDate(record['ToDate'])
-	return r
+	return CashRecord(record['CurrencyPrimary'], float(record['EndingSettledCash'])
+						, toDate(record['ToDate']))
 
 
 
@@ -334,63 +595,41 @@ def createTicker(record):
 	Create a Bloomberg ticker based on the record. It only works for certain
 	futures type now.
 	"""
+	return resolveTicker(record)[0]
+
+
+
+def resolveTicker(record):
+	"""
+	[Dictionary] record => ([String] ticker, [Int] price factor)
+
+	The Bloomberg ticker of the record and the factor to multiply to its IB
+	price, see priceFactor().
+	"""
 	if record['AssetClass'] == 'STK' and record['CurrencyPrimary'] == 'USD' and \
 		record['Symbol'] == 'SPY':
 
-		return 'SPY US Equity'
+		return 'SPY US Equity', 1
 	elif record['AssetClass'] == 'FUT':
-		return createFuturesTicker(record)
+		return resolveFuturesTicker(record['UnderlyingSymbol'], record['Multiplier']
+									, record['Description'])
 	else:
 		raise UnhandledTradeType('record: {0}'.format(record))
 
 
 
-def createFuturesTicker(record):
+@tickerCache('IB')
+def resolveFuturesTicker(underlying, multiplier, description):
 	"""
-	[Dictionary] record => [String] ticker
-
-	Create a Bloomberg ticker for record of futures type.
-	"""
-	bMap = {	# mapping (underlying, multiplier) to Bloombert Ticker's 
-				# first 2 letters plus type (index or comdty)
-
-		('HSI', 50): ('HI', 'Index'),
-		('MHI', 10): ('HU', 'Index'), 		# mini Hang Seng index futures
-		('DAX', 25): ('GX', 'Index'),		# DAX index futures
-		('DAX',  5): ('DFW', 'Index'),		# mini DAX index
-		('ES' , 50): ('ES', 'Index'),		# E-Mini S&P500 index futures
-		('NQ' , 20): ('NQ', 'Index'),		# E-Mini NASDAQ 100 index futures
-		('CL' , 1000): ('CL', 'Comdty'),	# Light Sweet Crude Oil (WTI)
-		('PL' , 50): ('PL', 'Comdty'),		# Platinum futures
-		('RB' , 42000): ('XB', 'Comdty'),	# Gasoline RBOB futures (NYMEX)
-		('RBOB',42000): ('PG', 'Comdty'),	# Gasoline RBOB futures (ICE)
-		('HO' , 42000): ('HO', 'Comdty'),	# ULSD futures (NYMEX)
-		('QG' , 2500) : ('EO', 'Comdty'), 	# E-Mini Natural Gas futures
-		('ZS' , 5000) : ('S ', 'Comdty'),	# Soybean
-		('GC' , 100): ('GC', 'Comdty'),		# Gold
-		('XINA50' , 1): ('XU', 'Index'),	# FTSE CHINA A50 Index
-		('NIFTY', 2): ('IH', 'Index')		# NIFTY Index traded on SGX
-	}
-
-	mMap = {	# mapping month to Bloomberg Ticker's 3rd letter
-				# for futures contract
-		'JAN': 'F',
-		'FEB': 'G',
-		'MAR': 'H',
-		'APR': 'J',
-		'MAY': 'K',
-		'JUN': 'M',
-		'JUL': 'N',
-		'AUG': 'Q',
-		'SEP': 'U',
-		'OCT': 'V',
-		'NOV': 'X',
-		'DEC': 'Z'
-	}
+	[String] underlying, [String] multiplier, [String] description
+		=> ([String] ticker, [Int] price factor)
 
-	month, year = getMonthYear(record['Description'])
-	prefix, suffix = bMap[(record['UnderlyingSymbol'], int(record['Multiplier']))]
-	return prefix + mMap[month] + year[1] + ' ' + suffix
+	Memoized, so the mapping is worked out once per contract.
+	"""
+	month, year = getMonthYear(description)
+	prefix, suffix = FUTURES_MAP[(underlying, int(multiplier))]
+	ticker = prefix + MONTH_MAP[month] + year[1] + ' ' + suffix
+	return ticker, priceFactor(ticker)
 
 	
 
@@ -451,10 +690,9 @@ def stringToDate(dateString):
 	"""
 	[String] dateString => [datetime] date
 
-	dateString is of format: yyyymmdd
+	dateString is of format: yyyymmdd, see decode.toDate()
 	"""
-	return datetime.datetime(int(dateString[0:4]), int(dateString[4:6]), 
-								int(dateString[6:]))
+	return toDate(dateString)
 
 
 
@@ -467,7 +705,7 @@ def getDateFromFilename(file):
     convert it to Datetime format.
     """
     # print(file)
-    return stringToDate(file.split('\\')[-1].split('.')[3])
+    return toDate(fileNameWithoutPath(file).split('.')[3])
 
 
 
@@ -481,6 +719,19 @@ if __name__ == '__main__':
 	parser.add_argument('file', metavar='input file', type=str)
 	parser.add_argument('--type', metavar='file type', choices=['t', 'pc'], 
 						default='pc')
+	parser.add_argument('--no-cache', action='store_true'
+						, help='parse the input file even if it is in cache')
+	parser.add_argument('--engine', metavar='trade conversion engine'
+						, choices=['python', 'numpy'], default='python'
+						, help='numpy is deprecated, it is no faster than python')
+	parser.add_argument('--grouping', metavar='trade grouping'
+						, choices=['openclose', 'box'], default='openclose')
+	parser.add_argument('--jobs', type=int, default=1
+						, help='number of processes to parse a large trade file')
+	parser.add_argument('--partition', action='store_true', default=None
+						, help='write files for each account and date in the file')
+	parser.add_argument('--aggregate', action='store_true'
+						, help='merge partial fills into one ticket')
 	args = parser.parse_args()
 
 	"""
@@ -492,10 +743,17 @@ if __name__ == '__main__':
 										  , default is 'pc')
 	"""
 	import sys
+	if args.no_cache:
+		setCacheEnabled(False)
+	if args.aggregate:
+		setAggregationEnabled(True)
+
 	if args.file == None:
 		print('input file name is missing')
 		sys.exit(1)
 	elif args.type == 't':
-		processTradeFile(join(get_current_path(), args.file))
+		processTradeFile(join(get_current_path(), args.file), get_current_path()
+						, args.engine, args.grouping, args.jobs, args.partition)
 	else:
-		processCashPositionFile(join(get_current_path(), args.file), get_current_path())
\ No newline at end of file
+		processCashPositionFile(join(get_current_path(), args.file), get_current_path()
+								, args.partition)
\ No newline at end of file
@@ -0,0 +1,284 @@
+# coding=utf-8
+#
+# A position ledger per portfolio, to split HGNH trades that both close and
+# open a position (section [ledger] in ib.config).
+#
+# HGNH marks a trade either open or close, for example, sell 15 against a
+# long 10 comes as one trade, though it closes 10 and opens 5. To tell, we
+# need the position of the ticker before the trade. The ledger keeps each
+# portfolio's position per ticker in daily snapshots in a local SQLite file:
+#
+# 1. A trade file of a day starts from the latest snapshot before that day,
+#	replays its trades in trade time order, then saves the positions as the
+#	snapshot of the day. So a day takes time in proportion to its trades,
+#	and converting the same file again gives the same result.
+#
+# 2. A position file of a day is saved as the snapshot of the day, replacing
+#	the one from trades. Positions from the broker are right by definition,
+#	so the ledger puts itself right every day a position file comes. The
+#	worker converts trade files only, position files go to the ledger when
+#	converted with "python henghua.py <file> --ledger".
+#
+# If the latest snapshot is older than the previous trade date, a trade file
+# was missed and the positions cannot be trusted, so the trades are not split
+# until the ledger is put right by a position file.
+#
+# A trade against a position it reduces is relabelled close, the part beyond
+# the position, if any, becomes an opening trade, with the commission split
+# in proportion. A trade that adds to a position is relabelled open. A trade
+# against a flat position keeps the broker's label, so a ticker the ledger
+# does not know yet is handled as before.
+#
+
+from IB.configure import getLedgerEnabled, getLedgerPath, getLedgerKeepDays, \
+						getLedgerCommissionDecimals
+from IB.utility import timed, TradeRecord, toQuantity, setFeatureEnabled, \
+						isFeatureEnabled
+from functools import partial
+from datetime import timedelta
+import sqlite3, logging
+logger = logging.getLogger(__name__)
+
+
+
+# turn the ledger on or off for this process, see utility.setFeatureEnabled()
+setEnabled = partial(setFeatureEnabled, 'ledger')
+isEnabled = partial(isFeatureEnabled, 'ledger', getLedgerEnabled)
+
+
+
+# side of a trade that adds to (buy) or takes away from (sell) the position,
+# when it closes or opens a position
+CLOSE_SIDE = {True: 'Cover', False: 'Sell'}
+OPEN_SIDE = {True: 'Buy', False: 'Short'}
+
+
+
+def splitTrades(portfolio, date, records):
+	"""
+	[String] portfolio, [Datetime] date, [Iterable] trade records sorted by
+		trade time => [Iterable] trade records, those that both close and
+		open a position split in two, if the ledger is enabled, otherwise the
+		records unchanged.
+
+	The positions after the trades are saved as the snapshot of the date
+	when the last record is taken.
+	"""
+	if not isEnabled():
+		return records
+
+	return timed('ledger', replayTrades(portfolio, date, records))
+
+
+
+def replayTrades(portfolio, date, records):
+	positions = loadPositions(portfolio, date)
+	if positions == None:
+		yield from records
+		return
+
+	for record in records:
+		yield from splitTrade(record, positions)
+
+	savePositions(portfolio, date, positions, 'trade')
+
+
+
+def splitTrade(record, positions):
+	"""
+	[TradeRecord] record, [Dictionary] positions (ticker => quantity)
+		=> [List] the record, or a closing and an opening trade
+
+	The closing trade is the record changed in place, the position of the
+	ticker is updated.
+	"""
+	ticker, quantity = record['BloombergTicker'], record['Quantity']
+	isBuy = record['Side'] in ('Buy', 'Cover')
+	position = positions.get(ticker, 0)
+	positions[ticker] = position + quantity if isBuy else position - quantity
+
+	closable = -position if isBuy else position
+	if closable == 0:	# flat, or a ticker the ledger does not know
+		return [record]
+	if closable < 0:	# adds to the position
+		record['Side'] = OPEN_SIDE[isBuy]
+		return [record]
+
+	record['Side'] = CLOSE_SIDE[isBuy]
+	if quantity <= closable:
+		return [record]
+
+	logger.debug('splitTrade(): {0} {1} against position {2}'.format(
+					ticker, quantity, position))
+	openLeg = TradeRecord(*record.values())
+	openLeg['Side'] = OPEN_SIDE[isBuy]
+	openLeg['Quantity'] = toQuantity(quantity - closable)
+	record['Quantity'] = toQuantity(closable)
+
+	commission, decimals = record['Commission Amt 1'], getLedgerCommissionDecimals()
+	record['Commission Amt 1'] = round(commission * closable / quantity, decimals)
+	openLeg['Commission Amt 1'] = round(commission - record['Commission Amt 1'], decimals)
+	return [record, openLeg]
+
+
+
+def recordPositions(portfolio, date, records):
+	"""
+	[String] portfolio, [Datetime] date, [Iterable] position records
+		=> save the positions as the snapshot of the date, if the ledger is
+		enabled. An error is logged, not raised, so that the position file
+		is still converted.
+	"""
+	if not isEnabled():
+		return
+
+	positions = {}
+	for record in records:
+		ticker = record['BloombergTicker']
+		positions[ticker] = positions.get(ticker, 0) + record['Quantity']
+
+	try:
+		savePositions(portfolio, date, positions, 'position')
+	except:
+		logger.exception('recordPositions(): ')
+
+
+
+def loadPositions(portfolio, date):
+	"""
+	[String] portfolio, [Datetime] date => [Dictionary] ticker => quantity,
+		of the latest snapshot before the date, empty if there is none.
+
+	If that snapshot is older than the previous trade date, return None, the
+	positions are stale.
+	"""
+	connection = getConnection()
+	dateString = toDateString(date)
+	(snapshotDate,) = connection.execute('SELECT MAX(date) FROM snapshot \
+								WHERE portfolio = ? AND date < ?'
+								, (portfolio, dateString)).fetchone()
+	if snapshotDate == None:
+		logger.warning('loadPositions(): no positions of {0} before {1}'.format(
+						portfolio, dateString))
+		return {}
+
+	if snapshotDate < toDateString(previousTradeDate(date)):
+		logger.warning('loadPositions(): latest positions of {0} before {1} are '
+						'of {2}, trades not split until a position file is '
+						'recorded'.format(portfolio, dateString, snapshotDate))
+		return None
+
+	return dict(connection.execute('SELECT ticker, quantity FROM position \
+									WHERE portfolio = ? AND date = ?'
+									, (portfolio, snapshotDate)))
+
+
+
+def savePositions(portfolio, date, positions, source):
+	"""
+	[String] portfolio, [Datetime] date, [Dictionary] positions, [String]
+		source => save the positions as the snapshot of the date.
+
+	source is 'trade' or 'position', positions from trades do not replace
+	those from a position file of the same date. Flat positions are left out,
+	and only the latest keep_days snapshots of the portfolio are kept.
+	"""
+	connection = getConnection()
+	dateString = toDateString(date)
+	with connection:	# commit, or rollback on error
+		row = connection.execute('SELECT source FROM snapshot \
+								WHERE portfolio = ? AND date = ?'
+								, (portfolio, dateString)).fetchone()
+		if source == 'trade' and row == ('position',):
+			logger.debug('savePositions(): {0} {1} from position file kept'.format(
+							portfolio, dateString))
+			return
+
+		if connection.execute('SELECT 1 FROM snapshot WHERE portfolio = ? \
+								AND date > ?', (portfolio, dateString)).fetchone() != None:
+			logger.warning('savePositions(): {0} has snapshots after {1}, they '
+							'are not updated'.format(portfolio, dateString))
+
+		connection.execute('DELETE FROM position WHERE portfolio = ? AND date = ?'
+							, (portfolio, dateString))
+		connection.execute('REPLACE INTO snapshot (portfolio, date, source) \
+							VALUES (?, ?, ?)', (portfolio, dateString, source))
+		connection.executemany('INSERT INTO position (portfolio, date, ticker, \
+								quantity) VALUES (?, ?, ?, ?)'
+								, [(portfolio, dateString, ticker, quantity)
+									for (ticker, quantity) in positions.items()
+									if quantity != 0])
+		pruneSnapshots(connection, portfolio, getLedgerKeepDays())
+
+
+
+def pruneSnapshots(connection, portfolio, keepDays):
+	"""
+	[Connection] connection, [String] portfolio, [Int] keepDays => delete
+		all but the latest keepDays snapshots of the portfolio.
+	"""
+	row = connection.execute('SELECT date FROM snapshot WHERE portfolio = ? \
+							ORDER BY date DESC LIMIT 1 OFFSET ?'
+							, (portfolio, max(keepDays, 1) - 1)).fetchone()
+	if row != None:
+		for table in ('snapshot', 'position'):
+			connection.execute('DELETE FROM {0} WHERE portfolio = ? AND date < ?'
+								.format(table), (portfolio, row[0]))
+
+
+
+def previousTradeDate(date):
+	"""
+	[Datetime] date => [Datetime] the weekday before the date. Holidays are
+		not known, a snapshot before a holiday is taken as stale.
+	"""
+	date = date - timedelta(days=1)
+	while date.weekday() > 4:
+		date = date - timedelta(days=1)
+	return date
+
+
+
+def toDateString(date):
+	return date.strftime('%Y-%m-%d')
+
+
+
+connection = None
+def getConnection():
+	global connection
+	if connection == None:
+		openLedger(getLedgerPath())
+	return connection
+
+
+
+def openLedger(path):
+	"""
+	[String] path => open the SQLite ledger file as the connection, create
+		the tables if not there.
+	"""
+	global connection
+	closeLedger()
+	logger.info('openLedger(): {0}'.format(path))
+	connection = sqlite3.connect(path)
+	connection.execute('CREATE TABLE IF NOT EXISTS snapshot ( \
+							portfolio TEXT NOT NULL, \
+							date TEXT NOT NULL, \
+							source TEXT, \
+							PRIMARY KEY (portfolio, date))')
+	connection.execute('CREATE TABLE IF NOT EXISTS position ( \
+							portfolio TEXT NOT NULL, \
+							date TEXT NOT NULL, \
+							ticker TEXT NOT NULL, \
+							quantity REAL, \
+							PRIMARY KEY (portfolio, date, ticker))')
+	connection.commit()
+
+
+
+def closeLedger():
+	global connection
+	if connection != None:
+		connection.close()
+		connection = None
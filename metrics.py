@@ -0,0 +1,215 @@
+# coding=utf-8
+#
+# Export worker metrics to a Prometheus textfile, to be picked up by the
+# textfile collector of node exporter (section [metrics] in ib.config).
+#
+# Measurements are collected in memory during a run, then written at the end
+# of the run. As each run is a new process, counters and histograms are kept
+# cumulative by adding the values in the previous file. The file is written
+# to a temp file then renamed, so the collector never sees a partly written
+# file.
+#
+
+from IB.configure import getMetricsEnabled, getMetricsFile
+from os.path import dirname
+import os, re, time, logging
+logger = logging.getLogger(__name__)
+
+
+
+# name => (type, help, histogram buckets)
+METRICS = {
+	'ib_worker_runs_total': ('counter', 'Worker runs.', None),
+	'ib_worker_files_total': ('counter', 'Trade files converted, by broker and status.', None),
+	'ib_worker_rows_total': ('counter', 'Trade records converted, by broker.', None),
+	'ib_worker_conversion_seconds': ('histogram', 'Time to convert a trade file, by broker.'
+									, (0.1, 0.5, 1, 5, 10, 30, 60, 300)),
+	'ib_worker_db_lookup_seconds': ('histogram', 'Time to look up processed files in the registry.'
+									, (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)),
+	'ib_worker_last_run_files': ('gauge', 'Trade files converted in the last run.', None),
+	'ib_worker_last_run_seconds': ('gauge', 'Duration of the last run.', None),
+	'ib_worker_last_run_timestamp_seconds': ('gauge', 'Unix time the last run finished.', None)
+}
+
+
+
+# (name, labels) => value, labels is a tuple of (label, value) pairs. For a
+# histogram, value is a list of bucket counts (the last one is +Inf), then
+# sum, then count.
+values = {}
+
+def incCounter(name, labels=(), n=1):
+	values[(name, labels)] = values.get((name, labels), 0) + n
+
+
+
+def setGauge(name, labels=(), value=0):
+	values[(name, labels)] = value
+
+
+
+def observe(name, labels=(), value=0):
+	"""
+	[String] name, [Tuple] labels, [Float] value => add an observation to
+		the histogram
+	"""
+	buckets = METRICS[name][2]
+	counts = values.setdefault((name, labels), [0] * (len(buckets) + 3))
+	for (i, bound) in enumerate(buckets + (float('inf'),)):
+		if value <= bound:
+			counts[i] = counts[i] + 1
+	counts[-2] = counts[-2] + value
+	counts[-1] = counts[-1] + 1
+
+
+
+def recordResults(results, seconds):
+	"""
+	[List] results, [Float] seconds => record the results of a run, results
+		are tuples (file, status, broker, output, timings) from worker.py.
+	"""
+	incCounter('ib_worker_runs_total')
+	for (file, status, broker, output, timings) in results:
+		incCounter('ib_worker_files_total'
+					, (('broker', broker), ('status', 'ok' if status == 0 else 'fail')))
+		if status == 0:
+			incCounter('ib_worker_rows_total', (('broker', broker),)
+						, timings.get('write', (0, 0))[1])
+			observe('ib_worker_conversion_seconds', (('broker', broker),)
+					, sum(s for (s, _) in timings.values()))
+
+	setGauge('ib_worker_last_run_files', value=len(results))
+	setGauge('ib_worker_last_run_seconds', value=seconds)
+	setGauge('ib_worker_last_run_timestamp_seconds', value=time.time())
+
+
+
+def exportMetrics(results, seconds):
+	"""
+	[List] results, [Float] seconds => record the results of a run and write
+		the metrics file, if metrics are enabled.
+	"""
+	if getMetricsEnabled():
+		recordResults(results, seconds)
+		try:
+			writeMetrics(getMetricsFile())
+		except:
+			logger.exception('exportMetrics(): ')
+
+	values.clear()
+
+
+
+def writeMetrics(file):
+	"""
+	[String] file => write the metrics to the file, counters and histograms
+		added to those in the existing file.
+	"""
+	samples = toSamples(values)
+	for (series, value) in readSamples(file).items():
+		if METRICS.get(familyName(series), ('gauge',))[0] == 'gauge':
+			samples.setdefault(series, value)
+		else:
+			samples[series] = samples.get(series, 0) + value
+
+	lines = []
+	for name in sorted(METRICS):
+		family = sorted((s for s in samples if familyName(s) == name), key=seriesOrder)
+		if family == []:
+			continue
+
+		lines.append('# HELP {0} {1}'.format(name, METRICS[name][1]))
+		lines.append('# TYPE {0} {1}'.format(name, METRICS[name][0]))
+		lines.extend('{0} {1}'.format(s, formatValue(samples[s])) for s in family)
+
+	os.makedirs(dirname(file), exist_ok=True)
+	tempFile = file + '.{0}.tmp'.format(os.getpid())
+	with open(tempFile, 'w', newline='\n') as f:
+		f.write('\n'.join(lines) + '\n')
+	os.replace(tempFile, file)
+
+
+
+def toSamples(values):
+	"""
+	[Dictionary] values => [Dictionary] series => value, where series is
+		a sample line without the value, e.g., 'ib_worker_rows_total{broker="IB"}'
+	"""
+	samples = {}
+	for ((name, labels), value) in values.items():
+		if METRICS[name][0] == 'histogram':
+			bounds = list(map(formatValue, METRICS[name][2])) + ['+Inf']
+			for (bound, count) in zip(bounds, value):
+				samples[toSeries(name + '_bucket', labels + (('le', bound),))] = count
+			samples[toSeries(name + '_sum', labels)] = value[-2]
+			samples[toSeries(name + '_count', labels)] = value[-1]
+		else:
+			samples[toSeries(name, labels)] = value
+
+	return samples
+
+
+
+def toSeries(name, labels):
+	if labels == ():
+		return name
+	else:
+		return name + '{' + ','.join('{0}="{1}"'.format(k, v) for (k, v) in labels) + '}'
+
+
+
+def familyName(series):
+	"""
+	[String] series => [String] metric name, without the _bucket, _sum or
+		_count suffix of histogram samples
+	"""
+	name = series.split('{')[0]
+	for suffix in ('_bucket', '_sum', '_count'):
+		if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+			return name[:-len(suffix)]
+	return name
+
+
+
+def seriesOrder(series):
+	"""
+	[String] series => sort key, histogram buckets in the order of their
+		upper bounds.
+	"""
+	m = re.search(r',?le="([^"]*)"', series)
+	if m == None:
+		return (series, 0)
+	else:
+		return (series[:m.start()] + series[m.end():], float(m.group(1)))
+
+
+
+def formatValue(value):
+	if value == int(value):
+		return str(int(value))
+	else:
+		return repr(float(value))
+
+
+
+SAMPLE_LINE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*(?:\{.*\})?)\s+(\S+)$')
+
+def readSamples(file):
+	"""
+	[String] file => [Dictionary] series => value, of the samples in the
+		metrics file, empty if the file is not there.
+	"""
+	samples = {}
+	try:
+		with open(file) as f:
+			for line in f:
+				m = SAMPLE_LINE.match(line.strip())
+				if m != None:
+					samples[m.group(1)] = float(m.group(2))
+
+	except FileNotFoundError:
+		pass
+	except:
+		logger.exception('readSamples(): {0}'.format(file))
+
+	return samples
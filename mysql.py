@@ -2,12 +2,30 @@
 # 
 # Store some records in MySQL database
 #
+# The table of processed files:
+#
+#	CREATE TABLE file (
+#		file_name VARCHAR(255) NOT NULL PRIMARY KEY,
+#		last_modified DATETIME,
+#		status CHAR(1),
+#		size BIGINT,
+#		hash CHAR(32)
+#	)
+#
+# size and hash were added later, to upgrade an existing table:
+#
+#	ALTER TABLE file ADD COLUMN size BIGINT, ADD COLUMN hash CHAR(32)
+#
 
 import pymysql
-from os.path import join, getmtime
-from time import strftime, localtime
-from IB.configure import getDbName, getDbHost, getDbUser, getDbPassword
-import logging
+from functools import partial
+from contextlib import contextmanager
+from queue import LifoQueue, Empty, Full
+from IB.configure import getDbName, getDbHost, getDbUser, getDbPassword, \
+						getDbPoolSize, getDbConnectTimeout, getDbReadTimeout, \
+						getDbWriteTimeout
+from IB.registry import toDBRecord
+import os, logging
 logger = logging.getLogger(__name__)
 
 
@@ -19,9 +37,8 @@ def lookupLastModifiedTime(file):
 	if lookup does not find any record in database, return None
 	"""
 	try:
-		with getConnection().cursor() as cursor:
-			sql = "SELECT last_modified FROM file WHERE file_name='{0}'".format(file)
-			cursor.execute(sql)
+		with pooledConnection() as connection, connection.cursor() as cursor:
+			cursor.execute("SELECT last_modified FROM file WHERE file_name=%s", (file,))
 			row = cursor.fetchone()
 			if row == None:
 				logger.debug('lookupLastModifiedTime(): {0} not found'.format(file))
@@ -34,6 +51,33 @@ def lookupLastModifiedTime(file):
 
 
 
+def lookupFiles(files):
+	"""
+	[Iterable] files => [Dictionary] file name -> [Dictionary] DB record
+
+	Look up all the files in one query, so that checking a whole folder of
+	files costs one round trip to the database instead of one per file. A DB
+	record has fields 'last_modified', 'size' and 'hash' (size and hash are
+	None for files saved before they were kept). Files not found in database
+	are not in the dictionary.
+	"""
+	files = list(files)
+	if files == []:
+		return {}
+
+	try:
+		with pooledConnection() as connection, connection.cursor() as cursor:
+			sql = "SELECT file_name, last_modified, size, hash FROM file \
+					WHERE file_name IN ({0})".format(', '.join(['%s'] * len(files)))
+			cursor.execute(sql, files)
+			return {row['file_name']: row for row in cursor.fetchall()}
+
+	except:
+		logger.exception('lookupFiles(): ')
+		return {}
+
+
+
 def saveResultsToDB(directory, resultList):
 	"""
 	input: [String] directory, [Iterable] resultList
@@ -41,30 +85,25 @@ def saveResultsToDB(directory, resultList):
 
 	where directory is the directory containing the files, and resultList
 	is a list of tuple (file, status), status is either 0 or 1.
-	"""
-	def toDBRecord(result):
-		"""
-		([String] file, [Int] status) => 
-			([String] file, [String] datetime, [String] status)
-		"""
-		file, status, _, _ = result
-		return (file
-				, strftime('%Y-%m-%d %H:%M:%S', localtime(getmtime(join(directory, file))))
-				, str(status))
 
+	The file's size and content hash are saved too, so that a file copied
+	or touched without changing its content is not converted again, see
+	worker.newerThanDB().
+	"""
 	# we need to convert to list first and tell whether it's empty because
 	# emtpy list will cause cursor.executemany() to fail
-	records = list(map(toDBRecord, resultList))
+	records = list(map(partial(toDBRecord, directory), resultList))
 	if records == []:
 		logger.debug('saveResultsToDB(): no records to save')
 		return
 
 
 	try:
-		with connection.cursor() as cursor:
-			sql = "REPLACE INTO file (file_name, last_modified, status) \
-					VALUES (%s, %s, %s)"
-			cursor.executemany(sql, records)
+		with pooledConnection() as connection:
+			with connection.cursor() as cursor:
+				sql = "REPLACE INTO file (file_name, last_modified, status, size, hash) \
+						VALUES (%s, %s, %s, %s, %s)"
+				cursor.executemany(sql, records)
 
 			# save changes
 			connection.commit()
@@ -74,25 +113,118 @@ def saveResultsToDB(directory, resultList):
 
 
 
-connection = None
-def getConnection():
-	global connection
-	if connection == None:
-		logger.info('getConnection(): establish DB connection')
-		connection = pymysql.connect(host=getDbHost(),
-									user=getDbUser(),
-									password=getDbPassword(),
-									db=getDbName(),
-									cursorclass=pymysql.cursors.DictCursor)
-	return connection
+def updateLastModified(file, lastModified):
+	"""
+	[String] file, [String] lastModified (yyyy-mm-dd HH:MM:SS) => update
+		the last modified time of the file in database.
+	"""
+	try:
+		with pooledConnection() as connection:
+			with connection.cursor() as cursor:
+				cursor.execute("UPDATE file SET last_modified=%s WHERE file_name=%s"
+								, (lastModified, file))
+
+			connection.commit()
+
+	except:
+		logger.exception('updateLastModified(): ')
+
 
 
+# A small pool of connections. A connection is borrowed for one call, then
+# put back for the next call, so a long running worker does not connect
+# for every query, and threads never share a connection at the same time.
+#
+# A borrowed connection is pinged first, which reconnects it if the server
+# has closed it (e.g., after wait_timeout). A connection that fails during
+# a call is closed instead of put back.
+#
+# The pool belongs to one process. A child process (e.g., worker.py --jobs)
+# starts with an empty pool, because a connection's socket must not be
+# used by two processes.
+#
+pool = None
+poolPid = None
 
-def closeConnection():
-	global connection
-	if connection != None:
-		logger.info('DB connection closed')
+def getPool():
+	global pool, poolPid
+	if pool == None or poolPid != os.getpid():
+		pool = LifoQueue(maxsize=getDbPoolSize())
+		poolPid = os.getpid()
+	return pool
+
+
+
+def newConnection():
+	logger.info('newConnection(): establish DB connection')
+	return pymysql.connect(host=getDbHost(),
+							user=getDbUser(),
+							password=getDbPassword(),
+							db=getDbName(),
+							connect_timeout=getDbConnectTimeout(),
+							read_timeout=getDbReadTimeout(),
+							write_timeout=getDbWriteTimeout(),
+							cursorclass=pymysql.cursors.DictCursor)
+
+
+
+@contextmanager
+def pooledConnection():
+	"""
+	=> [Connection] a connection borrowed from the pool, put back when the
+		with block ends.
+	"""
+	try:
+		connection = getPool().get_nowait()
+	except Empty:
+		connection = newConnection()
+	else:
+		try:
+			connection.ping(reconnect=True)
+		except pymysql.err.Error:
+			logger.warning('pooledConnection(): pooled connection lost, open a new one')
+			discardConnection(connection)
+			connection = newConnection()
+
+	try:
+		yield connection
+	except:
+		discardConnection(connection)
+		raise
+
+	try:
+		getPool().put_nowait(connection)
+	except Full:
+		discardConnection(connection)
+
+
+
+def discardConnection(connection):
+	"""
+	[Connection] connection => close it, an error in closing is logged and
+		not raised, so it does not hide an exception being handled.
+	"""
+	try:
 		connection.close()
+	except:
+		logger.exception('discardConnection(): ')
+
+
+
+def closeConnection():
+	"""
+	Close all connections in the pool.
+	"""
+	pool = getPool()
+	while not pool.empty():
+		try:
+			pool.get_nowait().close()
+		except Empty:
+			break
+		except:
+			logger.exception('closeConnection(): ')
+
+	logger.info('DB connection closed')
 
 
 
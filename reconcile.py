@@ -0,0 +1,146 @@
+# coding=utf-8
+#
+# Reconcile positions: yesterday's positions plus today's trades should give
+# today's positions. Instead of comparing the cash/position and trade output
+# by eye in Geneva, run e.g.,
+#
+#	python reconcile.py IB <yesterday position file> <trade file>
+#		<today position file> --output breaks.csv
+#
+# The files are read with the broker's createPositionRecords() and
+# createTradeRecords(). The expected position of each Bloomberg ticker is
+# its prior position plus its trades (buy and cover add, sell and short
+# take away), it is compared with the position in today's file. A ticker
+# whose expected and actual positions differ is a break.
+#
+# Tickers are joined through a hash table to array indices, then quantities
+# are summed per ticker with NumPy, so thousands of tickers take a fraction
+# of a second.
+#
+
+from IB.utility import get_current_path, writeCsvRows
+from operator import attrgetter
+from os.path import join
+import numpy as np
+import logging
+logger = logging.getLogger(__name__)
+
+
+
+class InvalidTradeSide(Exception):
+	pass
+
+
+
+# sign of the trade quantity to the position, by trade side
+SIGN = {'Buy': 1, 'Cover': 1, 'Sell': -1, 'Short': -1}
+
+BREAK_FIELDS = ['BloombergTicker', 'Prior', 'Traded', 'Expected', 'Actual',
+				'Difference']
+
+
+
+def reconcile(priorPositions, trades, positions, tolerance=1e-6):
+	"""
+	[Iterable] priorPositions, [Iterable] trades, [Iterable] positions,
+		[Float] tolerance => [List] breaks
+
+	priorPositions and positions are position records, trades are trade
+	records. A break is a tuple (ticker, prior, traded, expected, actual,
+	difference) of a ticker whose expected and actual positions differ by
+	more than tolerance, breaks are sorted by ticker.
+	"""
+	index = {}	# ticker => array index
+	priorIndex, priorQuantities = toColumns(index, priorPositions)
+	tradeIndex, tradeQuantities = toColumns(index, trades, signed=True)
+	actualIndex, actualQuantities = toColumns(index, positions)
+
+	n = len(index)
+	prior = np.bincount(priorIndex, weights=priorQuantities, minlength=n)
+	traded = np.bincount(tradeIndex, weights=tradeQuantities, minlength=n)
+	actual = np.bincount(actualIndex, weights=actualQuantities, minlength=n)
+	expected = prior + traded
+	difference = actual - expected
+
+	tickers = list(index)
+	breaks = np.flatnonzero(np.abs(difference) > tolerance)
+	return sorted(zip([tickers[i] for i in breaks.tolist()], prior[breaks].tolist()
+					, traded[breaks].tolist(), expected[breaks].tolist()
+					, actual[breaks].tolist(), difference[breaks].tolist()))
+
+
+
+def toColumns(index, records, signed=False):
+	"""
+	[Dictionary] index, [Iterable] records, [Bool] signed
+		=> [numpy array] ticker indices, [numpy array] quantities
+
+	New tickers are added to index. If signed, the records are trades and
+	the quantity takes the sign of the trade side.
+	"""
+	getColumns = attrgetter('BloombergTicker', 'Quantity', 'Side') if signed \
+					else attrgetter('BloombergTicker', 'Quantity')
+	columns = list(zip(*map(getColumns, records)))
+	if columns == []:
+		return np.zeros(0, dtype=np.intp), np.zeros(0)
+
+	indices = np.fromiter((index.setdefault(t, len(index)) for t in columns[0])
+							, dtype=np.intp, count=len(columns[0]))
+	quantities = np.array(columns[1], dtype=np.float64)
+	if signed:
+		try:
+			quantities = quantities * np.array([SIGN[s] for s in columns[2]])
+		except KeyError as e:
+			raise InvalidTradeSide(e.args[0])
+
+	return indices, quantities
+
+
+
+def writeBreaksFile(breaks, file):
+	"""
+	[List] breaks, [String] file => write the breaks to a csv file, with a
+		header row.
+	"""
+	writeCsvRows(file, [BREAK_FIELDS] + [list(b) for b in breaks])
+
+
+
+def reconcileFiles(broker, priorPositionFile, tradeFile, positionFile):
+	"""
+	[String] broker, [String] priorPositionFile, [String] tradeFile,
+		[String] positionFile => [List] breaks
+
+	broker: 'IB', 'HGNH' or 'GF', whose functions read the files.
+	"""
+	if broker == 'IB':
+		from IB.ib import createPositionRecords, createTradeRecords
+	elif broker == 'HGNH':
+		from IB.henghua import createPositionRecords, createTradeRecords
+	else:
+		from IB.guangfa import createPositionRecords, createTradeRecords
+
+	return reconcile(createPositionRecords(priorPositionFile)
+					, createTradeRecords(tradeFile)
+					, createPositionRecords(positionFile))
+
+
+
+
+if __name__ == '__main__':
+	import logging.config
+	logging.config.fileConfig('logging.config', disable_existing_loggers=False)
+
+	import argparse
+	parser = argparse.ArgumentParser()
+	parser.add_argument('broker', choices=['IB', 'HGNH', 'GF'])
+	parser.add_argument('prior', metavar='yesterday position file')
+	parser.add_argument('trade', metavar='trade file')
+	parser.add_argument('position', metavar='today position file')
+	parser.add_argument('--output', metavar='breaks file'
+						, default=join(get_current_path(), 'breaks.csv'))
+	args = parser.parse_args()
+
+	breaks = reconcileFiles(args.broker, args.prior, args.trade, args.position)
+	writeBreaksFile(breaks, args.output)
+	print('{0} breaks, see {1}'.format(len(breaks), args.output))
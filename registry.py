@@ -0,0 +1,98 @@
+# coding=utf-8
+# 
+# The registry of processed files, i.e., each input file's name, last
+# modified time, status, size and content hash, so that we won't convert the
+# same file twice.
+#
+# The registry is kept in a database, either MySQL (mysql.py) or an embedded
+# SQLite file (sqlite.py), chosen by the 'backend' option in section
+# [database] of ib.config. Both have the same functions as below.
+#
+
+from IB.configure import getDbBackend
+from IB.utility import fileHash
+from os.path import join, getmtime, getsize
+from time import strftime, localtime
+from importlib import import_module
+import logging
+logger = logging.getLogger(__name__)
+
+
+
+class InvalidBackend(Exception):
+	pass
+
+
+
+def getBackend():
+	"""
+	=> [Module] the database module, imported only when used so that the
+		sqlite backend does not need pymysql.
+	"""
+	backend = getDbBackend()
+	if not backend in ('mysql', 'sqlite'):
+		raise InvalidBackend(backend)
+
+	return import_module('IB.' + backend)
+
+
+
+def lookupLastModifiedTime(file):
+	"""
+	[String] file => [Datetime] last modified time of file in DB, None if
+		not found.
+	"""
+	return getBackend().lookupLastModifiedTime(file)
+
+
+
+def lookupFiles(files):
+	"""
+	[Iterable] files => [Dictionary] file name -> [Dictionary] DB record
+
+	A DB record has fields 'last_modified', 'size' and 'hash'.
+	"""
+	return getBackend().lookupFiles(files)
+
+
+
+def saveResultsToDB(directory, resultList):
+	"""
+	[String] directory, [Iterable] resultList => save the results into
+		database
+	"""
+	return getBackend().saveResultsToDB(directory, resultList)
+
+
+
+def updateLastModified(file, lastModified):
+	"""
+	[String] file, [Datetime] lastModified => update the last modified time
+		of the file in DB, for a file whose content has not changed.
+	"""
+	return getBackend().updateLastModified(file
+				, lastModified.strftime('%Y-%m-%d %H:%M:%S'))
+
+
+
+def closeConnection():
+	return getBackend().closeConnection()
+
+
+
+def toDBRecord(directory, result):
+	"""
+	[String] directory, [Tuple] result => 
+		([String] file, [String] datetime, [String] status, [Int] size,
+			[String] hash)
+
+	result is a tuple (file, status, ...), status is either 0 or 1. Shared
+	by the database modules.
+	"""
+	file, status, _, _, _ = result
+	path = join(directory, file)
+	return (file
+			, strftime('%Y-%m-%d %H:%M:%S', localtime(getmtime(path)))
+			, str(status)
+			, getsize(path)
+			, fileHash(path))
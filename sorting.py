@@ -0,0 +1,120 @@
+# coding=utf-8
+#
+# Sort trade records by execution time in bounded memory, for very large
+# files, e.g., multi-month flex exports pulled for backfills.
+#
+# Records are read in runs of at most run_size records (section [sort] in
+# ib.config). If the whole input fits in one run, it is sorted in memory as
+# before. Otherwise each run is sorted and spilled to a temp file, then the
+# runs are merged as the records are taken, holding only a chunk of each run
+# in memory.
+#
+# The sort is stable: records with the same key stay in the order they come.
+# Within a run, sorted() is stable; across runs, heapq.merge() takes a tie
+# from the earlier run first, and earlier runs hold earlier records.
+#
+
+from IB.configure import getSortRunSize, getSortDirectory
+from IB.utility import timed, countRows
+from heapq import merge
+from itertools import islice
+from tempfile import TemporaryFile
+import pickle, logging
+logger = logging.getLogger(__name__)
+
+
+
+# records pickled together in a temp file, the merge holds a chunk of each run
+CHUNK_SIZE = 1000
+
+
+
+def sortRecords(records, key, runSize=None):
+	"""
+	[Iterable] records, [Function] key, [Int] runSize => [Iterable] records
+		sorted by key, ties in their original order
+
+	runSize defaults to the run_size in the config file. If there are fewer
+	than runSize records, or runSize is 0, they are sorted in memory and a
+	list is returned. Otherwise the merged records are given lazily, and the
+	time taken is counted in the 'sort' stage.
+	"""
+	if runSize == None:
+		runSize = getSortRunSize()
+
+	records = iter(records)
+	run = sorted(records if runSize <= 0 else islice(records, runSize), key=key)
+	if runSize <= 0 or len(run) < runSize:
+		countRows('sort', len(run))
+		return run
+
+	runFiles = []
+	n = 0
+	try:
+		while run != []:
+			runFiles.append(writeRun(run))
+			n = n + len(run)
+			run = sorted(islice(records, runSize), key=key)
+	except:
+		closeFiles(runFiles)
+		raise
+
+	logger.debug('sortRecords(): {0} records in {1} runs'.format(n, len(runFiles)))
+	return timed('sort', mergeRuns(runFiles, key))	# counts the rows merged
+
+
+
+def writeRun(run):
+	"""
+	[List] run => [File] temp file holding the run, in chunks
+	"""
+	f = TemporaryFile(dir=getSortDirectory())
+	try:
+		for i in range(0, len(run), CHUNK_SIZE):
+			pickle.dump(run[i:i+CHUNK_SIZE], f, pickle.HIGHEST_PROTOCOL)
+	except:
+		f.close()
+		raise
+
+	return f
+
+
+
+def readRun(f):
+	"""
+	[File] temp file => [Iterable] records of the run
+	"""
+	f.seek(0)
+	return readChunks(f)
+
+
+
+def readChunks(f):
+	"""
+	[File] f => [Iterable] records of the chunks pickled in the file, from
+		where the file is to its end
+	"""
+	while True:
+		try:
+			chunk = pickle.load(f)
+		except EOFError:
+			return
+		yield from chunk
+
+
+
+def mergeRuns(runFiles, key):
+	"""
+	[List] runFiles, [Function] key => [Iterable] records of all the runs,
+		merged by key. The temp files are closed, thus removed, when done.
+	"""
+	try:
+		yield from merge(*map(readRun, runFiles), key=key)
+	finally:
+		closeFiles(runFiles)
+
+
+
+def closeFiles(files):
+	for f in files:
+		f.close()
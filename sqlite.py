@@ -0,0 +1,149 @@
+# coding=utf-8
+# 
+# Store the records of processed files in an embedded SQLite database, the
+# same functions as mysql.py but no database server is needed. Use it by
+# setting backend=sqlite in section [database] of ib.config.
+#
+# The database runs in WAL mode, so reading the registry does not block
+# while results are being saved. The table is created when the database is
+# first opened.
+#
+
+import sqlite3
+from functools import partial
+from datetime import datetime
+from IB.configure import getDbPath
+from IB.registry import toDBRecord
+import logging
+logger = logging.getLogger(__name__)
+
+
+
+# SQLite limits the number of parameters in a query, so look up files in
+# batches.
+BATCH_SIZE = 500
+
+
+
+def lookupLastModifiedTime(file):
+	"""
+	[String] file => [Datetime] last modified time of file in DB.
+
+	if lookup does not find any record in database, return None
+	"""
+	record = lookupFiles([file]).get(file)
+	if record == None:
+		logger.debug('lookupLastModifiedTime(): {0} not found'.format(file))
+		return None
+	else:
+		return record['last_modified']
+
+
+
+def lookupFiles(files):
+	"""
+	[Iterable] files => [Dictionary] file name -> [Dictionary] DB record
+
+	A DB record has fields 'last_modified', 'size' and 'hash', the same as
+	mysql.lookupFiles(). Files not found in database are not in the
+	dictionary.
+	"""
+	def toRecord(row):
+		file, lastModified, size, hash = row
+		return file, {'last_modified': datetime.strptime(lastModified, '%Y-%m-%d %H:%M:%S')
+					, 'size': size, 'hash': hash}
+
+	files = list(files)
+	try:
+		connection = getConnection()
+		records = {}
+		for i in range(0, len(files), BATCH_SIZE):
+			batch = files[i:i+BATCH_SIZE]
+			sql = "SELECT file_name, last_modified, size, hash FROM file \
+					WHERE file_name IN ({0})".format(', '.join(['?'] * len(batch)))
+			records.update(map(toRecord, connection.execute(sql, batch)))
+
+		return records
+
+	except:
+		logger.exception('lookupFiles(): ')
+		return {}
+
+
+
+def saveResultsToDB(directory, resultList):
+	"""
+	input: [String] directory, [Iterable] resultList
+	output: save the results into database
+
+	Same as mysql.saveResultsToDB().
+	"""
+	records = list(map(partial(toDBRecord, directory), resultList))
+	if records == []:
+		logger.debug('saveResultsToDB(): no records to save')
+		return
+
+	try:
+		connection = getConnection()
+		with connection:	# commit, or rollback on error
+			connection.executemany("REPLACE INTO file (file_name, last_modified, \
+									status, size, hash) VALUES (?, ?, ?, ?, ?)"
+									, records)
+
+	except:
+		logger.exception('saveResultsToDB(): ')
+
+
+
+def updateLastModified(file, lastModified):
+	"""
+	[String] file, [String] lastModified (yyyy-mm-dd HH:MM:SS) => update
+		the last modified time of the file in database.
+	"""
+	try:
+		connection = getConnection()
+		with connection:
+			connection.execute("UPDATE file SET last_modified = ? WHERE file_name = ?"
+								, (lastModified, file))
+
+	except:
+		logger.exception('updateLastModified(): ')
+
+
+
+connection = None
+def getConnection():
+	global connection
+	if connection == None:
+		openDatabase(getDbPath())
+	return connection
+
+
+
+def openDatabase(path):
+	"""
+	[String] path => open the SQLite database file as the connection, create
+		the table if not there.
+	"""
+	global connection
+	closeConnection()
+	logger.info('openDatabase(): {0}'.format(path))
+	connection = sqlite3.connect(path)
+	connection.execute('PRAGMA journal_mode=WAL')
+	connection.execute('PRAGMA synchronous=NORMAL')
+	connection.execute('CREATE TABLE IF NOT EXISTS file ( \
+							file_name TEXT NOT NULL PRIMARY KEY, \
+							last_modified TEXT, \
+							status TEXT, \
+							size INTEGER, \
+							hash TEXT)')
+	connection.commit()
+
+
+
+def closeConnection():
+	global connection
+	if connection != None:
+		logger.info('DB connection closed')
+		connection.close()
+		connection = None
@@ -0,0 +1,18 @@
+# coding=utf-8
+#
+# Records shared by the tests.
+#
+
+from IB.utility import TradeRecord
+from datetime import datetime, timedelta
+
+
+
+def trade(ticker, side, quantity, price=100, commission=0, hour=0):
+    """
+    => [TradeRecord] a trade on 2018-10-22, settled the day after, executed
+        at the hour.
+    """
+    return TradeRecord(ticker, side, quantity, price, datetime(2018,10,22)
+                        , datetime(2018,10,23), 'Broker Commission', commission
+                        , 'TRADING', datetime(2018,10,22) + timedelta(hours=hour))
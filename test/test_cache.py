@@ -0,0 +1,79 @@
+# coding=utf-8
+#
+
+import unittest2, os
+from unittest.mock import patch
+from tempfile import TemporaryDirectory
+from os.path import join
+from IB import cache, sorting
+from IB.cache import loadRecords, saveRecords, setEnabled
+from IB.ib import createTradeRecords
+from IB.utility import get_current_path
+from datetime import datetime
+
+
+
+class TestCache(unittest2.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(TestCache, self).__init__(*args, **kwargs)
+
+
+    def testSaveLoad(self):
+        records = [{'Quantity': 1, 'Date': datetime(2018,10,25)}]
+        with TemporaryDirectory() as directory:
+            self.assertEqual(loadRecords(directory, 'key1'), None)
+            saveRecords(directory, 'key1', records, 1024*1024)
+            self.assertEqual(loadRecords(directory, 'key1'), records)
+
+
+
+    def testEvict(self):
+        """
+        Each entry is larger than 1/3 of the max size, so only 2 entries
+        can stay, the least recently used one is removed.
+        """
+        records = [{'Quantity': i} for i in range(100)]
+        with TemporaryDirectory() as directory:
+            saveRecords(directory, 'key1', records, 1024*1024)
+            size = os.path.getsize(join(directory, 'key1.pickle'))
+            saveRecords(directory, 'key2', records, size*2.5)
+            os.utime(join(directory, 'key1.pickle'), (0, 0))
+            os.utime(join(directory, 'key2.pickle'), (1, 1))
+
+            loadRecords(directory, 'key1')  # key1 becomes recently used
+            saveRecords(directory, 'key3', records, size*2.5)
+            self.assertEqual(sorted(os.listdir(directory))
+                            , ['key1.pickle', 'key3.pickle'])
+
+
+
+    def testExternalSort(self):
+        """
+        Records from the external sort are not turned into a list, neither
+        when saved to cache nor when read back.
+        """
+        file = join(get_current_path(), 'samples', 'trade1'
+                    , 'DU1237908.Trades_TradeConfirmFlex.Sample.csv')
+        setEnabled(False)
+        try:
+            expected = createTradeRecords(file)
+        finally:
+            setEnabled(None)
+
+        with TemporaryDirectory() as directory \
+          , patch.object(sorting, 'getSortRunSize', lambda: 2) \
+          , patch.object(cache, 'getCacheDirectory', lambda: directory):
+            setEnabled(True)
+            try:
+                records = createTradeRecords(file)
+                self.assertNotIsInstance(records, list)
+                self.assertEqual(os.listdir(directory), [])
+                self.assertEqual(list(records), expected)
+                self.assertEqual(len(os.listdir(directory)), 1)
+
+                records = createTradeRecords(file)  # from cache
+                self.assertNotIsInstance(records, list)
+                self.assertEqual(list(records), expected)
+            finally:
+                setEnabled(None)
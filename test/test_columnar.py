@@ -0,0 +1,35 @@
+# coding=utf-8
+#
+
+import unittest2
+from os.path import join
+from IB.utility import get_current_path
+from IB.ib import createTradeRecords
+from IB.columnar import createTradeRecords as createColumnarTradeRecords
+from IB.cache import setEnabled
+
+
+
+class TestColumnar(unittest2.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(TestColumnar, self).__init__(*args, **kwargs)
+
+
+    def testSameRecords(self):
+        """
+        The columnar engine gives the same records as the python engine,
+        compared by repr() so that 1 and 1.0 differ, as they do in the
+        output files.
+        """
+        setEnabled(False)
+        try:
+            for file in [ join('trade1', 'DU1237908.Trades_TradeConfirmFlex.Sample.csv')
+                        , join('trade2', 'DU1237908.Trades_TradeConfirmFlex.2.csv')
+                        , join('trade3', 'DU1237908.Trades_TradeConfirmFlex.3.csv')]:
+                file = join(get_current_path(), 'samples', file)
+                records = list(map(repr, createTradeRecords(file)))
+                self.assertNotEqual(records, [])
+                self.assertEqual(list(map(repr, createColumnarTradeRecords(file))), records)
+        finally:
+            setEnabled(None)
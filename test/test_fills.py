@@ -0,0 +1,66 @@
+# coding=utf-8
+#
+
+import unittest2
+from IB.fills import aggregateFills, aggregatePartitionedFills, setEnabled
+from IB.test.records import trade
+from datetime import datetime
+
+
+
+class TestFills(unittest2.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(TestFills, self).__init__(*args, **kwargs)
+
+
+    def testAggregate(self):
+        """
+        3 fills of one order and 1 fill of another, the ticket takes the
+        place of the first fill.
+        """
+        records = [ trade('HIZ8 Index', 'Buy', 1, 26198, 15, 9)
+                  , trade('ESZ8 Index', 'Sell', 2, 2750.25, 4.1, 10)
+                  , trade('HIZ8 Index', 'Buy', 2, 26201, 30, 11)
+                  , trade('HIZ8 Index', 'Buy', 3, 26203.3333333, 45.005, 12)]
+        setEnabled(True)
+        try:
+            tickets = list(aggregateFills(records))
+        finally:
+            setEnabled(None)
+
+        self.assertEqual(len(tickets), 2)
+        self.assertEqual(tickets[0]['BloombergTicker'], 'HIZ8 Index')
+        self.assertEqual(tickets[0]['Quantity'], 6)
+        self.assertEqual(tickets[0]['Price'], 26201.666667)   # 6 decimals
+        self.assertAlmostEqual(tickets[0]['Commission Amt 1'], 90.0)
+        self.assertEqual(tickets[0]['TradeTime'], datetime(2018,10,22,9))
+        self.assertEqual(tickets[1], trade('ESZ8 Index', 'Sell', 2, 2750.25, 4.1, 10))
+
+
+
+    def testPartitioned(self):
+        """
+        Fills in different partitions are not merged.
+        """
+        pairs = [ ('A', trade('HIZ8 Index', 'Buy', 1, 26198, 15, 9))
+                , ('B', trade('HIZ8 Index', 'Buy', 1, 26198, 15, 10))
+                , ('A', trade('HIZ8 Index', 'Buy', 1, 26200, 15, 11))]
+        setEnabled(True)
+        try:
+            tickets = list(aggregatePartitionedFills(pairs))
+        finally:
+            setEnabled(None)
+
+        self.assertEqual([(p, r['Quantity'], r['Price']) for (p, r) in tickets]
+                        , [('A', 2, 26199), ('B', 1, 26198)])
+
+
+
+    def testDisabled(self):
+        records = [trade('HIZ8 Index', 'Buy', 1, 26198, 15, 9)] * 2
+        setEnabled(False)
+        try:
+            self.assertEqual(aggregateFills(records), records)
+        finally:
+            setEnabled(None)
@@ -136,7 +136,7 @@ class TestGF(unittest2.TestCase):
         self.assertAlmostEqual(3.84, record['Price'])
         self.assertEqual(datetime(2013,6,7), record['TradeDate'])
         self.assertEqual(datetime(2013,6,7), record['SettlementDate'])
-        self.assertEqual(datetime(2013,6,7,hour=19,minute=1,second=1), record['Datetime'])
+        self.assertEqual(datetime(2013,6,7,hour=19,minute=1,second=1), record['TradeTime'])
 
 
 
@@ -152,7 +152,7 @@ class TestGF(unittest2.TestCase):
         self.assertAlmostEqual(1262, record['Price'])
         self.assertEqual(datetime(2014,1,31), record['TradeDate'])
         self.assertEqual(datetime(2014,1,31), record['SettlementDate'])
-        self.assertEqual(datetime(2014,1,31,hour=22,minute=47,second=36), record['Datetime'])
+        self.assertEqual(datetime(2014,1,31,hour=22,minute=47,second=36), record['TradeTime'])
 
 
 
@@ -167,4 +167,4 @@ class TestGF(unittest2.TestCase):
         self.assertAlmostEqual(106.95, record['Price'])
         self.assertEqual(datetime(2014,1,31), record['TradeDate'])
         self.assertEqual(datetime(2014,1,31), record['SettlementDate'])
-        self.assertEqual(datetime(2014,1,31,hour=21,minute=32,second=2), record['Datetime'])
+        self.assertEqual(datetime(2014,1,31,hour=21,minute=32,second=2), record['TradeTime'])
@@ -4,7 +4,8 @@
 import unittest2
 from os.path import join
 from IB.utility import get_current_path, toRecordGroups
-from IB.henghua import createTradeRecords, createCashRecords, createPositionRecords
+from IB.henghua import createTradeRecords, createCashRecords, createPositionRecords, \
+                        linesToRecords
 from datetime import datetime
 
 
@@ -23,6 +24,16 @@ class TestHenghua(unittest2.TestCase):
 
 
 
+    def testBlankLines(self):
+        """
+        Blank lines, as xlrd or openpyxl give them, are skipped.
+        """
+        lines = [['Contract', 'Lots'], ['HSIX8', 1.0], ['', ''], ['HSIZ8', 2.0], ['', '']]
+        self.assertEqual(list(linesToRecords(lines))
+                        , [{'Contract': 'HSIX8', 'Lots': 1.0}, {'Contract': 'HSIZ8', 'Lots': 2.0}])
+
+
+
     def testRecordGroups(self):
         """
         After sorting, 7th and 8th records form a box position, therefore all
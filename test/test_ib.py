@@ -3,8 +3,13 @@
 
 import unittest2
 from os.path import join
-from IB.utility import get_current_path
-from IB.ib import createTradeRecords, createPositionRecords, createCashRecords
+from IB.utility import get_current_path, tickerCacheInfo, toRecordGroups
+from IB.ib import createTradeRecords, createPositionRecords, createCashRecords, \
+                    createTradeRecordsInParallel, processTradeFile
+from IB.configure import config
+from tempfile import TemporaryDirectory
+import IB.ib, csv
+from IB.cache import setEnabled as setCacheEnabled
 from datetime import datetime
 
 
@@ -24,6 +29,69 @@ class TestIB(unittest2.TestCase):
 
 
 
+    def testTickerCache(self):
+        """
+        32 futures trades on 5 contracts, so at most 5 cache misses.
+        """
+        setCacheEnabled(False)  # parse the file, not load from cache
+        hits, misses, _ = tickerCacheInfo()['IB']
+        list(createTradeRecords(join(get_current_path(), 'samples', 'trade1',
+            'DU1237908.Trades_TradeConfirmFlex.Sample.csv')))
+        newHits, newMisses, _ = tickerCacheInfo()['IB']
+        setCacheEnabled(None)
+        self.assertLessEqual(newMisses - misses, 5)
+        self.assertEqual(newHits + newMisses - hits - misses, 32)
+
+
+
+    def testParallel(self):
+        """
+        The sample file split into chunks of a few rows, converted by 3
+        processes, gives the same records in the same order.
+        """
+        file = join(get_current_path(), 'samples', 'trade1',
+            'DU1237908.Trades_TradeConfirmFlex.Sample.csv')
+        minChunkSize, IB.ib.MIN_CHUNK_SIZE = IB.ib.MIN_CHUNK_SIZE, 1000
+        try:
+            records = list(createTradeRecordsInParallel(file, 3))
+        finally:
+            IB.ib.MIN_CHUNK_SIZE = minChunkSize
+        self.assertEqual(records, list(createTradeRecords(file)))
+
+
+
+    def testPartition(self):
+        """
+        Every other trade of the sample file is moved to a second account, the
+        trades of each account go to the files of its portfolio.
+        """
+        with open(join(get_current_path(), 'samples', 'trade1',
+            'DU1237908.Trades_TradeConfirmFlex.Sample.csv'), newline='') as f:
+            rows = list(csv.reader(f))
+        for (i, row) in enumerate(rows[1:]):
+            if i % 2 == 1:
+                row[0] = 'U7654321'
+
+        config.read_dict({'accounts': {'U7654321': '40006-C'}})
+        try:
+            with TemporaryDirectory() as directory:
+                file = join(directory, 'flex.1.trade.20181022.20181022.csv')
+                with open(file, 'w', newline='') as f:
+                    csv.writer(f).writerows(rows)
+
+                outputFiles = processTradeFile(file, directory, partition=True)
+                self.assertEqual(len(outputFiles), 4)
+                accounts = {}
+                for outputFile in outputFiles:
+                    with open(outputFile, newline='') as f:
+                        for row in csv.reader(f):
+                            accounts[row[0]] = accounts.get(row[0], 0) + 1
+                self.assertEqual(accounts, {'40006-B': 16, '40006-C': 16})
+        finally:
+            config.remove_option('accounts', 'U7654321')
+
+
+
     # def testRecordGroups(self):
     #     """
     #     After sorting, 6th and 7th records form a box position, therefore all
@@ -39,16 +107,16 @@ class TestIB(unittest2.TestCase):
 
 
 
-    # def testRecordGroups2(self):
-    #     """
-    #     It will split to 3 groups.
-    #     """
-    #     groups = toRecordGroups(createTradeRecords(join(get_current_path(), 'samples', 'trade3',
-    #         'DU1237908.Trades_TradeConfirmFlex.3.csv')))
-    #     self.assertEqual(len(groups), 3)
-    #     self.assertEqual(len(groups[0]), 6)     # 1st group has 6 trades
-    #     self.assertEqual(len(groups[1]), 6)     # 2nd group has 6 trades
-    #     self.assertEqual(len(groups[2]), 4)
+    def testRecordGroups2(self):
+        """
+        It will split to 3 groups.
+        """
+        groups = toRecordGroups(createTradeRecords(join(get_current_path(), 'samples', 'trade3',
+            'DU1237908.Trades_TradeConfirmFlex.3.csv')))
+        self.assertEqual(len(groups), 3)
+        self.assertEqual(len(groups[0]), 6)     # 1st group has 6 trades
+        self.assertEqual(len(groups[1]), 6)     # 2nd group has 6 trades
+        self.assertEqual(len(groups[2]), 4)
 
 
 
@@ -74,7 +142,7 @@ class TestIB(unittest2.TestCase):
         """
         First trade
         """
-        self.assertEqual(len(record), 9)   # there should be 8 fields
+        self.assertEqual(len(record), 10)  # there should be 10 fields
         self.assertEqual('HIZ8 Index', record['BloombergTicker'])
         self.assertEqual('Buy', record['Side'])
         self.assertEqual(1, record['Quantity'])
@@ -91,7 +159,7 @@ class TestIB(unittest2.TestCase):
         """
         29th trade
         """
-        self.assertEqual(len(record), 9)   # there should be 6 fields
+        self.assertEqual(len(record), 10)  # there should be 10 fields
         self.assertEqual('S H9 Comdty', record['BloombergTicker'])
         self.assertEqual('Short', record['Side'])
         self.assertEqual(15, record['Quantity'])
@@ -0,0 +1,111 @@
+# coding=utf-8
+#
+
+import unittest2
+from os.path import join
+from tempfile import TemporaryDirectory
+from IB.ledger import splitTrades, recordPositions, loadPositions, \
+                        setEnabled, openLedger, closeLedger
+from IB.utility import PositionRecord
+from IB.test.records import trade
+from datetime import datetime
+
+
+
+class TestLedger(unittest2.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(TestLedger, self).__init__(*args, **kwargs)
+
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        openLedger(join(self.directory.name, 'ledger.db'))
+        setEnabled(True)
+
+
+    def tearDown(self):
+        setEnabled(None)
+        closeLedger()
+        self.directory.cleanup()
+
+
+    def testSplit(self):
+        """
+        Long 10 from the position file, then sell 15 marked open is 10 to
+        close and 5 to open, buy 2 marked close against a flat position
+        keeps its label.
+        """
+        recordPositions('40006-C', datetime(2018,10,24)
+                        , [PositionRecord('HIZ8 Index', 10.0, 'HKD', datetime(2018,10,24))])
+        records = list(splitTrades('40006-C', datetime(2018,10,25)
+                        , [ trade('HIZ8 Index', 'Short', 15, 100, 45.0, 1)
+                          , trade('ESZ8 Index', 'Cover', 2, 100, 12.0, 2)]))
+
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[0], trade('HIZ8 Index', 'Sell', 10, 100, 30.0, 1))
+        self.assertEqual(records[1], trade('HIZ8 Index', 'Short', 5, 100, 15.0, 1))
+        self.assertEqual(records[2], trade('ESZ8 Index', 'Cover', 2, 100, 12.0, 2))
+        self.assertEqual(loadPositions('40006-C', datetime(2018,10,26))
+                        , {'HIZ8 Index': -5, 'ESZ8 Index': 2})
+
+
+
+    def testRelabelOpen(self):
+        """
+        A trade that adds to a position is opening, whatever the broker's
+        label.
+        """
+        recordPositions('40006-C', datetime(2018,10,24)
+                        , [ PositionRecord('HIZ8 Index', 10.0, 'HKD', datetime(2018,10,24))
+                          , PositionRecord('ESZ8 Index', -2.0, 'USD', datetime(2018,10,24))])
+        records = list(splitTrades('40006-C', datetime(2018,10,25)
+                        , [ trade('HIZ8 Index', 'Cover', 5, 100, 25.0, 1)
+                          , trade('ESZ8 Index', 'Sell', 1, 100, 6.0, 2)]))
+
+        self.assertEqual(records, [ trade('HIZ8 Index', 'Buy', 5, 100, 25.0, 1)
+                                  , trade('ESZ8 Index', 'Short', 1, 100, 6.0, 2)])
+        self.assertEqual(loadPositions('40006-C', datetime(2018,10,26))
+                        , {'HIZ8 Index': 15, 'ESZ8 Index': -3})
+
+
+
+    def testStale(self):
+        """
+        Positions older than the previous trade date are not used, trades
+        keep the broker's label and the ledger is left as is. Positions of
+        Friday are used on Monday.
+        """
+        recordPositions('40006-C', datetime(2018,10,23)
+                        , [PositionRecord('HIZ8 Index', 10.0, 'HKD', datetime(2018,10,23))])
+        records = list(splitTrades('40006-C', datetime(2018,10,25)
+                        , [trade('HIZ8 Index', 'Short', 15, 100, 45.0, 1)]))
+        self.assertEqual(records, [trade('HIZ8 Index', 'Short', 15, 100, 45.0, 1)])
+        self.assertEqual(loadPositions('40006-C', datetime(2018,10,26)), None)
+
+        recordPositions('40006-C', datetime(2018,10,26)
+                        , [PositionRecord('HIZ8 Index', 10.0, 'HKD', datetime(2018,10,26))])
+        self.assertEqual(loadPositions('40006-C', datetime(2018,10,29))
+                        , {'HIZ8 Index': 10})
+
+
+
+    def testRerun(self):
+        """
+        Converting the same trade file again starts from the same positions,
+        the day's positions from a position file are not replaced by trades.
+        """
+        recordPositions('40006-C', datetime(2018,10,24)
+                        , [PositionRecord('HIZ8 Index', -3.0, 'HKD', datetime(2018,10,24))])
+        for i in range(2):
+            records = list(splitTrades('40006-C', datetime(2018,10,25)
+                            , [trade('HIZ8 Index', 'Buy', 4, 100, 20.0, 1)]))
+            self.assertEqual(records, [ trade('HIZ8 Index', 'Cover', 3, 100, 15.0, 1)
+                                      , trade('HIZ8 Index', 'Buy', 1, 100, 5.0, 1)])
+
+        recordPositions('40006-C', datetime(2018,10,25)
+                        , [PositionRecord('HIZ8 Index', 2.0, 'HKD', datetime(2018,10,25))])
+        list(splitTrades('40006-C', datetime(2018,10,25)
+                        , [trade('HIZ8 Index', 'Buy', 4, 100, 20.0, 1)]))
+        self.assertEqual(loadPositions('40006-C', datetime(2018,10,26))
+                        , {'HIZ8 Index': 2})
@@ -0,0 +1,40 @@
+# coding=utf-8
+#
+
+import unittest2
+from tempfile import TemporaryDirectory
+from os.path import join
+from IB.metrics import recordResults, writeMetrics, readSamples, values
+
+
+
+class TestMetrics(unittest2.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(TestMetrics, self).__init__(*args, **kwargs)
+
+
+    def testCumulative(self):
+        """
+        Counters and histograms add up over runs, gauges are replaced.
+        """
+        results = [('a.csv', 0, 'IB', [], {'read': (0.3, 10), 'write': (0.1, 10)})
+                  , ('b.csv', 1, 'IB', None, {})]
+        with TemporaryDirectory() as directory:
+            file = join(directory, 'ib_worker.prom')
+            for i in range(2):
+                values.clear()
+                recordResults(results, 1.5)
+                writeMetrics(file)
+
+            values.clear()
+            samples = readSamples(file)
+            self.assertEqual(samples['ib_worker_runs_total'], 2)
+            self.assertEqual(samples['ib_worker_files_total{broker="IB",status="ok"}'], 2)
+            self.assertEqual(samples['ib_worker_files_total{broker="IB",status="fail"}'], 2)
+            self.assertEqual(samples['ib_worker_rows_total{broker="IB"}'], 20)
+            self.assertEqual(samples['ib_worker_conversion_seconds_bucket{broker="IB",le="0.1"}'], 0)
+            self.assertEqual(samples['ib_worker_conversion_seconds_bucket{broker="IB",le="0.5"}'], 2)
+            self.assertEqual(samples['ib_worker_conversion_seconds_count{broker="IB"}'], 2)
+            self.assertEqual(samples['ib_worker_last_run_files'], 2)
+            self.assertEqual(samples['ib_worker_last_run_seconds'], 1.5)
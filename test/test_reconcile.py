@@ -0,0 +1,44 @@
+# coding=utf-8
+#
+
+import unittest2
+from IB.reconcile import reconcile
+from IB.utility import PositionRecord
+from IB.test.records import trade
+from datetime import datetime
+
+
+
+def position(ticker, quantity):
+    return PositionRecord(ticker, quantity, 'USD', datetime(2018,10,22))
+
+
+
+class TestReconcile(unittest2.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(TestReconcile, self).__init__(*args, **kwargs)
+
+
+    def testReconcile(self):
+        """
+        HIZ8 and ESZ8 reconcile, NQZ8 is short by 1 contract, a new SPY
+        position has no trades, GXZ8 is closed but still in the position file.
+        """
+        prior = [position('HIZ8 Index', 2), position('ESZ8 Index', -3)
+                , position('GXZ8 Index', 1), position('NQZ8 Index', 0)]
+        trades = [trade('HIZ8 Index', 'Buy', 1), trade('ESZ8 Index', 'Cover', 3)
+                 , trade('NQZ8 Index', 'Short', 4), trade('GXZ8 Index', 'Sell', 1)
+                 , trade('HIZ8 Index', 'Sell', 2)]
+        today = [position('HIZ8 Index', 1), position('NQZ8 Index', -5)
+                , position('SPY US Equity', 100), position('GXZ8 Index', 1)]
+
+        self.assertEqual(reconcile(prior, trades, today),
+            [ ('GXZ8 Index', 1, -1, 0, 1, 1)
+            , ('NQZ8 Index', 0, -4, -4, -5, -1)
+            , ('SPY US Equity', 0, 0, 0, 100, 100)])
+
+
+
+    def testEmpty(self):
+        self.assertEqual(reconcile([], [], []), [])
@@ -0,0 +1,70 @@
+# coding=utf-8
+#
+
+import unittest2, pymysql
+from unittest.mock import patch, Mock
+from tempfile import TemporaryDirectory
+from os.path import join
+from IB.sqlite import openDatabase, closeConnection, lookupFiles, \
+                        lookupLastModifiedTime, saveResultsToDB, \
+                        updateLastModified
+from IB import mysql
+from IB.utility import fileHash
+from datetime import datetime
+
+
+
+class TestRegistry(unittest2.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(TestRegistry, self).__init__(*args, **kwargs)
+
+
+    def testSQLite(self):
+        with TemporaryDirectory() as directory:
+            for name in ['a.csv', 'b.csv']:
+                with open(join(directory, name), 'w') as f:
+                    f.write(name)
+
+            openDatabase(join(directory, 'registry.db'))
+            try:
+                self.assertEqual(lookupFiles(['a.csv', 'b.csv']), {})
+                saveResultsToDB(directory, [('a.csv', 0, 'IB', [], {}), ('b.csv', 1, 'IB', None, {})])
+                records = lookupFiles(['a.csv', 'b.csv', 'c.csv'])
+                self.assertEqual(sorted(records), ['a.csv', 'b.csv'])
+                self.assertEqual(records['a.csv']['size'], 5)
+                self.assertEqual(records['a.csv']['hash'], fileHash(join(directory, 'a.csv')))
+                self.assertEqual(lookupLastModifiedTime('a.csv'), records['a.csv']['last_modified'])
+                self.assertEqual(lookupLastModifiedTime('c.csv'), None)
+
+                updateLastModified('a.csv', '2019-01-16 10:05:22')
+                self.assertEqual(lookupLastModifiedTime('a.csv'), datetime(2019,1,16,10,5,22))
+            finally:
+                closeConnection()
+
+
+
+    def testMySQLLostConnection(self):
+        """
+        A pooled connection that fails the ping is replaced by a new one,
+        an error in closing does not hide the error in the with block.
+        """
+        stale = Mock()
+        stale.ping.side_effect = pymysql.err.OperationalError(2013, 'Lost connection')
+        stale.close.side_effect = pymysql.err.Error('Already closed')
+        fresh = Mock()
+        fresh.close.side_effect = pymysql.err.Error('Already closed')
+
+        with patch.object(mysql, 'newConnection', lambda: fresh), \
+             patch.object(mysql, 'pool', None), \
+             patch.object(mysql, 'getDbPoolSize', lambda: 2):
+            mysql.getPool().put_nowait(stale)
+            with mysql.pooledConnection() as connection:
+                self.assertIs(connection, fresh)
+            self.assertEqual(stale.close.call_count, 1)
+            self.assertIs(mysql.getPool().get_nowait(), fresh)
+
+            with self.assertRaises(KeyError):
+                with mysql.pooledConnection() as connection:
+                    raise KeyError('query failed')
+            self.assertEqual(fresh.close.call_count, 1)
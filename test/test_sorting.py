@@ -0,0 +1,38 @@
+# coding=utf-8
+#
+
+import unittest2, random
+from operator import itemgetter
+from IB.sorting import sortRecords
+
+
+
+class TestSorting(unittest2.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(TestSorting, self).__init__(*args, **kwargs)
+
+
+    def testInMemory(self):
+        records = [(3, 'a'), (1, 'b'), (3, 'c'), (2, 'd')]
+        result = sortRecords(records, itemgetter(0), 10)
+        self.assertEqual(result, [(1, 'b'), (2, 'd'), (3, 'a'), (3, 'c')])
+
+
+
+    def testExternal(self):
+        """
+        1000 records in runs of 7, many ties, ties must stay in the order
+        of the input.
+        """
+        random.seed(0)
+        records = [(random.randrange(20), i) for i in range(1000)]
+        result = list(sortRecords(iter(records), itemgetter(0), 7))
+        self.assertEqual(result, sorted(records, key=itemgetter(0)))
+        self.assertEqual(result, sorted(records))   # ties by input order
+
+
+
+    def testEmpty(self):
+        self.assertEqual(list(sortRecords([], itemgetter(0), 7)), [])
+        self.assertEqual(list(sortRecords([], itemgetter(0), 0)), [])
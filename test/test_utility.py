@@ -0,0 +1,52 @@
+# coding=utf-8
+#
+
+import unittest2, os
+from unittest.mock import patch
+from tempfile import TemporaryDirectory
+from IB import utility
+from IB.utility import writePartitionedTradeRecords, writeOpenCloseTradeFiles
+from IB.test.records import trade
+from datetime import datetime, timedelta
+
+
+
+class TestUtility(unittest2.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(TestUtility, self).__init__(*args, **kwargs)
+
+
+    def testManyPartitions(self):
+        """
+        Trades of 20 dates, written with at most 3 partitions holding open
+        files. A partition written again after being suspended appends to its
+        files, the output is the same as writing each partition by itself.
+        """
+        dates = [datetime(2018,10,1) + timedelta(days=i) for i in range(20)]
+        pairs = [(('40006-C', date), trade('HIZ8 Index', side, i, hour=i))
+                    for (i, side) in enumerate(['Buy', 'Sell', 'Cover', 'Short'])
+                    for date in dates]
+
+        opened = []
+        def countingOpen(*args, **kwargs):
+            self.assertLessEqual(len([f for f in opened if not f.closed]), 6)
+            f = open(*args, **kwargs)
+            opened.append(f)
+            return f
+
+        with TemporaryDirectory() as expectedDir, TemporaryDirectory() as outputDir:
+            for date in dates:
+                writeOpenCloseTradeFiles([record for (key, record) in pairs if key[1] == date]
+                                        , expectedDir, '40006-C', 'IB', date)
+
+            with patch.object(utility, 'MAX_OPEN_WRITERS', 3) \
+              , patch.object(utility, 'open', countingOpen, create=True):
+                files = writePartitionedTradeRecords(pairs, 'openclose', outputDir, 'IB')
+
+            self.assertEqual(len(files), 40)
+            self.assertEqual(sorted(os.listdir(outputDir)), sorted(os.listdir(expectedDir)))
+            for file in os.listdir(expectedDir):
+                with open(os.path.join(expectedDir, file)) as f1 \
+                  , open(os.path.join(outputDir, file)) as f2:
+                    self.assertEqual(f1.read(), f2.read())
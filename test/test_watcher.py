@@ -0,0 +1,67 @@
+# coding=utf-8
+#
+
+import unittest2
+from unittest.mock import patch
+from IB import watcher
+from IB.watcher import settledFiles, changedFiles
+
+
+
+class TestWatcher(unittest2.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(TestWatcher, self).__init__(*args, **kwargs)
+
+
+    def testSettledFiles(self):
+        pending = {'Trade File 20190116.xlsx': None}
+        stats = {'Trade File 20190116.xlsx': (100, 1)}
+        self.assertEqual(settledFiles(pending, stats, 0, 3), [])
+
+        # still being written
+        stats = {'Trade File 20190116.xlsx': (200, 2)}
+        self.assertEqual(settledFiles(pending, stats, 2, 3), [])
+        self.assertEqual(settledFiles(pending, stats, 4, 3), [])
+        self.assertEqual(settledFiles(pending, stats, 5, 3), ['Trade File 20190116.xlsx'])
+        self.assertEqual(pending, {})
+
+        # removed before settled
+        pending = {'Trade File 20190116.xlsx': None}
+        self.assertEqual(settledFiles(pending, {}, 0, 3), [])
+        self.assertEqual(pending, {})
+
+
+
+    def testChangedFiles(self):
+        snapshot = {}
+        self.assertEqual(changedFiles(snapshot, {'a': (1, 1), 'b': (1, 1)}), ['a', 'b'])
+        self.assertEqual(changedFiles(snapshot, {'a': (1, 1), 'b': (2, 2)}), ['b'])
+        self.assertEqual(changedFiles(snapshot, {'a': (1, 1), 'b': (2, 2)}), [])
+
+
+
+    def testWatchAfterError(self):
+        """
+        The first conversion fails, watching goes on and the file is tried
+        again, then interrupted.
+        """
+        calls = []
+        def convertFiles(files, mapFunc):
+            calls.append(files)
+            if len(calls) == 1:
+                raise OSError('network share gone')
+            else:
+                raise KeyboardInterrupt
+
+        stats = {'Trade File 20190116.xlsx': (100, 1)}
+        with patch.object(watcher, 'getTradeFileDir', lambda: 'input') \
+          , patch.object(watcher, 'startObserver', lambda d: (None, None)) \
+          , patch.object(watcher, 'directoryStats', lambda d: stats) \
+          , patch.object(watcher, 'getWatchPollInterval', lambda: 0) \
+          , patch.object(watcher, 'getWatchSettleSeconds', lambda: 0) \
+          , patch.object(watcher, 'closeConnection', lambda: None) \
+          , patch.object(watcher, 'convertFiles', convertFiles):
+            watcher.watch()
+
+        self.assertEqual(calls, [['Trade File 20190116.xlsx']] * 2)
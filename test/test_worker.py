@@ -0,0 +1,77 @@
+# coding=utf-8
+#
+
+import unittest2
+from unittest.mock import patch
+from tempfile import TemporaryDirectory
+from os.path import join, getmtime
+from IB import worker
+from IB.worker import newerThanDB, processHGNHFiles
+from IB.utility import fileHash
+from datetime import datetime, timedelta
+
+
+
+class TestWorker(unittest2.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(TestWorker, self).__init__(*args, **kwargs)
+
+
+    def testNewerThanDB(self):
+        with TemporaryDirectory() as directory:
+            file = 'Trade File 20190116.xlsx'
+            with open(join(directory, file), 'w') as f:
+                f.write('trades')
+            path = join(directory, file)
+            lastModified = datetime.fromtimestamp(getmtime(path))
+            hash = fileHash(path)
+            earlier = lastModified - timedelta(hours=1)
+
+            updates = []
+            with patch.object(worker, 'getTradeFileDir', lambda: directory) \
+              , patch.object(worker, 'updateLastModified'
+                            , lambda file, t: updates.append((file, t))):
+                def newer(dbFile):
+                    return newerThanDB({file: dbFile}, file)
+
+                self.assertTrue(newerThanDB({}, file))
+
+                # saved before size and hash were kept
+                self.assertTrue(newer({'last_modified': earlier, 'size': None, 'hash': None}))
+                self.assertFalse(newer({'last_modified': lastModified, 'size': None, 'hash': None}))
+
+                # size changed
+                self.assertTrue(newer({'last_modified': lastModified, 'size': 1, 'hash': hash}))
+
+                # same size and last modified time, not hashed
+                self.assertFalse(newer({'last_modified': lastModified, 'size': 6, 'hash': 'x'}))
+                self.assertEqual(updates, [])
+
+                # last modified time differs, compare hash
+                self.assertTrue(newer({'last_modified': earlier, 'size': 6, 'hash': 'x'}))
+                self.assertEqual(updates, [])
+                self.assertFalse(newer({'last_modified': earlier, 'size': 6, 'hash': hash}))
+                self.assertEqual(updates, [(file, lastModified)])
+
+
+
+    def testHGNHFilesInDateOrder(self):
+        """
+        With the ledger on, HGNH files are converted in this process, one
+        by one in date order, not in the pool.
+        """
+        files = ['Trade File 20190116.xlsx', 'Trade File 20190114.xlsx'
+                , 'Trade File.xlsx', 'Trade File 20190115.xlsx']
+        def poolMap(func, files):
+            raise AssertionError('pool used')
+
+        with patch.object(worker, 'processHGNHFile', lambda file: file) \
+          , patch.object(worker, 'isLedgerEnabled', lambda: True):
+            self.assertEqual(list(processHGNHFiles(iter(files), poolMap))
+                            , [ 'Trade File 20190114.xlsx', 'Trade File 20190115.xlsx'
+                              , 'Trade File 20190116.xlsx', 'Trade File.xlsx'])
+
+        with patch.object(worker, 'processHGNHFile', lambda file: file) \
+          , patch.object(worker, 'isLedgerEnabled', lambda: False):
+            self.assertEqual(list(processHGNHFiles(files, map)), files)
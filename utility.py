@@ -1,10 +1,14 @@
 # coding=utf-8
 # 
 
-import os
-from utils.utility import writeCsv
+import os, hashlib, csv
 from os.path import join
-from functools import reduce
+from functools import reduce, lru_cache
+from itertools import chain
+from operator import attrgetter
+from contextlib import contextmanager
+from collections import OrderedDict
+from time import perf_counter
 import logging
 logger = logging.getLogger(__name__)
 
@@ -27,8 +31,600 @@ def fileNameWithoutPath(file):
 	[String] file => [String] file
 
 	C:\temp\file1.txt => file1.txt
+
+	'/' is taken as a separator too, so that it works with paths on Linux.
+	"""
+	return file.replace('/', '\\').split('\\')[-1]
+
+
+
+# name => memoized ticker resolution function, see tickerCache()
+tickerCaches = {}
+
+def tickerCache(name):
+	"""
+	[String] name => [Function] decorator
+
+	Memoize a ticker resolution function, which maps the raw contract identity
+	in a broker file, e.g., (UnderlyingSymbol, Multiplier, Description) for IB,
+	to a tuple (Bloomberg ticker, price factor). A day's file has thousands of
+	fills on a handful of contracts, so the mapping is worked out once per
+	contract. Use tickerCacheInfo() to see the hit and miss counts.
+	"""
+	def decorator(resolve):
+		cached = lru_cache(maxsize=None)(resolve)
+		tickerCaches[name] = cached
+		return cached
+
+	return decorator
+
+
+
+def tickerCacheInfo():
+	"""
+	=> [Dictionary] name => (hits, misses, entries) of each ticker cache
+	"""
+	def info(cache):
+		hits, misses, _, entries = cache.cache_info()
+		return (hits, misses, entries)
+
+	return {name: info(cache) for (name, cache) in tickerCaches.items()}
+
+
+
+# feature => True or False set for this process, features not here follow
+# the 'enabled' option in the config file, see isFeatureEnabled()
+featureSwitches = {}
+
+def setFeatureEnabled(feature, yesno):
+	"""
+	[String] feature, [Bool] yesno => turn the feature on or off for this
+		process, overriding the config file. None means follow the config
+		file again.
+
+	A module with an optional feature, e.g., the cache, exposes it as
+	setEnabled = partial(setFeatureEnabled, 'cache'), which can be sent to
+	a worker process as the pool initializer.
+	"""
+	if yesno == None:
+		featureSwitches.pop(feature, None)
+	else:
+		featureSwitches[feature] = yesno
+
+
+
+def isFeatureEnabled(feature, configEnabled):
+	"""
+	[String] feature, [Function] configEnabled => [Bool] is the feature on,
+		configEnabled() gives the option in the config file.
+	"""
+	yesno = featureSwitches.get(feature)
+	if yesno == None:
+		return configEnabled()
+	else:
+		return yesno
+
+
+
+def fileHash(file):
+	"""
+	[String] file => [String] hash of the file content, 32 hex digits
+	"""
+	h = hashlib.blake2b(digest_size=16)
+	with open(file, 'rb') as f:
+		for chunk in iter(lambda: f.read(1024*1024), b''):
+			h.update(chunk)
+
+	return h.hexdigest()
+
+
+
+class StageTimer():
+	"""
+	Time spent and rows handled in each stage of converting a file, e.g.,
+	read, transform, sort, group and write.
+
+	Stages may be nested, e.g., sorting pulls records from a lazy transform
+	stage, which pulls rows from a lazy read stage. The time is exclusive,
+	i.e., time spent in an inner stage is not counted in the outer stage, so
+	the stage times add up to the total.
+	"""
+	def __init__(self):
+		self.seconds = {}
+		self.rows = {}
+		self.stack = []
+		self.last = perf_counter()
+
+
+	def enter(self, stage):
+		now = perf_counter()
+		if self.stack != []:
+			self.charge(self.stack[-1], now)
+		self.stack.append(stage)
+		self.last = now
+
+
+	def exit(self):
+		now = perf_counter()
+		self.charge(self.stack.pop(), now)
+		self.last = now
+
+
+	def charge(self, stage, now):
+		self.seconds[stage] = self.seconds.get(stage, 0) + now - self.last
+
+
+	def count(self, stage, n):
+		self.rows[stage] = self.rows.get(stage, 0) + n
+
+
+	def timings(self):
+		"""
+		=> [Dictionary] stage => (seconds, rows), in the order the stages
+			were first entered.
+		"""
+		return {stage: (seconds, self.rows.get(stage, 0)) 
+					for (stage, seconds) in self.seconds.items()}
+
+
+
+# The timer of the file being converted, None when no file is timed, then
+# timed(), timedStage() and countRows() do nothing.
+stageTimer = None
+
+@contextmanager
+def stageTiming():
+	"""
+	=> [StageTimer] time the stages within the with block, e.g.,
+
+	with stageTiming() as timer:
+		processTradeFile(file, outputDir)
+	print(timer.timings())
+	"""
+	global stageTimer
+	outer, stageTimer = stageTimer, StageTimer()
+	try:
+		yield stageTimer
+	finally:
+		stageTimer = outer
+
+
+
+@contextmanager
+def timedStage(stage):
+	"""
+	[String] stage => time the with block as the stage
+	"""
+	timer = stageTimer
+	if timer == None:
+		yield
+		return
+
+	timer.enter(stage)
+	try:
+		yield
+	finally:
+		timer.exit()
+
+
+
+def timed(stage, iterable):
+	"""
+	[String] stage, [Iterable] iterable => [Iterable] the same items
+
+	Time pulling items from a lazy iterable as the stage, and count them as
+	its rows. Returns the iterable itself when no file is timed.
+	"""
+	timer = stageTimer
+	if timer == None:
+		return iterable
+
+	def timedIterable():
+		timer.enter(stage)
+		try:
+			it = iter(iterable)
+		finally:
+			timer.exit()
+
+		n = 0
+		try:
+			while True:
+				timer.enter(stage)
+				try:
+					item = next(it)
+				except StopIteration:
+					return
+				finally:
+					timer.exit()
+
+				n = n + 1
+				yield item
+		finally:
+			timer.count(stage, n)
+
+	return timedIterable()
+
+
+
+def countRows(stage, n):
+	"""
+	[String] stage, [Int] n => add n rows to the stage
+	"""
+	if stageTimer != None:
+		stageTimer.count(stage, n)
+
+
+
+def timingsToString(timings):
+	"""
+	[Dictionary] timings => [String] e.g.,
+		'read 0.52s (128000 rows), sort 0.30s (128000 rows), total 0.82s'
+	"""
+	return ', '.join(['{0} {1:.2f}s ({2} rows)'.format(stage, seconds, rows)
+						for (stage, (seconds, rows)) in timings.items()]
+					+ ['total {0:.2f}s'.format(sum(s for (s, _) in timings.values()))])
+
+
+
+def toSlot(field):
+	"""
+	[String] field => [String] the slot that holds the field in a record,
+		e.g., 'Commission Amt 1' => 'CommissionAmt1'
+	"""
+	return field.replace(' ', '')
+
+
+
+class Record(object):
+	"""
+	Base of the trade, position and cash record types below. A record keeps
+	its fields in slots, which takes much less memory than a dictionary, but
+	it reads and writes like the dictionary it replaces, i.e., record['Price'],
+	record['Price'] = 2.5, len(record), so code written for dictionary
+	records works unchanged. The fields are fixed by the record type.
+	"""
+	__slots__ = ()
+	FIELDS = ()
+	SLOTS = {}	# field => slot, see toSlot()
+	VALUES = None	# record => tuple of the values in its slots
+
+	def __getitem__(self, field):
+		try:
+			return getattr(self, self.SLOTS[field])
+		except (KeyError, AttributeError):
+			raise KeyError(field)
+
+
+	def __setitem__(self, field, value):
+		try:
+			setattr(self, self.SLOTS[field], value)
+		except KeyError:
+			raise KeyError(field)
+
+
+	def __contains__(self, field):
+		return field in self.SLOTS
+
+
+	def __iter__(self):
+		return iter(self.FIELDS)
+
+
+	def __len__(self):
+		return len(self.FIELDS)
+
+
+	def keys(self):
+		return list(self.FIELDS)
+
+
+	def values(self):
+		return list(self.VALUES(self))
+
+
+	def items(self):
+		return list(zip(self.FIELDS, self.values()))
+
+
+	def __eq__(self, other):
+		if isinstance(other, Record):
+			return type(self) == type(other) and self.values() == other.values()
+		elif isinstance(other, dict):
+			return dict(self.items()) == other
+		else:
+			return NotImplemented
+
+
+	__hash__ = None		# records are mutable
+
+
+	def __reduce__(self):
+		return (type(self), self.VALUES(self))
+
+
+	def __repr__(self):
+		return '{0}({1})'.format(type(self).__name__
+					, ', '.join('{0}={1!r}'.format(s, v) for (s, v)
+								in zip(self.__slots__, self.values())))
+
+
+
+class TradeRecord(Record):
+	"""
+	A trade, as uploaded to Bloomberg. TradeTime is the execution time, to
+	sort the trades by, it is a datetime for IB and Guang Fa, an Excel time
+	number for HGNH.
+	"""
+	FIELDS = ('BloombergTicker', 'Side', 'Quantity', 'Price', 'TradeDate',
+				'SettlementDate', 'Commission Code 1', 'Commission Amt 1',
+				'Strategy', 'TradeTime')
+	__slots__ = tuple(map(toSlot, FIELDS))
+	SLOTS = dict(zip(FIELDS, __slots__))
+	VALUES = attrgetter(*__slots__)
+
+	def __init__(self, BloombergTicker, Side, Quantity, Price, TradeDate,
+					SettlementDate, CommissionCode1, CommissionAmt1, Strategy,
+					TradeTime=None):
+		self.BloombergTicker = BloombergTicker
+		self.Side = Side
+		self.Quantity = Quantity
+		self.Price = Price
+		self.TradeDate = TradeDate
+		self.SettlementDate = SettlementDate
+		self.CommissionCode1 = CommissionCode1
+		self.CommissionAmt1 = CommissionAmt1
+		self.Strategy = Strategy
+		self.TradeTime = TradeTime
+
+
+
+class PositionRecord(Record):
+	"""
+	A position, for Geneva reconciliation. Quantity is negative for a short
+	position.
+	"""
+	FIELDS = ('BloombergTicker', 'Quantity', 'Currency', 'Date')
+	__slots__ = FIELDS
+	SLOTS = dict(zip(FIELDS, __slots__))
+	VALUES = attrgetter(*__slots__)
+
+	def __init__(self, BloombergTicker, Quantity, Currency, Date):
+		self.BloombergTicker = BloombergTicker
+		self.Quantity = Quantity
+		self.Currency = Currency
+		self.Date = Date
+
+
+
+class CashRecord(Record):
+	"""
+	A cash balance, for Geneva reconciliation.
+	"""
+	FIELDS = ('Currency', 'Quantity', 'Date')
+	__slots__ = FIELDS
+	SLOTS = dict(zip(FIELDS, __slots__))
+	VALUES = attrgetter(*__slots__)
+
+	def __init__(self, Currency, Quantity, Date):
+		self.Currency = Currency
+		self.Quantity = Quantity
+		self.Date = Date
+
+
+
+def toQuantity(x):
+	"""
+	[Float] x => [Int] x if it is a whole number, otherwise x
+
+	Sometimes if the quantity of a futures contract is a float (like 15.0),
+	Bloomberg may generate an error, so trade quantities are converted to
+	integer where possible.
+	"""
+	if float(x).is_integer():
+		return int(x)
+	else:
+		return x
+
+
+
+TRADE_FILE_FIELDS = ('Account', 'BloombergTicker', 'Broker', 'Side', 'Quantity', 
+						'Price', 'TradeDate', 'SettlementDate', 'Commission Code 1',
+						'Commission Amt 1', 'Strategy')
+
+
+
+def writeTradeRecords(records, grouping, outputDir, portfolio, broker, date):
+	"""
+	[Iterable] records, [String] grouping, [String] outputDir,
+		[String] portfolio, [String] broker, [Datetime] date
+		=> [List] output files
+
+	Group the trade records (see groupRecords()) and write each group to a
+	trade file. Grouping by opening and closing trades is streamed, see
+	writeOpenCloseTradeFiles().
+	"""
+	if grouping == 'openclose':
+		return writeOpenCloseTradeFiles(records, outputDir, portfolio, broker, date)
+	else:
+		return writeTradeFiles(groupRecords(records, grouping), outputDir
+								, portfolio, broker, date)
+
+
+
+def writeOpenCloseTradeFiles(records, outputDir, portfolio, broker, date):
+	"""
+	[Iterable] records, [String] outputDir, [String] portfolio,
+		[String] broker, [Datetime] date => [List] output files
+
+	Same output files as writeTradeFiles(toOpenCloseGroup(records), ...), but
+	each record is written to the opening or closing trades file as it comes,
+	so the groups are not held in memory, see OpenCloseTradeWriter.
 	"""
-	return file.split('\\')[-1]
+	writer = OpenCloseTradeWriter(outputDir, portfolio, broker, date)
+	try:
+		with timedStage('write'):
+			for record in records:
+				writer.write(record)
+			return writer.close()
+	finally:
+		writer.abort()
+
+
+
+class OpenCloseTradeWriter(object):
+	"""
+	Write trade records one by one to the opening and closing trade files of
+	a portfolio and date. Several writers can be open at the same time, e.g.,
+	one for each partition of a file, see writePartitionedTradeRecords().
+
+	The two files are written as temp files, then renamed by close(): the
+	opening trades file first, the closing trades file second ('_part2'). A
+	file without trades is removed, so if there are only closing trades, they
+	go to the first file, as writeTradeFiles() does. abort() removes the temp
+	files if close() was not done.
+
+	suspend() closes the temp files to free their file handles, the next
+	write() opens them again to append.
+	"""
+	def __init__(self, outputDir, portfolio, broker, date):
+		self.outputDir = outputDir
+		self.portfolio = portfolio
+		self.date = date
+		self.tempFiles = [createTradeFileName(0, date, outputDir, portfolio) + suffix
+							for suffix in ('.opening.tmp', '.closing.tmp')]
+		self.files = []
+		self.openFiles('w')
+		self.toRow = tradeRowEncoder(TRADE_FILE_FIELDS, portfolio, broker)
+		self.counts = [0, 0]
+
+
+	def openFiles(self, mode):
+		try:
+			for tempFile in self.tempFiles:
+				self.files.append(open(tempFile, mode, newline=''))
+		except:
+			self.abort()
+			raise
+
+		self.writers = tuple(map(csv.writer, self.files))
+
+
+	def suspend(self):
+		for f in self.files:
+			f.close()
+		self.files = []
+
+
+	def write(self, record):
+		if self.files == []:
+			self.openFiles('a')
+
+		i = 0 if isOpeningTrade(record) else 1
+		self.writers[i].writerow(self.toRow(record))
+		self.counts[i] = self.counts[i] + 1
+
+
+	def close(self):
+		"""
+		=> [List] output files
+		"""
+		for f in self.files:
+			f.close()
+
+		outputFiles = []
+		for (tempFile, count) in zip(self.tempFiles, self.counts):
+			if count > 0:
+				file = createTradeFileName(len(outputFiles), self.date
+											, self.outputDir, self.portfolio)
+				os.replace(tempFile, file)
+				outputFiles.append(file)
+
+		countRows('write', sum(self.counts))
+		self.abort()	# remove the empty temp files
+		if outputFiles == []:
+			logger.debug('OpenCloseTradeWriter.close(): {0}, {1} no trades were written to ouput'
+							.format(self.portfolio, self.date))
+
+		return outputFiles
+
+
+	def abort(self):
+		for f in self.files:
+			f.close()
+		for tempFile in self.tempFiles:
+			if os.path.exists(tempFile):
+				os.remove(tempFile)
+
+
+
+# The number of partition writers that keep their files open, each holds two.
+# Records come in trade time order, so a partition of an earlier date is
+# seldom written again once passed, it is suspended, see OpenCloseTradeWriter.
+MAX_OPEN_WRITERS = 32
+
+def writePartitionedTradeRecords(partitionedRecords, grouping, outputDir, broker):
+	"""
+	[Iterable] partitionedRecords, [String] grouping, [String] outputDir,
+		[String] broker => [List] output files
+
+	partitionedRecords: ((portfolio, date), trade record) pairs, sorted by
+	trade time. The records of each (portfolio, date) partition are written
+	to that portfolio and date's trade files, as writeTradeRecords() would
+	given just those records. With grouping 'openclose', all partitions are
+	written at the same time as the records come, in one pass, with at most
+	MAX_OPEN_WRITERS of them holding open files.
+	"""
+	if grouping != 'openclose':
+		partitions = {}
+		for (key, record) in partitionedRecords:
+			partitions.setdefault(key, []).append(record)
+		return list(chain.from_iterable(writeTradeFiles(groupRecords(records, grouping)
+											, outputDir, portfolio, broker, date)
+						for ((portfolio, date), records) in sorted(partitions.items())))
+
+	writers = {}
+	active = OrderedDict()	# writers with open files, least recently used first
+	try:
+		with timedStage('write'):
+			for (key, record) in partitionedRecords:
+				writer = active.get(key)
+				if writer == None:
+					if len(active) >= MAX_OPEN_WRITERS:
+						active.popitem(last=False)[1].suspend()
+					writer = writers.get(key)
+					if writer == None:
+						writer = writers[key] = OpenCloseTradeWriter(outputDir, key[0]
+																, broker, key[1])
+					active[key] = writer
+				else:
+					active.move_to_end(key)
+
+				writer.write(record)
+
+			return list(chain.from_iterable(writers[key].close()
+											for key in sorted(writers)))
+	finally:
+		for writer in writers.values():
+			writer.abort()
+
+
+
+def writePartitionedFiles(writeFile, partitionedRecords, outputDir):
+	"""
+	[Function] writeFile, [Iterable] partitionedRecords, [String] outputDir
+		=> [List] output files
+
+	writeFile: writeCashFile or writePositionFile.
+	partitionedRecords: ((portfolio, date), record) pairs.
+
+	Write a cash or position file for each (portfolio, date) partition.
+	"""
+	partitions = {}
+	for (key, record) in partitionedRecords:
+		partitions.setdefault(key, []).append(record)
+
+	return [writeFile(portfolio, records, outputDir, date)
+				for ((portfolio, date), records) in sorted(partitions.items())]
 
 
 
@@ -56,15 +652,14 @@ def writeTradeFiles(recordGroups, outputDir, portfolio, broker, date):
 
 	No header row is required.
 	"""
-	fields = ['Account', 'BloombergTicker', 'Broker', 'Side', 'Quantity', 
-				'Price', 'TradeDate', 'SettlementDate', 'Commission Code 1',
-				'Commission Amt 1', 'Strategy']
-
 	outputFiles = []
+	toRow = tradeRowEncoder(TRADE_FILE_FIELDS, portfolio, broker)
 	for (index, group) in enumerate(recordGroups):
-		file = createTradeFileName(index, date, outputDir, portfolio)
-		writeCsv(file, [createCsvRow(fields, portfolio, broker, record) for record in group])
-		outputFiles.append(file)
+		with timedStage('write'):
+			file = createTradeFileName(index, date, outputDir, portfolio)
+			writeCsvRows(file, map(toRow, group))
+			outputFiles.append(file)
+			countRows('write', len(group))
 
 	if outputFiles == []:
 		logger.debug('writeTradeFiles(): {0}, {1} no trades were written to ouput'
@@ -108,21 +703,24 @@ def toFileName(dt, portfolio, fileType, suffix=''):
 
 
 
+@lru_cache(maxsize=4096)
 def dateToString(dt):
 	"""
 	[datetime] dt => [String] mm/dd/yy
 
-	This format is required by Bloomberg trade upload
+	This format is required by Bloomberg trade upload. Results are cached,
+	a file has only a handful of distinct dates.
 	"""
 	return str(dt.month) + '/' + str(dt.day) + '/' + str(dt.year)[2:]
 
 
 
+@lru_cache(maxsize=4096)
 def dateToString_yyyymmdd(dt):
 	"""
 	[datetime] dt => [String] yyyy-mm-dd
 
-	This format is required for cash or position file
+	This format is required for cash or position file. Results are cached.
 	"""
 	return str(dt.year) + '-' + str(dt.month) + '-' + str(dt.day)
 
@@ -130,21 +728,37 @@ def dateToString_yyyymmdd(dt):
 
 def createCsvRow(fields, portfolio, broker, record):
 	"""
-	[List] fields, [Dictionary] trade record => [List] String items in a row
+	[List] fields, [TradeRecord] record => [List] String items in a row
 
-	For trade uploaded to Bloomberg
+	For trade uploaded to Bloomberg. To write many records, use
+	tradeRowEncoder() instead.
 	"""
-	def fieldToRow(field):
+	return tradeRowEncoder(fields, portfolio, broker)(record)
+
+
+
+def tradeRowEncoder(fields, portfolio, broker):
+	"""
+	[List] fields, [String] portfolio, [String] broker
+		=> [Function] trade record => [List] String items in a row
+
+	The fields are worked out once into a tuple of accessor functions, so
+	that each row is made without going through the field names again. The
+	trade records are TradeRecord, whose slots are read directly.
+	"""
+	def accessor(field):
 		if field == 'Account':
-			return portfolio
+			return lambda record: portfolio
 		elif field == 'Broker':
-			return broker
+			return lambda record: broker
 		elif field in ['TradeDate', 'SettlementDate']:
-			return dateToString(record[field])
+			getDate = attrgetter(toSlot(field))
+			return lambda record: dateToString(getDate(record))
 		else:
-			return record[field]
+			return attrgetter(toSlot(field))
 
-	return list(map(fieldToRow, fields))
+	accessors = tuple(map(accessor, fields))
+	return lambda record: [f(record) for f in accessors]
 
 
 
@@ -163,15 +777,8 @@ def toOpenCloseGroup(records):
 
 	That's why.
 	"""
-	def openingOrder(record):
-		if record['Side'] in ('Buy', 'Short'):
-			return True
-		else:
-			return False
-
-
 	def buildOpenCloseGroup(groups, record):
-		if openingOrder(record):
+		if isOpeningTrade(record):
 			groups[0].append(record)
 		else:
 			groups[1].append(record)
@@ -180,15 +787,27 @@ def toOpenCloseGroup(records):
 
 
 	# return reduce(buildOpenCloseGroup, records, [[], []])
-	return filter(lambda el: el != []
-				  , reduce(buildOpenCloseGroup, records, [[], []]))
+	with timedStage('group'):
+		groups = reduce(buildOpenCloseGroup, records, [[], []])
+		countRows('group', len(groups[0]) + len(groups[1]))
+
+	return filter(lambda el: el != [], groups)
+
+
 
 
+def isOpeningTrade(record):
+	"""
+	[Dictionary] trade record => [Bool] is it an opening trade (buy, sell
+		short), otherwise it is a closing trade (sell, cover short)
+	"""
+	return record['Side'] in ('Buy', 'Short')
+
 
 
 def toRecordGroups(records):
 	"""
-	[List] records => [List] of [List] records
+	[Iterable] records => [List] of [List] records
 
 	If trades of opposite directions on the same futures contract appear, say 
 	"buy 5 HIX8", followed by "sell 2 HIX8". It is legal but Bloomberg will 
@@ -210,101 +829,90 @@ def toRecordGroups(records):
 	the group, open, close, open, close.
 
 	Then we upload the 4 files one by one, we won't see the box position problem.
+
+	Two trades on the same ticker form a box position as long as they are of
+	different trade types, even if both are on the long side, e.g., "Cover"
+	then "Buy": the "Buy" forms a box position with the existing short position.
+	So within a group, all trades on a ticker have the same side, and the group
+	keeps a ticker -> side index. A trade whose side differs from the index
+	starts a new group, so each trade is placed in constant time.
 	"""
 	recordGroups = []
-	remaining = records
-	
-	while (remaining != []):
-		group, remaining = splitTrades(remaining)
-		recordGroups.append(group)
+	group, sides = [], {}
+	with timedStage('group'):
+		for record in records:
+			ticker, side = record['BloombergTicker'], record['Side']
+			if sides.setdefault(ticker, side) != side:
+				recordGroups.append(group)
+				group, sides = [], {ticker: side}
 
-	return recordGroups
+			group.append(record)
 
+		if group != []:
+			recordGroups.append(group)
 
+		countRows('group', sum(map(len, recordGroups)))
 
-def splitTrades(records):
-	"""
-	[List] records => [List] group, [List] remaining
-	
-	Split the list of records into lists, where in list1 none of the trades
-	form a box position (have same underlying but of different direction).
-	"""
-	group = []
-	for i in range(len(records)):
-		if formBoxPosition(records[i], group):
-			break
-		else:
-			group.append(records[i])
+	return recordGroups
 
-	if formBoxPosition(records[i], group):
-		return group, records[i:]
-	else:	# must be i = len(records) - 1 and no box position
-		return group, []
 
 
+# grouping => function to group trade records into output files
+GROUPINGS = {
+	'openclose': toOpenCloseGroup,
+	'box': toRecordGroups
+}
 
-def formBoxPosition(record, group):
+def groupRecords(records, grouping='openclose'):
 	"""
-	[Dictionary] record, [List] group => [Bool] whether the record forms a 
-		box position with any record in the group
-
-	A box position means two trades of the same ticker, but of different
-	directions. There are two possibilities:
-
-	1. One trade is on the long side (Buy, Cover) and the other is on the
-		short side (Sell, Short).
+	[Iterable] records, [String] grouping => [Iterable] of [List] records
 
-	2. Both trades are on the same side, but of different type. For example,
-		Cover, then Buy.
-
-	If case (1), then obviously it will form a box position by. If in case (2),
-	say it is "Cover" then "Buy", Bloomberg will still complain. Because
-	there is an existing "Short" position, the "Buy" will form a box position
-	with that existing short positions.
-
-	Therefore, when two trades on the same ticker appear, as long as they are
-	of different trade type, a box postion will occur.
+	grouping is either 'openclose' (see toOpenCloseGroup()) or 'box' (see
+	toRecordGroups()).
 	"""
-	for r in group:
-		if record['BloombergTicker'] == r['BloombergTicker'] and record['Side'] != r['Side']:
-			return True
-
-	return False
+	return GROUPINGS[grouping](records)
 
 
 
 def createCsvRows(fields, records, portfolio):
 	"""
-	[List] fields, [List] position or cash records => [List] rows in csv
+	[List] fields, [Iterable] PositionRecord or CashRecord => [Iterable] rows in csv
 	
-	The first row is the headers (fields)
+	The first row is the headers (fields). The fields are worked out once
+	into a tuple of accessor functions, as in tradeRowEncoder().
 	"""
-	def fieldToColumn(field, record):
-		if field == 'Portfolio':
-			return portfolio
+	def investment(record):	# for position record
+		if record.BloombergTicker.endswith(' Equity'):
+			return record.BloombergTicker[:-7]	# strip off ' Equity'
+		else:
+			return record.BloombergTicker
 
-		elif field == 'Investment':	# for position record
-			if record['BloombergTicker'].endswith(' Equity'):
-				return record['BloombergTicker'][:-7]	# strip off ' Equity'
-			else:
-				return record['BloombergTicker']
 
+	def accessor(field):
+		if field == 'Portfolio':
+			return lambda record: portfolio
+		elif field == 'Investment':
+			return investment
 		elif field == 'Balance':	# for cash record
-			return record['Quantity']
-		
+			return attrgetter('Quantity')
 		elif field == 'Date':
-			return dateToString_yyyymmdd(record['Date'])
+			return lambda record: dateToString_yyyymmdd(record.Date)
 		else:
-			return record[field]
+			return attrgetter(field)
 
 
-	def recordToRow(record):
-		return [fieldToColumn(field, record) for field in fields]
+	accessors = tuple(map(accessor, fields))
+	return chain([fields], ([f(record) for f in accessors] for record in records))
 
 
-	rows = [fields]
-	rows.extend([recordToRow(record) for record in records])
-	return rows
+
+def writeCsvRows(file, rows):
+	"""
+	[String] file, [Iterable] rows => write the rows to a csv file, in one
+		writerows() call.
+	"""
+	with open(file, 'w', newline='', buffering=1024*1024) as f:
+		csv.writer(f).writerows(rows)
 
 
 
@@ -324,7 +932,7 @@ def writeCashFile(portfolio, records, outputDir, date):
 	fields = ['Portfolio', 'Date', 'Currency', 'Balance']
 
 	file = join(outputDir, toFileName(date, portfolio, 'cash'))
-	writeCsv(file, createCsvRows(fields, records, portfolio))
+	writeCsvRows(file, createCsvRows(fields, records, portfolio))
 
 	return file
 
@@ -349,6 +957,6 @@ def writePositionFile(portfolio, records, outputDir, date):
 	fields = ['Portfolio', 'Date', 'Investment', 'Currency', 'Quantity']
 
 	file = join(outputDir, toFileName(date, portfolio, 'position'))
-	writeCsv(file, createCsvRows(fields, records, portfolio))
+	writeCsvRows(file, createCsvRows(fields, records, portfolio))
 
 	return file
\ No newline at end of file
@@ -0,0 +1,233 @@
+# coding=utf-8
+#
+# Watch mode of the worker (worker.py --mode watch): stay running and convert
+# IB and HGNH trade files as they land in the input directory, instead of
+# being started by a scheduler and scanning the whole directory each time.
+#
+# Changes are notified by the file system when the watchdog package is
+# installed, otherwise the directory is polled. Either way, a file is
+# converted only after its size and last modified time have settled, so
+# that a partly written file is not read.
+#
+# Results are saved to DB and notified by email, as in production mode.
+#
+
+from IB.configure import getTradeFileDir, getWatchPollInterval, \
+						getWatchSettleSeconds
+from IB.registry import closeConnection, saveResultsToDB
+from IB.worker import isIBTradeFile, isHGNHTradeFile, newerThanDB, \
+						processIBFiles, processHGNHFiles, sendNotification, \
+						lookupDBFiles
+from IB.metrics import exportMetrics
+from functools import partial
+from itertools import chain
+from queue import Queue, Empty
+from os.path import basename
+import os, time, logging
+logger = logging.getLogger(__name__)
+
+
+
+def watch(mapFunc=map):
+	"""
+	[Function] mapFunc => convert trade files in the input directory as they
+		are created or modified, until interrupted.
+
+	mapFunc is either the built-in map or the imap method of a process pool.
+	"""
+	directory = getTradeFileDir()
+	observer, events = startObserver(directory)
+	snapshot, pending = {}, {}
+	logger.info('watch(): watching {0}'.format(directory))
+
+	try:
+		# files that landed while we were not running
+		watchOnce(directory, None, events, snapshot, pending, mapFunc)
+		while True:
+			if observer == None:
+				time.sleep(getWatchPollInterval())
+			watchOnce(directory, observer, events, snapshot, pending, mapFunc)
+
+	except KeyboardInterrupt:
+		logger.info('watch(): stopped')
+
+	finally:
+		if observer != None:
+			observer.stop()
+			observer.join()
+		closeConnection()
+
+
+
+def watchOnce(directory, observer, events, snapshot, pending, mapFunc):
+	"""
+	[String] directory, [Observer] observer, [Queue] events, [Dictionary]
+		snapshot, [Dictionary] pending, [Function] mapFunc => add changed
+		files to pending and convert those that have settled.
+
+	An error, e.g., the input directory on a network share is gone for a
+	while, or the database or mail server is down, is logged and does not
+	stop watching. Files that failed to convert are put back to pending, to
+	be tried again once settled, after waiting a poll interval.
+	"""
+	ready = []
+	try:
+		if observer == None:
+			addPending(pending, changedFiles(snapshot, directoryStats(directory)))
+		else:
+			addPending(pending, drainEvents(events, getWatchPollInterval()))
+
+		ready = settledFiles(pending, directoryStats(directory)
+							, time.monotonic(), getWatchSettleSeconds())
+		if ready != []:
+			convertFiles(ready, mapFunc)
+
+	except Exception:
+		logger.exception('watchOnce(): ')
+		addPending(pending, ready)
+		time.sleep(getWatchPollInterval())
+
+
+
+def convertFiles(files, mapFunc):
+	"""
+	[List] files, [Function] mapFunc => convert those files that have
+		changed since saved in DB, save results and send notification.
+	"""
+	start = time.perf_counter()
+	files = list(filter(partial(newerThanDB, lookupDBFiles(files)), files))
+	results = list(chain(processIBFiles(filter(isIBTradeFile, files), mapFunc)
+						, processHGNHFiles(filter(isHGNHTradeFile, files), mapFunc)))
+	if results != []:
+		logger.info('convertFiles(): {0} files converted'.format(len(results)))
+		saveResultsToDB(getTradeFileDir(), results)
+		sendNotification(results)
+		exportMetrics(results, time.perf_counter() - start)
+
+
+
+def isTradeFile(file):
+	return isIBTradeFile(file) or isHGNHTradeFile(file)
+
+
+
+def addPending(pending, files):
+	"""
+	[Dictionary] pending, [Iterable] files => add the trade files to pending,
+		their state is worked out by settledFiles().
+	"""
+	for file in filter(isTradeFile, files):
+		pending.setdefault(file, None)
+
+
+
+def settledFiles(pending, stats, now, settleSeconds):
+	"""
+	[Dictionary] pending, [Dictionary] stats, [Float] now,
+		[Float] settleSeconds => [List] files ready to convert
+
+	pending: file -> (last seen (size, mtime), time it was first seen so),
+	or None for a file just added.
+
+	stats: file -> (size, mtime) of files in the directory now.
+
+	A file is ready when its (size, mtime) has not changed for settleSeconds,
+	it is then removed from pending. A file no longer in the directory is
+	removed from pending too.
+	"""
+	ready = []
+	for file in list(pending):
+		stat = stats.get(file)
+		if stat == None:
+			del pending[file]
+		elif pending[file] == None or pending[file][0] != stat:
+			pending[file] = (stat, now)
+		elif now - pending[file][1] >= settleSeconds:
+			del pending[file]
+			ready.append(file)
+
+	return sorted(ready)
+
+
+
+def changedFiles(snapshot, stats):
+	"""
+	[Dictionary] snapshot, [Dictionary] stats => [List] files
+
+	Files that are new or whose (size, mtime) differ from the snapshot, the
+	snapshot is then updated to stats.
+	"""
+	changed = [file for (file, stat) in stats.items() if snapshot.get(file) != stat]
+	snapshot.clear()
+	snapshot.update(stats)
+	return changed
+
+
+
+def directoryStats(directory):
+	"""
+	[String] directory => [Dictionary] file -> (size, mtime) of the files in
+		the directory, not including sub directories.
+	"""
+	def stat(entry):
+		s = entry.stat()
+		return entry.name, (s.st_size, s.st_mtime_ns)
+
+	with os.scandir(directory) as entries:
+		return dict(map(stat, filter(lambda e: e.is_file(), entries)))
+
+
+
+def drainEvents(events, timeout):
+	"""
+	[Queue] events, [Float] timeout => [List] file names
+
+	Wait up to timeout seconds for the first event, then take all events in
+	the queue.
+	"""
+	files = []
+	try:
+		files.append(events.get(timeout=timeout))
+		while True:
+			files.append(events.get_nowait())
+	except Empty:
+		pass
+
+	return files
+
+
+
+def startObserver(directory):
+	"""
+	[String] directory => [Observer] observer, [Queue] events
+
+	Start a watchdog observer that puts the names of files created, modified
+	or moved into the directory to the events queue. If watchdog is not
+	installed, return (None, None) and the directory is polled instead.
+	"""
+	try:
+		from watchdog.observers import Observer
+		from watchdog.events import FileSystemEventHandler
+	except ImportError:
+		logger.info('startObserver(): watchdog not installed, poll the directory')
+		return None, None
+
+	events = Queue()
+
+	class Handler(FileSystemEventHandler):
+		def on_created(self, event):
+			if not event.is_directory:
+				events.put(basename(event.src_path))
+
+		def on_modified(self, event):
+			self.on_created(event)
+
+		def on_moved(self, event):
+			if not event.is_directory:
+				events.put(basename(event.dest_path))
+
+
+	observer = Observer()
+	observer.schedule(Handler(), directory, recursive=False)
+	observer.start()
+	return observer, events
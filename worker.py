@@ -9,22 +9,84 @@ from utils.mail import sendMail
 from IB.configure import getTradeFileDir, getTradeOutputDir, getMailSender, \
 						getMailSubject, getMailRecipients, getMailServer, \
 						getMailTimeout
-from IB.mysql import lookupLastModifiedTime, closeConnection, saveResultsToDB
+from IB.registry import lookupFiles, closeConnection, saveResultsToDB, \
+						updateLastModified
 from IB.ib import processTradeFile as processIBTradeFile
-from IB.henghua import processTradeFile as processHGNHTradeFile
+from IB.henghua import processTradeFile as processHGNHTradeFile, \
+						getDateFromFilename
+from IB.ledger import isEnabled as isLedgerEnabled
+from IB.cache import setEnabled as setCacheEnabled
+from IB.metrics import exportMetrics, observe
 from datetime import datetime, timedelta
-from os.path import join, getmtime
+from IB.utility import fileHash, stageTiming, timingsToString
+from os.path import join, getmtime, getsize
 from itertools import chain
+from functools import partial
+from multiprocessing import Pool
+from time import perf_counter
 import logging
 logger = logging.getLogger(__name__)
 
 
 
-def main(mode):
+def main(mode, jobs=1, cache=None):
+	"""
+	[String] mode, [Int] jobs, [Bool] cache => convert the trade files, then 
+		save results to DB and send notification (production mode) or print
+		the results (test mode).
+
+	When jobs > 1, files are converted in a pool of that many processes.
+	Results come back in the same order as converting one by one.
+
+	In watch mode, the program stays running and converts trade files as they
+	land in the input directory, see watcher.py. Results are handled as in
+	production mode.
+
+	cache: whether to use the parsed records cache, None means follow the 
+	config file.
+
+	At the end of a run, metrics are written if enabled, see metrics.py.
+	"""
+	setCacheEnabled(cache)
+	if mode == 'watch':
+		from IB.watcher import watch
+		if jobs > 1:
+			with Pool(jobs, initializer=setCacheEnabled, initargs=(cache,)) as pool:
+				watch(pool.imap)
+		else:
+			watch(map)
+
+	else:
+		start = perf_counter()
+		if jobs > 1:
+			with Pool(jobs, initializer=setCacheEnabled, initargs=(cache,)) as pool:
+				results = list(convertFiles(mode, pool.imap))
+		else:
+			results = list(convertFiles(mode, map))
+
+		handleResults(mode, results)
+		exportMetrics(results, perf_counter() - start)
+
+
+
+def convertFiles(mode, mapFunc):
+	"""
+	[String] mode, [Function] mapFunc => [Iterable] results
+
+	mapFunc is either the built-in map or the imap method of a process pool.
+	"""
+	dbFiles = loadDBFiles(mode)
 	results = []
-	results = chain(results, processIBFiles(getIBTradeFiles(mode)))
-	results = chain(results, processHGNHFiles(getHGNHTradeFiles(mode)))
-	
+	results = chain(results, processIBFiles(getIBTradeFiles(mode, dbFiles), mapFunc))
+	results = chain(results, processHGNHFiles(getHGNHTradeFiles(mode, dbFiles), mapFunc))
+	return results
+
+
+
+def handleResults(mode, results):
+	"""
+	[String] mode, [Iterable] results
+	"""
 	if mode == 'production':
 		results = list(results)	# we need to use it twice
 		saveResultsToDB(getTradeFileDir(), results)
@@ -32,95 +94,154 @@ def main(mode):
 		sendNotification(results)
 
 	else:
-		# This step is necessary, because of the laziness of the iterables,
-		# e.g., filter or map objects, filtering and mapping won't happen
-		# until they are iterated.
 		print(resultsToString(results))
 
 
 
-def processIBFiles(files):
+def processIBFiles(files, mapFunc=map):
 	"""
-	[Iterable] files => [Iterable] results
+	[Iterable] files, [Function] mapFunc => [Iterable] results
 
-	where results is a list of tuple (file, result, source), where
+	where results is a list of tuple (file, result, source, output, timings),
+	where
 	result: 0 for success, 1 for failure.
 	source: 'IB'
+	output: list of output files
+	timings: stage => (seconds, rows), see utility.StageTimer
+	"""
+	return mapFunc(processIBFile, files)
+
+
+
+def processIBFile(file):
+	"""
+	[String] file => [Tuple] result
+
+	A module level function (instead of a closure), so that it can be sent
+	to a worker process.
 	"""
-	def result(file):
-		try:
+	try:
+		with stageTiming() as timer:
 			output = processIBTradeFile(join(getTradeFileDir(), file)
 										, getTradeOutputDir())
-			return (file, 0, 'IB', output)
-		except:
-			logger.exception('processIBFiles(): {0}'.format(file))
-			return (file, 1, 'IB', None)
+		return (file, 0, 'IB', output, timer.timings())
+	except:
+		logger.exception('processIBFile(): {0}'.format(file))
+		return (file, 1, 'IB', None, {})
 
-	
-	return map(result, files)
 
 
+def loadDBFiles(mode):
+	"""
+	[String] mode => [Dictionary] file name -> DB record
 
-def getIBTradeFiles(mode):
+	Load the DB records of all files in the input directory with one database
+	query, so that checking whether a file is newer than the DB does not cost
+	a round trip per file. In test mode, database is not used.
 	"""
-	[String] mode => [Iterable] IB trade files
+	if mode == 'production':
+		return lookupDBFiles(getFiles(getTradeFileDir()))
+	else:
+		return {}
+
+
+
+def lookupDBFiles(files):
 	"""
-	def tradeFile(file):
-		"""
-		[String] file => [Bool] does the file name contains 'trade'
-		"""
-		return 'trade_steven' in file.split('.')
+	[Iterable] files => [Dictionary] file name -> DB record, the lookup
+		latency is recorded in metrics.
+	"""
+	start = perf_counter()
+	dbFiles = lookupFiles(files)
+	observe('ib_worker_db_lookup_seconds', value=perf_counter() - start)
+	return dbFiles
+
 
 
+def getIBTradeFiles(mode, dbFiles={}):
+	"""
+	[String] mode, [Dictionary] dbFiles => [Iterable] IB trade files
+	"""
 	if mode == 'production':
-		return filter(newerThanDB, 
-						filter(tradeFile, 
-							filter(csvFile, getFiles(getTradeFileDir()))))
+		return filter(partial(newerThanDB, dbFiles), 
+						filter(isIBTradeFile, getFiles(getTradeFileDir())))
 	else:
-		return filter(tradeFile, filter(csvFile, getFiles(getTradeFileDir())))
+		return filter(isIBTradeFile, getFiles(getTradeFileDir()))
 
 
 
-def processHGNHFiles(files):
+def isIBTradeFile(file):
 	"""
-	[Iterable] files => [Iterable] results
+	[String] file => [Bool] is it a csv file whose name contains 'trade_steven'
+	"""
+	return csvFile(file) and 'trade_steven' in file.split('.')
 
-	where results is a list of tuple (file, result, source), where
-	result: 0 for success, 1 for failure.
-	source: 'HGNH'
+
+
+def processHGNHFiles(files, mapFunc=map):
 	"""
-	def result(file):
-		try:
-			output = processHGNHTradeFile( join(getTradeFileDir(), file)
-										 , getTradeOutputDir())
-			return (file, 0, 'HGNH', output)
+	[Iterable] files, [Function] mapFunc => [Iterable] results
 
-		except:
-			logger.exception('processHGNHFiles(): {0}'.format(file))
-			return (file, 1, 'HGNH', None)
+	where results is a list of tuple (file, result, source, output, timings),
+	same as processIBFiles().
 
+	When the position ledger is enabled, each file starts from the positions
+	left by the file of the day before, so the files are converted one by one
+	in this process, in date order, see ledger.py.
+	"""
+	if isLedgerEnabled():
+		return map(processHGNHFile, sorted(files, key=fileDateOrder))
+	else:
+		return mapFunc(processHGNHFile, files)
 
-	return map(result, files)
 
 
+def fileDateOrder(file):
+	"""
+	[String] HGNH file => [Tuple] sort key, by the date in the file name. A
+		file without a valid date goes last, it fails in conversion anyway.
+	"""
+	try:
+		return (getDateFromFilename(file), file)
+	except:
+		return (datetime.max, file)
 
-def getHGNHTradeFiles(mode):
+
+
+def processHGNHFile(file):
 	"""
-	[String] mode => [Iterable] HGNH trade files
+	[String] file => [Tuple] result
 	"""
-	def tradeFile(file):
-		"""
-		[String] file => [Bool] does the file name contains 'trade'
-		"""
-		return file.lower().startswith('trade file')
+	try:
+		with stageTiming() as timer:
+			output = processHGNHTradeFile( join(getTradeFileDir(), file)
+										 , getTradeOutputDir())
+		return (file, 0, 'HGNH', output, timer.timings())
+
+	except:
+		logger.exception('processHGNHFile(): {0}'.format(file))
+		return (file, 1, 'HGNH', None, {})
 
 
+
+def getHGNHTradeFiles(mode, dbFiles={}):
+	"""
+	[String] mode, [Dictionary] dbFiles => [Iterable] HGNH trade files
+	"""
 	if mode == 'production':
-		return filter(newerThanDB, 
-						filter(tradeFile, 
-							filter(excelFile, getFiles(getTradeFileDir()))))
+		return filter(partial(newerThanDB, dbFiles), 
+						filter(isHGNHTradeFile, getFiles(getTradeFileDir())))
 	else:
-		return filter(tradeFile, filter(excelFile, getFiles(getTradeFileDir())))
+		return filter(isHGNHTradeFile, getFiles(getTradeFileDir()))
+
+
+
+def isHGNHTradeFile(file):
+	"""
+	[String] file => [Bool] is it an excel file whose name starts with
+		'trade file'
+	"""
+	return excelFile(file) and file.lower().startswith('trade file')
 
 
 
@@ -148,17 +269,41 @@ def excelFile(file):
 
 
 
-def newerThanDB(file):
+def newerThanDB(dbFiles, file):
 	"""
-	[String] file => [Bool] is the file in database
+	[Dictionary] dbFiles, [String] file => [Bool] has the file changed since
+		it was saved in database
+
+	dbFiles is loaded by loadDBFiles() at the start of a run, so no database
+	query happens here.
+
+	If the size differs, the file has changed. If size and last modified
+	time are the same, it has not. Only when the size is the same but the
+	last modified time differs (e.g., the file is copied between shares or
+	time zone shifts) is the file content hashed and compared.
+
+	When the hash is the same, the new last modified time is saved to
+	database, so the file is not hashed again next time.
+
+	For files saved in database before size and hash were kept, compare the
+	last modified time only.
 	"""
-	lastModified = lookupLastModifiedTime(file)
-	if lastModified == None:
+	dbFile = dbFiles.get(file)
+	if dbFile == None:
+		return True
+
+	path = join(getTradeFileDir(), file)
+	lastModified = datetime.fromtimestamp(getmtime(path))
+	if dbFile['size'] == None or dbFile['hash'] == None:
+		return lastModified - dbFile['last_modified'] > timedelta(seconds=1)
+	elif getsize(path) != dbFile['size']:
 		return True
-	elif datetime.fromtimestamp(getmtime(join(getTradeFileDir(), file))) \
-			- lastModified > timedelta(seconds=1):
+	elif abs(lastModified - dbFile['last_modified']) <= timedelta(seconds=1):
+		return False
+	elif fileHash(path) != dbFile['hash']:
 		return True
 	else:
+		updateLastModified(file, lastModified)
 		return False
 
 
@@ -184,14 +329,14 @@ def resultsToString(results):
 	"""
 	[Iterable] results => [String] message
 
-	result is a tuple (file, success, broker, output file)
+	result is a tuple (file, success, broker, output file, timings)
 	"""
 	def outputToString(output):
 		"""
 		[List] output => [String] output
 		"""
 		if output == []:
-			return '\nNo trades'
+			return '\nNo trades\n'
 		else:
 			line = '\n'
 			for f in output:
@@ -204,9 +349,10 @@ def resultsToString(results):
 		"""
 		[Tuple] result => [String] line
 		"""
-		file, success, broker, output = result
+		file, success, broker, output, timings = result
 		if result[1] == 0:
-			return broker + ' : ' + file + ', ' + 'OK' + outputToString(output)
+			return broker + ' : ' + file + ', ' + 'OK' + outputToString(output) \
+					+ 'Timings: ' + timingsToString(timings)
 		else:
 			return broker + ' : ' + file + ', ' + 'fail'
 
@@ -246,8 +392,12 @@ if __name__ == '__main__':
 	import argparse
 	parser = argparse.ArgumentParser()
 	parser.add_argument('--mode', metavar='running mode'
-						, choices=['production', 'test']
+						, choices=['production', 'test', 'watch']
 						, default='test')
+	parser.add_argument('--jobs', metavar='number of processes', type=int
+						, default=1)
+	parser.add_argument('--no-cache', action='store_true'
+						, help='parse input files even if they are in cache')
 	args = parser.parse_args()
 
-	main(args.mode)
\ No newline at end of file
+	main(args.mode, args.jobs, False if args.no_cache else None)
\ No newline at end of file